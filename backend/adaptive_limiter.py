@@ -0,0 +1,215 @@
+"""AI 供應商的自適應並發上限（AIMD）
+
+每個供應商一個 AdaptiveLimiter：請求成功、延遲正常且名額已用滿時緩慢提高
+上限（每滿一輪 +1），遇到 429 / 5xx / 逾時或延遲明顯高於基準時將上限乘以
+backoff 快速降低。同一輪（降低之前就已開始）的請求只會觸發一次降低，
+避免一次尖峰把上限直接降到最低。等待名額的請求依先來後到放行，並記錄
+排隊深度與等待時間。
+
+所有方法都在 AI 事件迴圈（async_runner）上呼叫；stats() 可由任何執行緒讀取。
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# 延遲 EWMA 係數：短期反映目前狀況，長期作為基準
+SHORT_LATENCY_ALPHA = 0.3
+LONG_LATENCY_ALPHA = 0.05
+
+OVERLOAD_MARKERS = ('429', 'rate limit', 'resource_exhausted', 'overloaded',
+                    'unavailable', 'too many requests')
+
+
+def error_status(error):
+    """例外帶有的 HTTP 狀態碼（OpenAI / google-genai / httpx），沒有時回傳 None"""
+    response = getattr(error, 'response', None)
+    for status in (getattr(error, 'status_code', None),
+                   getattr(error, 'code', None),
+                   getattr(response, 'status_code', None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_overload_error(error):
+    """判斷例外是否代表供應商過載（429、5xx、逾時）"""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+
+    message = str(error).lower()
+    return any(marker in message for marker in OVERLOAD_MARKERS)
+
+
+class QueueTimeout(TimeoutError):
+    """等待並發名額超時"""
+
+
+class AdaptiveLimiter:
+    """單一供應商的 AIMD 並發上限與等待佇列"""
+
+    def __init__(self, name, initial_limit, min_limit=1, max_limit=None,
+                 backoff=0.7, latency_tolerance=2.0):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit or initial_limit)
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(
+            min(max(initial_limit, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease_at = 0.0
+        self.latency = None           # 短期延遲 EWMA（秒）
+        self.baseline_latency = None  # 長期延遲 EWMA（秒）
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.increases = 0
+        self.decreases = 0
+        # 排隊統計
+        self.admitted = 0
+        self.timeouts = 0
+        self.peak_waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def limit(self):
+        """目前的整數並發上限"""
+        return int(self._limit)
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        """取得一個並發名額，區塊結束時依結果調整上限
+
+        等待超過 timeout 秒時拋出 QueueTimeout。
+        """
+        await self._wait_for_slot(timeout)
+        started_at = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._release()
+            raise
+        except Exception as e:
+            self._release()
+            self._on_error(started_at, e)
+            raise
+        else:
+            self._release()
+            self._on_success(started_at, time.monotonic() - started_at)
+
+    async def _wait_for_slot(self, timeout):
+        if self.in_flight < self.limit and not self.waiting:
+            self.in_flight += 1
+            self._admit(0.0)
+            return
+
+        queued_at = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.peak_waiting = max(self.peak_waiting, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            self._admit(time.monotonic() - queued_at)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise QueueTimeout(f"等待圖片生成佇列超時 ({timeout} 秒)")
+        except BaseException:
+            # 名額已分配但等待者被取消：歸還名額
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _admit(self, waited):
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        """依先來後到喚醒等待者，直到名額用完"""
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def _on_success(self, started_at, latency):
+        self.successes += 1
+        if self.latency is None:
+            self.latency = self.baseline_latency = latency
+        else:
+            self.latency += SHORT_LATENCY_ALPHA * (latency - self.latency)
+            self.baseline_latency += LONG_LATENCY_ALPHA * \
+                (latency - self.baseline_latency)
+
+        if self.latency > self.baseline_latency * self.latency_tolerance:
+            self._decrease(started_at, f"延遲 {self.latency:.1f}s 高於基準")
+        elif self.in_flight + 1 >= self.limit or self.waiting:
+            # 只有名額用滿時才提高，閒置時上限不會無限制成長
+            self._set_limit(self._limit + 1 / self._limit)
+            self.increases += 1
+
+    def _on_error(self, started_at, error):
+        if is_overload_error(error):
+            self.overloads += 1
+            self._decrease(started_at, f"供應商過載: {error}")
+        else:
+            self.errors += 1
+
+    def _decrease(self, started_at, reason):
+        if started_at < self._last_decrease_at:
+            return  # 同一輪的請求已經降低過
+        self._last_decrease_at = time.monotonic()
+        self.decreases += 1
+        self._set_limit(self._limit * self.backoff, reason)
+
+    def _set_limit(self, value, reason=None):
+        before = self.limit
+        self._limit = min(max(value, self.min_limit), self.max_limit)
+        if self.limit != before:
+            arrow = '📈' if self.limit > before else '📉'
+            suffix = f" ({reason})" if reason else ''
+            print(
+                f"{arrow} {self.name} 並發上限 {before} → {self.limit}{suffix}", flush=True)
+        self._wake_waiters()
+
+    def stats(self):
+        return {
+            'limit': self.limit,
+            'min_limit': self.min_limit,
+            'max_limit': self.max_limit,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'baseline_latency_ms': round(self.baseline_latency * 1000, 1) if self.baseline_latency is not None else None,
+            'successes': self.successes,
+            'overloads': self.overloads,
+            'errors': self.errors,
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'admitted': self.admitted,
+            'timeouts': self.timeouts,
+            'peak_waiting': self.peak_waiting,
+            'mean_wait_ms': round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+        }
@@ -1,24 +1,79 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_migrate import Migrate
+import click
 from config import Config
-from models import db, Gift, Vote
+from models import (db, Gift, Vote, GenerationJob, VOTES_PER_AWARD, bump_change_counter,
+                    get_change_counter, gift_load_options, parse_gift_fields)
 from gemini_service import gemini_service
+from job_queue import job_queue, ACTIVE_JOB_STATUSES, PRIORITY_BACKFILL
+from tasks import run_generation_job, publish_generation_status, estimate_generation_queue
+from events import event_broker, SubscriberLimitReached
+from gift_queries import list_gifts, parse_limit
+from response_cache import response_cache
+from translation_cache import translation_cache, read_translation_csv
+from guess_cache import guess_cache
+from metrics import metrics
+from json_provider import FastJSONProvider
+from voting import cast_vote, VoteError
+from voting_results import compute_voting_results, reconcile_vote_counts
+from datetime import datetime, timedelta
+import hashlib
+import math
 import os
+import random
+import time
+import uuid
 
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = FastJSONProvider(app)
 
 # 初始化擴展
 CORS(app, origins=Config.CORS_ORIGINS)
 db.init_app(app)
 migrate = Migrate(app, db)
+job_queue.init_app(app)
+job_queue.register('generate', run_generation_job)
+job_queue.register('regenerate', run_generation_job)
 
 # 創建資料表 (僅在沒有使用遷移時)
 # with app.app_context():
 #     db.create_all()
 
 
+def cached_json_response(key, build_payload, ttl=None):
+    """回傳快取的 JSON 回應；未命中時呼叫 build_payload 並儲存序列化後的 bytes"""
+    body = response_cache.get(key)
+    if body is None:
+        body = app.json.response(build_payload()).get_data()
+        response_cache.set(key, body, ttl)
+    return app.response_class(body, status=200, mimetype='application/json')
+
+
+def invalidate_cached_responses(event):
+    """依事件清除受影響的快取回應（所有寫入路徑都會發布事件）"""
+    if event.type == 'game-reset':
+        response_cache.clear()
+        return
+
+    response_cache.delete('voting-results')
+    # 禮物快取鍵已包含變更計數器，這裡只是提早釋放本行程中的舊內容
+    if event.type != 'vote-tally-changed':
+        response_cache.delete_prefix('gifts:')
+        if event.gift_id is not None:
+            response_cache.delete_prefix(f'gift:{event.gift_id}:')
+
+
+event_broker.add_listener(invalidate_cached_responses)
+
+
+@app.before_request
+def ensure_job_workers():
+    """第一個請求進來時啟動背景 worker（每個行程各自啟動）"""
+    job_queue.start()
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康檢查端點"""
@@ -56,6 +111,10 @@ def submit_form():
         db.session.commit()
 
         print(f"禮物創建成功，ID: {gift.id}")
+        event_broker.publish('gift-created', {
+            'gift_id': gift.id,
+            'gift': gift.to_dict(include_happiness=False)
+        })
 
         return jsonify({
             'message': '表單提交成功',
@@ -71,63 +130,59 @@ def submit_form():
         return jsonify({'error': error_msg}), 500
 
 
+def _reset_generation_status(gift):
+    """重置生成狀態，由 worker 推進 pending → processing → completed/failed"""
+    gift.image_generation_status = 'pending'
+    gift.image_generation_started_at = None
+    gift.image_generation_completed_at = None
+    gift.image_generation_error = None
+    gift.image_generation_retry_count = 0
+
+
+def _regenerate_retry_after(gift):
+    """同一玩家在 REGENERATE_RATE_WINDOW 秒內的重新生成次數達上限時，回傳需等待的秒數"""
+    window_start = datetime.utcnow() - timedelta(seconds=Config.REGENERATE_RATE_WINDOW)
+    recent = (db.session.query(GenerationJob.created_at)
+              .join(Gift, Gift.id == GenerationJob.gift_id)
+              .filter(Gift.player_name == gift.player_name,
+                      GenerationJob.job_type == 'regenerate',
+                      GenerationJob.created_at >= window_start)
+              .order_by(GenerationJob.created_at.desc())
+              .limit(Config.REGENERATE_RATE_LIMIT)
+              .all())
+    if len(recent) < Config.REGENERATE_RATE_LIMIT:
+        return None
+    # 最早的一次離開時間窗後即可再重新生成
+    oldest = recent[-1][0]
+    return max(1, math.ceil((oldest - window_start).total_seconds()))
+
+
+def _enqueue_generation(gift, job_type, **options):
+    """將禮物加入背景生成佇列，回傳工作與是否為新建立的工作
+
+    生成狀態與工作在同一個交易中寫入，worker 領取工作時狀態已重置，
+    不會被請求執行緒覆寫回 pending。
+    """
+    job, created = job_queue.enqueue(
+        gift.id, job_type, prepare=lambda job: _reset_generation_status(gift), **options)
+    if created:
+        publish_generation_status(gift)
+    return job, created
+
+
 @app.route('/api/generate-gift/<int:gift_id>', methods=['POST'])
 def generate_gift(gift_id):
-    """使用 AI 猜測禮物並生成圖片（含重試機制）"""
-
+    """將禮物加入 AI 生成佇列（立即回傳，由背景 worker 生成圖片）"""
     try:
         gift = Gift.query.get_or_404(gift_id)
+        job, created = _enqueue_generation(gift, 'generate')
 
-        # 記錄開始生成
-        from datetime import datetime
-        gift.image_generation_status = 'processing'
-        gift.image_generation_started_at = datetime.utcnow()
-        gift.image_generation_error = None
-        gift.image_generation_retry_count = 0
-        db.session.commit()
-
-        # 使用 Gemini 猜測禮物
-        ai_guess = gemini_service.guess_gift(
-            gift.appearance,
-            gift.who_likes,
-            gift.usage_time
-        )
-
-        # 生成圖片提示詞
-        image_prompt = gemini_service.generate_gift_image_prompt(
-            ai_guess,
-            gift.appearance,
-            gift.who_likes
-        )
-
-        # 使用 AI 生成圖片並上傳到 MinIO（含自動重試）
-        try:
-            image_url, retry_count = gemini_service.generate_gift_image_with_retry(
-                image_prompt)
-            if not image_url:
-                raise Exception("圖片生成失敗")
-
-            # 更新禮物記錄
-            gift.ai_guess = ai_guess
-            gift.image_url = image_url
-            gift.image_generation_status = 'completed'
-            gift.image_generation_completed_at = datetime.utcnow()
-            gift.image_generation_retry_count = retry_count
-            db.session.commit()
-
-            return jsonify({
-                'message': 'AI 生成成功',
-                'gift': gift.to_dict(),
-                'retry_count': retry_count
-            }), 200
-
-        except Exception as img_error:
-            # 圖片生成失敗，記錄錯誤
-            gift.image_generation_status = 'failed'
-            gift.image_generation_completed_at = datetime.utcnow()
-            gift.image_generation_error = str(img_error)
-            db.session.commit()
-            raise img_error
+        return jsonify({
+            'message': '已加入生成佇列' if created else '禮物已在生成佇列中',
+            'gift_id': gift.id,
+            'job_id': job.id,
+            'status': job.status
+        }), 202
 
     except Exception as e:
         db.session.rollback()
@@ -136,68 +191,106 @@ def generate_gift(gift_id):
 
 @app.route('/api/regenerate/<int:gift_id>', methods=['POST'])
 def regenerate_gift(gift_id):
-    """重新生成禮物圖片（含重試機制）"""
+    """將禮物重新加入 AI 生成佇列（預設沿用先前的猜測，new_guess=true 時重新猜測）"""
     try:
         gift = Gift.query.get_or_404(gift_id)
+        data = request.get_json(silent=True) or {}
+        new_guess = bool(data.get('new_guess')) or request.args.get(
+            'new_guess', '').lower() in ('1', 'true')
+
+        # 已在佇列中時直接回傳該工作；要建立新工作時才檢查重新生成頻率
+        active = GenerationJob.query.filter(
+            GenerationJob.gift_id == gift.id,
+            GenerationJob.status.in_(ACTIVE_JOB_STATUSES)).first()
+        retry_after = None if active else _regenerate_retry_after(gift)
+        if retry_after is not None:
+            response = jsonify({
+                'error': f'重新生成太頻繁，請 {retry_after} 秒後再試',
+                'retry_after': retry_after
+            })
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+
+        job, created = _enqueue_generation(
+            gift, 'regenerate', new_guess=new_guess)
 
-        # 記錄開始生成
-        from datetime import datetime
-        gift.image_generation_status = 'processing'
-        gift.image_generation_started_at = datetime.utcnow()
-        gift.image_generation_error = None
-        gift.image_generation_retry_count = 0
-        db.session.commit()
+        return jsonify({
+            'message': '已加入重新生成佇列' if created else '禮物已在生成佇列中',
+            'gift_id': gift.id,
+            'job_id': job.id,
+            'status': job.status
+        }), 202
 
-        # 重新猜測禮物
-        ai_guess = gemini_service.guess_gift(
-            gift.appearance,
-            gift.who_likes,
-            gift.usage_time
-        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
 
-        # 重新生成圖片
-        image_prompt = gemini_service.generate_gift_image_prompt(
-            ai_guess,
-            gift.appearance,
-            gift.who_likes
-        )
 
+@app.route('/api/admin/generate-batch', methods=['POST'])
+def generate_batch():
+    """批次生成：將待生成的禮物分批，每批以一次 AI 請求猜測，再由 worker 並發生成圖片"""
+    try:
+        data = request.get_json(silent=True) or {}
         try:
-            image_url, retry_count = gemini_service.generate_gift_image_with_retry(
-                image_prompt)
-            if not image_url:
-                raise Exception("圖片生成失敗")
-
-            # 更新記錄
-            gift.ai_guess = ai_guess
-            gift.image_url = image_url
-            gift.image_generation_status = 'completed'
-            gift.image_generation_completed_at = datetime.utcnow()
-            gift.image_generation_retry_count = retry_count
-            db.session.commit()
-
-            return jsonify({
-                'message': '重新生成成功',
-                'gift': gift.to_dict(),
-                'retry_count': retry_count
-            }), 200
-
-        except Exception as img_error:
-            # 圖片生成失敗，記錄錯誤
-            gift.image_generation_status = 'failed'
-            gift.image_generation_completed_at = datetime.utcnow()
-            gift.image_generation_error = str(img_error)
-            db.session.commit()
-            raise img_error
+            chunk_size = int(data.get('chunk_size', Config.GUESS_BATCH_SIZE))
+        except (TypeError, ValueError):
+            chunk_size = 0
+        if chunk_size < 1:
+            return jsonify({'error': '無效的 chunk_size'}), 400
+
+        # 未指定 gift_ids 時處理所有尚未生成的禮物；已在佇列中的禮物略過
+        active_gift_ids = db.session.query(GenerationJob.gift_id).filter(
+            GenerationJob.status.in_(ACTIVE_JOB_STATUSES))
+        query = Gift.query.filter(Gift.id.notin_(active_gift_ids))
+        if data.get('gift_ids'):
+            query = query.filter(Gift.id.in_(data['gift_ids']))
+        else:
+            query = query.filter(Gift.image_generation_status == 'pending')
+        gifts = query.order_by(Gift.id).all()
+
+        batches = []
+        for start in range(0, len(gifts), chunk_size):
+            chunk = gifts[start:start + chunk_size]
+            batch_id = uuid.uuid4().hex
+            chunk_by_id = {gift.id: gift for gift in chunk}
+            # 生成狀態與工作在同一個交易中寫入（見 _enqueue_generation）
+            jobs = job_queue.enqueue_many(
+                list(chunk_by_id), 'generate', batch_id=batch_id,
+                priority=PRIORITY_BACKFILL,
+                prepare=lambda job: _reset_generation_status(chunk_by_id[job.gift_id]))
+            for job in jobs:
+                publish_generation_status(chunk_by_id[job.gift_id])
+            batches.append({
+                'batch_id': batch_id,
+                'gift_ids': [job.gift_id for job in jobs],
+                'job_ids': [job.id for job in jobs]
+            })
+
+        return jsonify({
+            'message': f'已將 {len(gifts)} 個禮物分成 {len(batches)} 批加入生成佇列',
+            'batches': batches,
+            'total': len(gifts)
+        }), 202
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """查詢背景工作狀態"""
+    try:
+        job = GenerationJob.query.get_or_404(job_id)
+        return jsonify({'job': job.to_dict()}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/gift/<int:gift_id>/generation-status', methods=['GET'])
 def get_generation_status(gift_id):
-    """查詢禮物圖片生成狀態"""
+    """查詢禮物圖片生成狀態（排隊中時附上排隊順位與預估時間）"""
     try:
         gift = Gift.query.get_or_404(gift_id)
         queue_info = gemini_service.get_queue_info()
@@ -205,11 +298,12 @@ def get_generation_status(gift_id):
         return jsonify({
             'gift_id': gift.id,
             'status': gift.image_generation_status,
-            'started_at': gift.image_generation_started_at.isoformat() if gift.image_generation_started_at else None,
-            'completed_at': gift.image_generation_completed_at.isoformat() if gift.image_generation_completed_at else None,
+            'started_at': gift.image_generation_started_at,
+            'completed_at': gift.image_generation_completed_at,
             'error': gift.image_generation_error,
             'retry_count': gift.image_generation_retry_count,
-            'queue_info': queue_info
+            'queue_info': queue_info,
+            'queue': estimate_generation_queue(gift.id, queue_info)
         }), 200
 
     except Exception as e:
@@ -223,6 +317,10 @@ def confirm_gift(gift_id):
         gift = Gift.query.get_or_404(gift_id)
         gift.is_confirmed = True
         db.session.commit()
+        event_broker.publish('gift-confirmed', {
+            'gift_id': gift.id,
+            'gift': gift.to_dict(include_happiness=False)
+        })
 
         return jsonify({
             'message': '禮物確認成功',
@@ -234,17 +332,95 @@ def confirm_gift(gift_id):
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """以 Server-Sent Events 推送禮物、生成狀態與投票事件（可用 gift_id 過濾）"""
+    last_event_id = request.headers.get(
+        'Last-Event-ID') or request.args.get('last_event_id')
+    gift_id = request.args.get('gift_id', type=int)
+    try:
+        subscription, backlog, resync = event_broker.subscribe(
+            last_event_id, gift_id)
+    except SubscriberLimitReached as e:
+        # 串流執行緒已用完，請客戶端稍後重新連線，一般 API 請求仍有執行緒可用
+        retry_after = math.ceil(Config.EVENT_STREAM_RETRY_MS / 1000)
+        response = jsonify({'error': str(e), 'retry_after': retry_after})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 503
+
+    # 到期後結束串流，隨機提早避免同時建立的連線一起重新連線
+    lifetime = Config.EVENT_STREAM_MAX_LIFETIME * random.uniform(0.8, 1.0)
+    deadline = time.monotonic() + lifetime
+
+    def generate():
+        try:
+            yield f"retry: {Config.EVENT_STREAM_RETRY_MS}\n\n"
+            if resync:
+                # 無法補送遺漏的事件，請前端重新載入完整資料
+                yield "event: resync\ndata: {}\n\n"
+            for event in backlog:
+                yield event.encode()
+
+            while subscription.active:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = subscription.get(
+                    timeout=min(Config.EVENT_STREAM_HEARTBEAT, remaining))
+                if event is None:
+                    if subscription.closed:
+                        break
+                    yield ": keep-alive\n\n"
+                else:
+                    yield event.encode()
+        finally:
+            event_broker.unsubscribe(subscription)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/gifts', methods=['GET'])
 def get_gifts():
-    """取得所有禮物"""
+    """取得禮物列表（支援 updated_since / cursor 增量查詢、limit 分頁與 ETag）"""
     try:
-        # 返回所有禮物(包含未確認的)
-        gifts = Gift.query.all()
-
-        return jsonify({
-            'gifts': [gift.to_dict() for gift in gifts],
-            'total': len(gifts)
-        }), 200
+        # ETag 由全域變更計數器與查詢參數組成，未變更時不需載入任何禮物
+        version = get_change_counter('gifts')
+        query_key = hashlib.sha1(
+            request.query_string).hexdigest()[:12]
+        etag = f'gifts-{version}-{query_key}'
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            fields = parse_gift_fields(request.args.get('fields'))
+
+            def build_payload():
+                gifts, next_cursor, has_more = list_gifts(
+                    updated_since=request.args.get('updated_since'),
+                    cursor=request.args.get('cursor'),
+                    limit=parse_limit(request.args.get('limit')),
+                    fields=fields)
+
+                # 返回所有禮物(包含未確認的)
+                return {
+                    'gifts': [gift.to_dict(fields=fields) for gift in gifts],
+                    'total': len(gifts),
+                    'next_cursor': next_cursor,
+                    'has_more': has_more
+                }
+
+            # 快取鍵包含變更計數器，其他行程的寫入也會讓舊快取失效
+            response = cached_json_response(
+                f'gifts:{version}:{query_key}', build_payload)
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -252,19 +428,40 @@ def get_gifts():
 
 @app.route('/api/gift/<int:gift_id>', methods=['GET'])
 def get_gift_detail(gift_id):
-    """取得單一禮物詳情（包含幸福理由）"""
+    """取得單一禮物詳情（包含幸福理由，可用 fields 指定欄位）"""
     try:
-        gift = Gift.query.get_or_404(gift_id)
+        fields = parse_gift_fields(request.args.get('fields'))
 
-        # 包含幸福理由
-        return jsonify({
-            'gift': gift.to_dict(include_happiness=True)
-        }), 200
+        def build_payload():
+            gift = (Gift.query.options(*gift_load_options(fields))
+                    .filter_by(id=gift_id).first_or_404())
+
+            # 包含幸福理由
+            return {'gift': gift.to_dict(include_happiness=True, fields=fields)}
+
+        # 快取鍵包含變更計數器：失效前開始建立的舊內容不會再被讀到，
+        # 其他行程的寫入也會讓本行程的快取失效（與 /api/gifts 相同）
+        version = get_change_counter('gifts')
+        return cached_json_response(
+            f"gift:{gift_id}:{version}:{','.join(fields or ())}", build_payload)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/storage/<bucket>/<path:key>', methods=['GET'])
+def get_local_image(bucket, key):
+    """提供本機儲存後端的圖片（STORAGE_BACKEND=local，測試與離線執行用）"""
+    storage = gemini_service.storage
+    if storage is None or storage.name != 'local' or bucket != storage.bucket:
+        return jsonify({'error': '找不到圖片'}), 404
+    # 圖片名稱不重複、內容不會變更，可長期快取
+    return send_from_directory(storage.directory, key, max_age=365 * 24 * 3600)
+
+
 @app.route('/api/exchange', methods=['POST'])
 def exchange_gift():
     """執行禮物交換"""
@@ -286,6 +483,10 @@ def exchange_gift():
         gift.is_exchanged = True
         gift.exchanged_with = exchanger_name
         db.session.commit()
+        event_broker.publish('gift-exchanged', {
+            'gift_id': gift.id,
+            'gift': gift.to_dict(include_happiness=False)
+        })
 
         return jsonify({
             'message': f'交換成功！請與 {gift.player_name} 交換禮物',
@@ -302,10 +503,14 @@ def exchange_gift():
 def reset_game():
     """重置遊戲（開發用）"""
     try:
-        # 刪除所有禮物和投票
+        # 刪除所有禮物、投票和生成工作
         Vote.query.delete()
+        GenerationJob.query.delete()
         Gift.query.delete()
+        # 整批刪除不會觸發 flush 事件，需手動遞增變更計數器
+        bump_change_counter(db.session.connection(), 'gifts')
         db.session.commit()
+        event_broker.publish('game-reset', {})
 
         return jsonify({'message': '遊戲已重置'}), 200
 
@@ -330,48 +535,23 @@ def submit_vote():
         if award_type not in ['creative', 'blessing']:
             return jsonify({'error': '無效的獎項類型'}), 400
 
-        # 檢查禮物是否存在
-        gift = Gift.query.get(gift_id)
-        if not gift:
-            return jsonify({'error': '禮物不存在'}), 404
-
-        # 檢查該投票者對此獎項已投了幾票
-        votes_count = Vote.query.filter_by(
-            voter_fingerprint=voter_fingerprint,
-            award_type=award_type
-        ).count()
-
-        if votes_count >= 3:
-            return jsonify({'error': f'您已用完此獎項的3票'}), 400
-
-        # 檢查是否已對此禮物投過此獎項
-        existing_vote = Vote.query.filter_by(
-            voter_fingerprint=voter_fingerprint,
-            gift_id=gift_id,
-            award_type=award_type
-        ).first()
-
-        if existing_vote:
-            return jsonify({'error': '您已對此禮物投過此獎項'}), 400
-
-        # 創建投票記錄
-        vote = Vote(
-            gift_id=gift_id,
-            award_type=award_type,
-            voter_fingerprint=voter_fingerprint,
-            voter_ip=request.remote_addr
-        )
+        # 單一條件式 INSERT 寫入投票，票數上限與重複投票由資料庫約束把關
+        remaining_votes, tally = cast_vote(
+            gift_id, award_type, voter_fingerprint, request.remote_addr)
+        event_broker.publish('vote-tally-changed', {
+            'gift_id': gift_id,
+            'award_type': award_type,
+            **tally
+        })
 
-        db.session.add(vote)
-        db.session.commit()
-
-        # 返回當前投票狀態
-        remaining_votes = 3 - (votes_count + 1)
         return jsonify({
             'message': '投票成功',
             'remaining_votes': remaining_votes
         }), 200
 
+    except VoteError as e:
+        return jsonify({'error': e.message}), e.status_code
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -399,11 +579,11 @@ def get_voting_status():
         return jsonify({
             'creative': {
                 'voted_gift_ids': creative_votes,
-                'remaining_votes': 3 - len(creative_votes)
+                'remaining_votes': VOTES_PER_AWARD - len(creative_votes)
             },
             'blessing': {
                 'voted_gift_ids': blessing_votes,
-                'remaining_votes': 3 - len(blessing_votes)
+                'remaining_votes': VOTES_PER_AWARD - len(blessing_votes)
             }
         }), 200
 
@@ -415,34 +595,53 @@ def get_voting_status():
 def get_voting_results():
     """獲取投票結果"""
     try:
-        # 獲取所有禮物及其票數
-        gifts = Gift.query.all()
-
-        results = []
-        for gift in gifts:
-            creative_count = Vote.query.filter_by(
-                gift_id=gift.id,
-                award_type='creative'
-            ).count()
-
-            blessing_count = Vote.query.filter_by(
-                gift_id=gift.id,
-                award_type='blessing'
-            ).count()
-
-            gift_data = gift.to_dict(include_happiness=False)
-            gift_data['creative_votes'] = creative_count
-            gift_data['blessing_votes'] = blessing_count
-            results.append(gift_data)
-
-        return jsonify({
-            'gifts': results,
-            'total': len(results)
-        }), 200
+        return cached_json_response('voting-results', compute_voting_results,
+                                    ttl=Config.RESPONSE_CACHE_RESULTS_TTL)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/admin/metrics', methods=['GET'])
+def get_metrics():
+    """取得快取與事件串流的執行指標"""
+    return jsonify({
+        'response_cache': response_cache.stats(),
+        'translation_cache': translation_cache.stats(),
+        'guess_cache': guess_cache.stats(),
+        'image_routing': gemini_service.router.stats(),
+        'timings': metrics.stats(),
+        'events': event_broker.stats()
+    }), 200
+
+
+@app.cli.command('reconcile-votes')
+@click.option('--dry-run', is_flag=True, help='只回報差異，不重建計數')
+def reconcile_votes_command(dry_run):
+    """由 votes 表重建禮物票數計數並回報差異"""
+    drift = reconcile_vote_counts(apply=not dry_run)
+    for item in drift:
+        print(f"禮物 {item['gift_id']} {item['award_type']}: "
+              f"計數 {item['stored']} / 實際 {item['actual']}")
+
+    if not drift:
+        print("✓ 票數計數與投票記錄一致")
+    elif dry_run:
+        print(f"✗ 發現 {len(drift)} 筆差異（未修正）")
+    else:
+        print(f"✓ 已修正 {len(drift)} 筆差異")
+
+
+@app.cli.command('prewarm-translations')
+@click.argument('csv_file', type=click.File(encoding='utf-8-sig'))
+def prewarm_translations_command(csv_file):
+    """由 CSV（中文名稱,英文翻譯）批次預熱禮物名稱翻譯快取"""
+    rows = read_translation_csv(csv_file)
+    count = translation_cache.prewarm(rows)
+    print(f"✓ 已預熱 {count} 筆禮物名稱翻譯")
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 開發用伺服器；正式環境請使用 gunicorn -c gunicorn.conf.py wsgi:app
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', 5000)),
+            debug=Config.DEBUG)
@@ -0,0 +1,58 @@
+"""背景事件迴圈執行緒：讓同步程式呼叫 asyncio 協程
+
+整個行程共用一個在背景執行緒上運作的事件迴圈，所有 AI 供應商與物件儲存的
+網路 I/O 都在這個迴圈上以協程執行；Flask 路由與背景 worker 透過 run()
+提交協程並等待結果（同步介面）。
+"""
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """在背景 daemon 執行緒上執行的 asyncio 事件迴圈（第一次使用時才啟動）"""
+
+    def __init__(self, name='async-io-loop'):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """取得事件迴圈，尚未啟動時啟動背景執行緒"""
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                self._start()
+            return self._loop
+
+    def _start(self):
+        # 延遲到第一次使用才建立，gunicorn fork 後每個行程各自擁有迴圈
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(
+            target=run_loop, name=self.name, daemon=True)
+        self._thread.start()
+        started.wait()
+        self._loop = loop
+
+    def submit(self, coro):
+        """提交協程，回傳 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """同步執行協程並回傳結果（不可在事件迴圈執行緒內呼叫）"""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("不可在事件迴圈執行緒內同步等待協程")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+圖片上傳路徑記憶體測試
+
+同時處理 N 個圖片生成（供應商回應以本機資料模擬，上傳送到不保留內容的
+本機傳輸層），比較每個並發生成增加的峰值 RSS：
+1. gemini-legacy：舊版路徑，圖片轉為 PIL Image，重新編碼為 PNG 後 getvalue()
+2. gemini：直接上傳供應商回傳的 PNG bytes，不重新編碼
+3. openai：base64 文字解碼成 bytes 後上傳（供應商回應本身就是約 1.33 倍圖片大小
+   的 base64 文字，解碼後即釋放）
+
+所有請求的供應商回應同時存在（模擬並發請求幾乎同時完成），
+
+再一起處理與上傳；每種路徑在獨立的子行程執行，峰值 RSS 互不影響。
+
+使用方式:
+    python benchmark_image_memory.py --concurrency 20 --size 1024
+"""
+import argparse
+import asyncio
+import base64
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import httpx
+from PIL import Image
+
+MODES = ('gemini-legacy', 'gemini', 'openai')
+
+
+class DrainTransport(httpx.AsyncBaseTransport):
+    """讀完上傳內容即丟棄的傳輸層（模擬 MinIO，不保留資料）"""
+
+    async def handle_async_request(self, request):
+        async for _ in request.stream:
+            pass
+        # 讓所有並發生成同時持有圖片，量到真正的峰值
+        await asyncio.sleep(0.2)
+        return httpx.Response(200)
+
+
+def make_png(path, size):
+    """產生不易壓縮的 PNG（雜訊），大小接近真實的生成圖片"""
+    image = Image.frombytes('RGB', (size, size), os.urandom(size * size * 3))
+    image.save(path, format='PNG')
+
+
+def rss_peak_mb():
+    # Linux 的 ru_maxrss 單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def provider_image(mode, png):
+    """模擬供應商回應：每個請求各自持有一份回應資料"""
+    if mode == 'gemini-legacy':
+        image = Image.open(BytesIO(png))
+        image.load()
+        return image
+    if mode == 'gemini':
+        return SimpleNamespace(image_bytes=b''.join((png, b'')), mime_type='image/png')
+    return base64.b64encode(png).decode()
+
+
+def extract(mode, response):
+    """各路徑從供應商回應取得要上傳的資料"""
+    if mode == 'gemini-legacy':
+        image_buffer = BytesIO()
+        response.save(image_buffer, format='PNG')
+        return image_buffer.getvalue()
+    if mode == 'gemini':
+        return response.image_bytes
+    return base64.b64decode(response)
+
+
+def run_mode(mode, png_path, concurrency):
+    """子行程：同時處理 concurrency 個生成，輸出峰值 RSS 增量"""
+    from unittest.mock import Mock
+    from gemini_service import GeminiService, detect_image_format
+    from storage import MinioStorage
+
+    with open(png_path, 'rb') as f:
+        png = f.read()
+
+    service = GeminiService()
+    service.storage = MinioStorage(
+        'minio.local', 'minioadmin', 'minioadmin', 'bucket',
+        max_connections=concurrency, transport=DrainTransport())
+    service.storage.client = Mock()
+    service.storage.client.presigned_put_object.return_value = 'http://minio.local/bucket/image'
+
+    async def generate(i):
+        response = await provider_image(mode, png)
+        # 等所有回應都到齊，再開始處理
+        await asyncio.sleep(0.1)
+        image_bytes = extract(mode, response)
+        del response
+        content_type, extension = detect_image_format(image_bytes)
+        return await service._upload_image(f'bench_{i}.{extension}', image_bytes, content_type)
+
+    async def generate_all():
+        return await asyncio.gather(*(generate(i) for i in range(concurrency)))
+
+    baseline = rss_peak_mb()
+    start = time.perf_counter()
+    results = service.runner.run(generate_all())
+    elapsed = time.perf_counter() - start
+    peak = rss_peak_mb()
+    assert all(results), "上傳失敗"
+    print(f"{peak - baseline:.1f} {elapsed:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='圖片上傳路徑記憶體測試')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--size', type=int, default=1024, help='圖片邊長（像素）')
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--png', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.png, args.concurrency)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        png_path = os.path.join(tmp, 'image.png')
+        make_png(png_path, args.size)
+        png_size = os.path.getsize(png_path) / 1024 / 1024
+
+        print(f"同時處理 {args.concurrency} 個生成，圖片 {args.size}x{args.size} "
+              f"PNG ({png_size:.1f} MB)")
+        print("=" * 70)
+        results = {}
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--mode', mode,
+                 '--png', png_path, '--concurrency', str(args.concurrency)],
+                capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)))
+            delta, elapsed = map(float, output.stdout.strip().splitlines()[-1].split())
+            results[mode] = delta
+            print(f"{mode:<15} 峰值 RSS +{delta:8.1f} MB  "
+                  f"每個生成 {delta / args.concurrency:6.2f} MB  耗時 {elapsed:6.2f} 秒")
+        print("=" * 70)
+        saved = results['gemini-legacy'] - results['gemini']
+        print(f"gemini 相較 gemini-legacy: 每個生成節省 "
+              f"{saved / args.concurrency:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+JSON 序列化效能測試
+
+比較 1,000 個禮物的序列化時間：
+1. 舊版路徑：to_dict 逐欄呼叫 isoformat() + Flask 預設 jsonify
+2. 目前路徑：編譯後的 to_dict + FastJSONProvider（orjson）
+3. 目前路徑但未安裝 orjson 時的標準庫 fallback
+
+使用方式:
+    python benchmark_json.py --gifts 1000 --rounds 50
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import json_provider
+from json_provider import FastJSONProvider
+from models import Gift
+
+
+def legacy_to_dict(gift, include_happiness=True):
+    """舊版 Gift.to_dict（逐欄位建立並呼叫 isoformat）"""
+    data = {
+        'id': gift.id,
+        'player_name': gift.player_name,
+        'gift_name': gift.gift_name,
+        'appearance': gift.appearance,
+        'who_likes': gift.who_likes,
+        'usage_time': gift.usage_time,
+        'ai_guess': gift.ai_guess,
+        'image_url': gift.image_url,
+        'is_confirmed': gift.is_confirmed,
+        'is_exchanged': gift.is_exchanged,
+        'exchanged_with': gift.exchanged_with,
+        'created_at': gift.created_at.isoformat() if gift.created_at else None,
+        'image_generation_status': gift.image_generation_status,
+        'image_generation_started_at': gift.image_generation_started_at.isoformat() if gift.image_generation_started_at else None,
+        'image_generation_completed_at': gift.image_generation_completed_at.isoformat() if gift.image_generation_completed_at else None,
+        'image_generation_error': gift.image_generation_error,
+        'image_generation_retry_count': gift.image_generation_retry_count,
+    }
+    if include_happiness:
+        data['happiness_reason'] = gift.happiness_reason
+    return data
+
+
+def make_gifts(count):
+    """建立測試用禮物物件（不寫入資料庫）"""
+    now = datetime.utcnow()
+    return [Gift(
+        id=i,
+        player_name=f'玩家{i}',
+        gift_name='香氛蠟燭',
+        appearance='圓柱形的玻璃罐，裡面是乳白色的蠟，點燃後會散發淡淡的香氣' * 2,
+        who_likes='喜歡放鬆、注重生活品味的人' * 2,
+        usage_time='下班回家想好好休息、泡澡或睡前的時候' * 2,
+        happiness_reason='在忙碌的一天之後，點上蠟燭就能感受到溫暖與平靜' * 2,
+        ai_guess='香氛蠟燭',
+        image_url=f'/gift-images/gift_image_{i}_0.png',
+        image_generation_status='completed',
+        image_generation_started_at=now - timedelta(seconds=30),
+        image_generation_completed_at=now,
+        image_generation_retry_count=0,
+        is_confirmed=True,
+        is_exchanged=False,
+        created_at=now - timedelta(minutes=i),
+    ) for i in range(count)]
+
+
+def measure(name, func, rounds):
+    latencies = []
+    size = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        size = len(func())
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"{name:<22} 平均 {statistics.mean(latencies):8.2f} ms  "
+          f"最小 {min(latencies):8.2f} ms  大小 {size / 1024:8.1f} KB")
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 序列化效能測試')
+    parser.add_argument('--gifts', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    gifts = make_gifts(args.gifts)
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+
+    def legacy_path():
+        payload = {'gifts': [legacy_to_dict(g) for g in gifts],
+                   'total': len(gifts)}
+        return default_provider.response(payload).get_data()
+
+    def fast_path():
+        payload = {'gifts': [g.to_dict() for g in gifts], 'total': len(gifts)}
+        return fast_provider.response(payload).get_data()
+
+    def stdlib_fallback_path():
+        orjson_module = json_provider.orjson
+        json_provider.orjson = None
+        try:
+            return fast_path()
+        finally:
+            json_provider.orjson = orjson_module
+
+    print(f"序列化 {args.gifts} 個禮物，每種路徑 {args.rounds} 次")
+    print(f"orjson: {'已安裝' if json_provider.orjson else '未安裝'}")
+    print("=" * 70)
+    with app.app_context():
+        legacy = measure('legacy (jsonify)', legacy_path, args.rounds)
+        fast = measure('fast provider', fast_path, args.rounds)
+        measure('stdlib fallback', stdlib_fallback_path, args.rounds)
+    print("=" * 70)
+    print(f"加速: {legacy / fast:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
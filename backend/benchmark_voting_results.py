@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+投票結果效能測試
+
+建立 N 個禮物與 M 張投票，比較舊版（每個禮物兩次 COUNT，共 2N+1 次查詢）、單一 GROUP BY 查詢，
+以及目前使用的票數計數欄位（不查 votes 表）的延遲與查詢次數。
+
+使用方式:
+    python benchmark_voting_results.py --gifts 200 --votes 3000
+    BENCH_DATABASE_URL=postgresql://... python benchmark_voting_results.py
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import event
+from models import db, Gift, Vote, VOTES_PER_AWARD
+from voting_results import (AWARD_TYPES, compute_voting_results,
+                            count_votes_by_gift, reconcile_vote_counts)
+
+
+def legacy_voting_results():
+    """舊版實作：Gift.query.all() 後每個禮物各查兩次票數"""
+    results = []
+    for gift in Gift.query.all():
+        gift_data = gift.to_dict(include_happiness=False)
+        for award_type in AWARD_TYPES:
+            gift_data[f'{award_type}_votes'] = Vote.query.filter_by(
+                gift_id=gift.id, award_type=award_type).count()
+        results.append(gift_data)
+    return {'gifts': results, 'total': len(results)}
+
+
+def group_by_voting_results():
+    """單一 GROUP BY 查詢 votes 表統計票數"""
+    counts = count_votes_by_gift()
+    results = []
+    for gift in Gift.query.all():
+        gift_data = gift.to_dict(include_happiness=False)
+        for award_type in AWARD_TYPES:
+            gift_data[f'{award_type}_votes'] = counts.get(
+                gift.id, {}).get(award_type, 0)
+        results.append(gift_data)
+    return {'gifts': results, 'total': len(results)}
+
+
+def create_app(database_url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def seed(num_gifts, num_votes):
+    """建立測試資料"""
+    db.drop_all()
+    db.create_all()
+
+    base_time = datetime.utcnow() - timedelta(hours=1)
+    db.session.bulk_insert_mappings(Gift, [{
+        'player_name': f'玩家{i}',
+        'gift_name': f'禮物{i}',
+        'appearance': '圓形、陶瓷材質' * 5,
+        'who_likes': '喜歡咖啡的上班族' * 5,
+        'usage_time': '早上需要提神的時候' * 5,
+        'happiness_reason': '每天都能感受到溫暖' * 5,
+        'created_at': base_time + timedelta(seconds=i),
+    } for i in range(num_gifts)])
+    db.session.commit()
+
+    # 每位投票者每個獎項投給不同禮物，名額序號 1..VOTES_PER_AWARD
+    gift_ids = [gift_id for (gift_id,) in db.session.query(Gift.id)]
+    votes_per_voter = VOTES_PER_AWARD * len(AWARD_TYPES)
+    db.session.bulk_insert_mappings(Vote, [{
+        'gift_id': gift_id,
+        'award_type': award_type,
+        'voter_fingerprint': f'voter-{voter}',
+        'voter_ip': '127.0.0.1',
+        'slot': slot,
+    } for voter in range(num_votes // votes_per_voter)
+        for award_type in AWARD_TYPES
+        for slot, gift_id in enumerate(
+            random.sample(gift_ids, min(VOTES_PER_AWARD, len(gift_ids))), start=1)])
+    db.session.commit()
+
+    # bulk insert 不會更新計數欄位，由對帳重建
+    reconcile_vote_counts()
+
+
+def measure(name, func, rounds, engine):
+    """執行多次並回報延遲與每次呼叫的查詢數"""
+    query_count = {'n': 0}
+
+    def count_query(*args, **kwargs):
+        query_count['n'] += 1
+
+    event.listen(engine, 'before_cursor_execute', count_query)
+    latencies = []
+    try:
+        for _ in range(rounds):
+            db.session.expire_all()
+            start = time.perf_counter()
+            result = func()
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count_query)
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{name:<12} 平均 {statistics.mean(latencies):8.2f} ms  "
+          f"p95 {p95:8.2f} ms  查詢數/次 {query_count['n'] // rounds}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='投票結果效能測試')
+    parser.add_argument('--gifts', type=int, default=200)
+    parser.add_argument('--votes', type=int, default=3000)
+    parser.add_argument('--rounds', type=int, default=10)
+    args = parser.parse_args()
+
+    database_url = os.getenv('BENCH_DATABASE_URL')
+    if not database_url:
+        db_path = os.path.join(tempfile.mkdtemp(), 'bench_voting.db')
+        database_url = f'sqlite:///{db_path}'
+
+    app = create_app(database_url)
+    with app.app_context():
+        print(f"資料庫: {database_url}")
+        print(f"建立 {args.gifts} 個禮物、{args.votes} 張投票...")
+        seed(args.gifts, args.votes)
+
+        print("=" * 70)
+        legacy = measure('legacy', legacy_voting_results, args.rounds, db.engine)
+        measure('group-by', group_by_voting_results, args.rounds, db.engine)
+        current = measure('counters', compute_voting_results,
+                          args.rounds, db.engine)
+        print("=" * 70)
+
+        # 確認兩種實作的票數一致
+        legacy_counts = {g['id']: (g['creative_votes'], g['blessing_votes'])
+                         for g in legacy['gifts']}
+        current_counts = {g['id']: (g['creative_votes'], g['blessing_votes'])
+                          for g in current['gifts']}
+        if legacy_counts == current_counts:
+            print("✅ 兩種實作票數一致")
+        else:
+            print("❌ 票數不一致!")
+
+
+if __name__ == '__main__':
+    main()
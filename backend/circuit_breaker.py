@@ -0,0 +1,128 @@
+"""AI 供應商的斷路器（closed / open / half-open）
+
+每個供應商一個 CircuitBreaker，以滾動時間窗記錄呼叫結果：
+- closed：正常呼叫；窗內請求數達 min_requests 且錯誤率達 error_rate 時開啟
+- open：不再呼叫該供應商（立即失敗或改用其他供應商），open_seconds 秒後轉為 half-open
+- half-open：只放行一個試探請求，成功則關閉，失敗則重新開啟
+
+所有方法都在 AI 事件迴圈（async_runner）上呼叫；stats() 可由任何執行緒讀取。
+"""
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """供應商斷路器開啟中，暫時不呼叫"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 暫時無法使用，約 {retry_after:.0f} 秒後再試")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """單一供應商的斷路器與錯誤預算"""
+
+    def __init__(self, name, error_rate=0.5, window=60.0, min_requests=5,
+                 open_seconds=30.0):
+        self.name = name
+        self.error_rate = error_rate
+        self.window = window
+        self.min_requests = max(1, min_requests)
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes = deque()  # (時間, 是否失敗)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opens = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self):
+        """距離可以再試的秒數（非 open 狀態時為 0）"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    @property
+    def available(self):
+        """是否可能接受呼叫（不會改變狀態，供選擇供應商使用）"""
+        if self.state == OPEN:
+            return self.retry_after == 0
+        if self.state == HALF_OPEN:
+            return not self._probing
+        return True
+
+    def before_call(self):
+        """呼叫供應商前檢查，不允許呼叫時拋出 CircuitOpenError"""
+        if self.state == OPEN and self.retry_after == 0:
+            self._set_state(HALF_OPEN)
+        if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after or self.open_seconds)
+        if self.state == HALF_OPEN:
+            self._probing = True
+
+    def record_success(self):
+        self._record(False)
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._reset_window()
+            self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        self._record(True)
+        if self.state == HALF_OPEN:
+            self._probing = False
+            self._open(f"試探請求失敗: {error}")
+        elif self.state == CLOSED and len(self._outcomes) >= self.min_requests \
+                and self._failures / len(self._outcomes) >= self.error_rate:
+            self._open(f"錯誤率 {self._failures}/{len(self._outcomes)}")
+
+    def record_cancelled(self):
+        """呼叫被取消（例如對沖落後）：不計入錯誤率，但釋放試探名額"""
+        if self.state == HALF_OPEN:
+            self._probing = False
+
+    def _record(self, failed):
+        now = time.monotonic()
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            _, old_failed = self._outcomes.popleft()
+            self._failures -= old_failed
+
+    def _reset_window(self):
+        self._outcomes.clear()
+        self._failures = 0
+
+    def _open(self, reason):
+        self._opened_at = time.monotonic()
+        self.opens += 1
+        self._set_state(OPEN, reason)
+
+    def _set_state(self, state, reason=None):
+        if state == self.state:
+            return
+        before, self.state = self.state, state
+        icon = {OPEN: '🔴', HALF_OPEN: '🟡', CLOSED: '🟢'}[state]
+        suffix = f" ({reason})" if reason else ''
+        print(f"{icon} {self.name} 斷路器 {before} → {state}{suffix}", flush=True)
+
+    def stats(self):
+        requests = len(self._outcomes)
+        failures = self._failures
+        return {
+            'state': self.state,
+            'retry_after_seconds': round(self.retry_after, 1),
+            'window_requests': requests,
+            'window_failures': failures,
+            'error_rate': round(failures / requests, 3) if requests else 0.0,
+            'opens': self.opens,
+            'rejected': self.rejected,
+        }
@@ -4,6 +4,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def parse_lane_weights(value):
+    """解析 JOB_LANE_WEIGHTS：每個優先順序通道一個正整數權重"""
+    try:
+        weights = tuple(int(w) for w in str(value).split(','))
+    except ValueError:
+        raise ValueError(f"JOB_LANE_WEIGHTS 必須是逗號分隔的整數: {value!r}")
+    if len(weights) != 3 or any(w <= 0 for w in weights):
+        raise ValueError(
+            f"JOB_LANE_WEIGHTS 需要 3 個正整數（第一次生成,重新生成,批次補生成）: {value!r}")
+    return weights
+
+
 class Config:
     """Flask 應用配置"""
 
@@ -35,6 +47,25 @@ class Config:
     MINIO_USE_SSL = os.getenv('MINIO_USE_SSL', 'false').lower() == 'true'
     MINIO_PUBLIC_URL = os.getenv(
         'MINIO_PUBLIC_URL', 'http://192.168.1.103:9000')
+    MINIO_REGION = os.getenv('MINIO_REGION', 'us-east-1')
+    # 超過此大小（bytes）的物件以 multipart 分段並行上傳，每段 STORAGE_PART_SIZE（至少 5 MB）
+    STORAGE_MULTIPART_THRESHOLD = int(
+        os.getenv('STORAGE_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    STORAGE_PART_SIZE = int(os.getenv('STORAGE_PART_SIZE', 5 * 1024 * 1024))
+
+    # 圖片儲存後端: 'minio'（物件儲存）或 'local'（寫入 LOCAL_STORAGE_DIR，測試與離線執行用）
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'minio')
+    LOCAL_STORAGE_DIR = os.getenv('LOCAL_STORAGE_DIR', 'storage')
+
+    # 生成圖片的 WebP 縮圖（邊長像素，逗號分隔；設為空字串停用）
+    THUMBNAIL_SIZES = tuple(
+        int(size) for size in os.getenv('THUMBNAIL_SIZES', '128,256,512').split(',')
+        if size.strip())
+    THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 75))
+    # 產生縮圖的子行程數
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    # 單張原圖產生並上傳縮圖的上限（秒），超過時只保存原圖（生成工作不等待縮圖）
+    THUMBNAIL_TIMEOUT = float(os.getenv('THUMBNAIL_TIMEOUT', 30))
 
     # 上傳檔案設定 (保留以向後相容)
     UPLOAD_FOLDER = 'uploads'
@@ -50,3 +81,110 @@ class Config:
         os.getenv('IMAGE_GENERATION_TIMEOUT', 300))  # 秒
     IMAGE_GENERATION_MAX_RETRIES = int(
         os.getenv('IMAGE_GENERATION_MAX_RETRIES', 2))
+    # 重試等待：decorrelated jitter 指數退避（秒），供應商的 Retry-After 優先
+    IMAGE_RETRY_BASE_DELAY = float(os.getenv('IMAGE_RETRY_BASE_DELAY', 2))
+    IMAGE_RETRY_MAX_DELAY = float(os.getenv('IMAGE_RETRY_MAX_DELAY', 30))
+    # 單張圖片生成的整體期限（含等待並發名額與重試間隔），預設同 IMAGE_GENERATION_TIMEOUT
+    IMAGE_GENERATION_DEADLINE = float(
+        os.getenv('IMAGE_GENERATION_DEADLINE', IMAGE_GENERATION_TIMEOUT))  # 秒
+    # 供應商路由：目前引擎失敗時改用其他已設定金鑰的引擎
+    IMAGE_FAILOVER = os.getenv('IMAGE_FAILOVER', 'true').lower() == 'true'
+    # 對沖請求：主要引擎超過其延遲百分位數仍未回應時，同時向另一個引擎送出請求
+    # （先成功者勝出，另一個請求取消；會增加供應商用量，預設關閉）
+    IMAGE_HEDGE_ENABLED = os.getenv(
+        'IMAGE_HEDGE_ENABLED', 'false').lower() == 'true'
+    IMAGE_HEDGE_PERCENTILE = int(os.getenv('IMAGE_HEDGE_PERCENTILE', 90))
+    # 延遲樣本不足 IMAGE_HEDGE_MIN_SAMPLES 筆時，等待 IMAGE_HEDGE_DEFAULT_DELAY 秒才對沖
+    IMAGE_HEDGE_MIN_SAMPLES = int(os.getenv('IMAGE_HEDGE_MIN_SAMPLES', 20))
+    IMAGE_HEDGE_DEFAULT_DELAY = float(
+        os.getenv('IMAGE_HEDGE_DEFAULT_DELAY', 45))  # 秒
+    # 斷路器：最近 CIRCUIT_BREAKER_WINDOW 秒內至少 CIRCUIT_BREAKER_MIN_REQUESTS 個請求、
+    # 錯誤率達 CIRCUIT_BREAKER_ERROR_RATE 時暫停呼叫該引擎 CIRCUIT_BREAKER_OPEN_SECONDS 秒
+    CIRCUIT_BREAKER_ERROR_RATE = float(
+        os.getenv('CIRCUIT_BREAKER_ERROR_RATE', 0.5))
+    CIRCUIT_BREAKER_WINDOW = float(
+        os.getenv('CIRCUIT_BREAKER_WINDOW', 60))  # 秒
+    CIRCUIT_BREAKER_MIN_REQUESTS = int(
+        os.getenv('CIRCUIT_BREAKER_MIN_REQUESTS', 5))
+    CIRCUIT_BREAKER_OPEN_SECONDS = float(
+        os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', 30))
+    # 各引擎的初始並發上限
+    OPENAI_IMAGE_CONCURRENCY = int(
+        os.getenv('OPENAI_IMAGE_CONCURRENCY', MAX_CONCURRENT_IMAGE_GENERATION))
+    GEMINI_IMAGE_CONCURRENCY = int(
+        os.getenv('GEMINI_IMAGE_CONCURRENCY', MAX_CONCURRENT_IMAGE_GENERATION))
+    # 自適應並發上限（AIMD）：上述為初始值，
+    # 依供應商的延遲與 429/5xx 在 MIN..MAX 之間自動調整（MIN = MAX 即為固定上限）
+    IMAGE_CONCURRENCY_MIN = int(os.getenv('IMAGE_CONCURRENCY_MIN', 1))
+    IMAGE_CONCURRENCY_MAX = int(
+        os.getenv('IMAGE_CONCURRENCY_MAX', MAX_CONCURRENT_IMAGE_GENERATION * 4))
+    # 過載時上限乘以此係數
+    IMAGE_CONCURRENCY_BACKOFF = float(
+        os.getenv('IMAGE_CONCURRENCY_BACKOFF', 0.7))
+    # 近期延遲超過長期基準的倍數時視為壅塞
+    IMAGE_LATENCY_TOLERANCE = float(os.getenv('IMAGE_LATENCY_TOLERANCE', 2.0))
+    # AI 供應商的非同步 HTTP 連線數上限
+    AI_HTTP_MAX_CONNECTIONS = int(os.getenv('AI_HTTP_MAX_CONNECTIONS', 100))
+    # 物件上傳的連線池大小：預設為並發上限 × (原圖 + 各尺寸縮圖)，
+    # 所有並發生成同時上傳時不需等待連線，閒置連線保持 keep-alive 重複使用
+    STORAGE_MAX_CONNECTIONS = int(os.getenv(
+        'STORAGE_MAX_CONNECTIONS', IMAGE_CONCURRENCY_MAX * (1 + len(THUMBNAIL_SIZES))))
+
+    # 背景工作佇列設定
+    # 佇列代理: 'inprocess'（行程內佇列）或 'database'（輪詢 generation_jobs 資料表，可跨行程）
+    JOB_BROKER = os.getenv('JOB_BROKER', 'inprocess')
+    # worker 執行緒只執行猜測、提示詞等同步階段，圖片生成交給事件迴圈後即領取下一個工作
+    JOB_WORKER_COUNT = int(os.getenv('JOB_WORKER_COUNT', 4))
+    # 同時執行中的工作數上限（含等待事件迴圈的工作），預設與並發上限的最大值相同，
+    # 自適應上限提高時才有工作可用
+    JOB_MAX_IN_FLIGHT = int(
+        os.getenv('JOB_MAX_IN_FLIGHT', IMAGE_CONCURRENCY_MAX))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))  # 秒
+    # 執行中工作的租約：worker 每 1/3 租約時間續約一次，行程當掉後租約過期的
+    # processing 工作會被改回 pending 重新執行
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 60))  # 秒
+    # 優先順序通道權重（第一次生成,重新生成,批次補生成）：各通道都有工作時依權重分配 worker
+    JOB_LANE_WEIGHTS = parse_lane_weights(os.getenv('JOB_LANE_WEIGHTS', '6,3,1'))
+    # 同一玩家在 REGENERATE_RATE_WINDOW 秒內最多重新生成幾次
+    REGENERATE_RATE_LIMIT = int(os.getenv('REGENERATE_RATE_LIMIT', 3))
+    REGENERATE_RATE_WINDOW = int(
+        os.getenv('REGENERATE_RATE_WINDOW', 600))  # 秒
+    # 預估排隊時間：以最近 N 個完成工作的平均處理時間計算，尚無紀錄時使用預設值
+    JOB_SERVICE_TIME_WINDOW = int(os.getenv('JOB_SERVICE_TIME_WINDOW', 20))
+    JOB_DEFAULT_SERVICE_TIME = float(
+        os.getenv('JOB_DEFAULT_SERVICE_TIME', 30))  # 秒
+
+    # Server-Sent Events 設定
+    EVENT_STREAM_HEARTBEAT = int(os.getenv('EVENT_STREAM_HEARTBEAT', 15))  # 秒
+    EVENT_STREAM_RETRY_MS = int(os.getenv('EVENT_STREAM_RETRY_MS', 3000))  # 毫秒
+    # 每個 SSE 串流佔用一個 gthread 執行緒：同時連線數超過上限時回傳 503 與 Retry-After，
+    # 避免串流佔滿執行緒讓一般 API 請求卡住（gunicorn.conf.py 依保留的串流執行緒數設定）
+    EVENT_STREAM_MAX_SUBSCRIBERS = int(os.getenv('EVENT_STREAM_MAX_SUBSCRIBERS', 64))
+    # 串流最長存活時間，到期（加上最多 20% 的隨機提早）後結束，客戶端以 Last-Event-ID 重新連線，
+    # 讓排隊中被拒絕的客戶端有機會取得名額
+    EVENT_STREAM_MAX_LIFETIME = int(os.getenv('EVENT_STREAM_MAX_LIFETIME', 300))  # 秒
+
+    # API 回應快取設定
+    # 快取後端: 'memory'（行程內 LRU）或 'redis'（多行程共用）
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_REDIS_URL = os.getenv(
+        'RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    RESPONSE_CACHE_MAX_ENTRIES = int(
+        os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 30))  # 秒
+    # 投票結果變動頻繁，使用較短的 TTL
+    RESPONSE_CACHE_RESULTS_TTL = int(
+        os.getenv('RESPONSE_CACHE_RESULTS_TTL', 5))  # 秒
+
+    # 批次生成：每次 AI 請求猜測的禮物數量
+    GUESS_BATCH_SIZE = int(os.getenv('GUESS_BATCH_SIZE', 10))
+
+    # 禮物名稱翻譯快取（行程內 LRU，資料表 gift_name_translations 為持久層）
+    TRANSLATION_CACHE_MAX_ENTRIES = int(
+        os.getenv('TRANSLATION_CACHE_MAX_ENTRIES', 2048))
+
+    # 正式環境部署設定（gunicorn.conf.py）
+    DEBUG = os.getenv('FLASK_DEBUG', 'false').lower() == 'true'
+    # 關閉時等待執行中圖片生成工作完成的秒數，逾時的工作會改回 pending
+    GRACEFUL_SHUTDOWN_TIMEOUT = int(
+        os.getenv('GRACEFUL_SHUTDOWN_TIMEOUT', 120))  # 秒
@@ -0,0 +1,163 @@
+"""行程內事件發布/訂閱，供 /api/events 以 Server-Sent Events 推送給前端
+
+每個事件帶有 `<啟動ID>-<序號>` 格式的 ID，並保留最近的事件以支援
+Last-Event-ID 斷線續傳；啟動 ID 不同或事件已被淘汰時送出 `resync`
+事件，讓前端重新載入完整資料。同時訂閱數有上限（每個串流佔用一個
+執行緒），超過時 subscribe() 拋出 SubscriberLimitReached。
+"""
+import queue
+import threading
+import uuid
+from collections import deque
+from config import Config
+from json_provider import dumps
+
+EVENT_HISTORY_SIZE = 1000
+SUBSCRIBER_QUEUE_SIZE = 500
+
+
+class Event:
+    """單一事件"""
+
+    def __init__(self, event_id, seq, event_type, data):
+        self.id = event_id
+        self.seq = seq
+        self.type = event_type
+        self.data = data
+        self.gift_id = data.get('gift_id')
+
+    def encode(self):
+        """轉為 SSE 文字格式"""
+        payload = dumps(self.data)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+
+class SubscriberLimitReached(Exception):
+    """同時訂閱數已達上限"""
+
+
+class Subscription:
+    """單一 SSE 連線的事件佇列"""
+
+    def __init__(self, gift_id=None):
+        self.gift_id = gift_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+        self.closed = False
+
+    @property
+    def active(self):
+        return not (self.overflowed or self.closed)
+
+    def wants(self, event):
+        return self.gift_id is None or event.gift_id in (None, self.gift_id)
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # 客戶端跟不上，結束連線讓它以 Last-Event-ID 重新連線
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """結束串流（喚醒正在等待的連線）"""
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class EventBroker:
+    """單一行程內的事件 fan-out"""
+
+    def __init__(self, history_size=EVENT_HISTORY_SIZE, max_subscribers=None):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.max_subscribers = (Config.EVENT_STREAM_MAX_SUBSCRIBERS
+                                if max_subscribers is None else max_subscribers)
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """註冊同步回呼，每個事件發布時呼叫 callback(event)"""
+        self._listeners.append(callback)
+
+    def publish(self, event_type, data):
+        """發布事件給所有訂閱者"""
+        with self._lock:
+            self._seq += 1
+            event = Event(f"{self.boot_id}-{self._seq}",
+                          self._seq, event_type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"✗ 事件回呼失敗 ({event.type}): {e}", flush=True)
+
+        for subscription in subscribers:
+            if subscription.wants(event):
+                subscription.offer(event)
+        return event
+
+    def subscribe(self, last_event_id=None, gift_id=None):
+        """建立訂閱，回傳 (訂閱, 需補送的事件, 是否需要重新同步)"""
+        subscription = Subscription(gift_id)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.rejected += 1
+                raise SubscriberLimitReached(
+                    f"同時連線數已達上限 {self.max_subscribers}")
+            backlog, resync = self._replay(last_event_id)
+            self._subscribers.add(subscription)
+        return subscription, [e for e in backlog if subscription.wants(e)], resync
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """行程關閉前結束所有 SSE 連線，讓客戶端以 Last-Event-ID 重新連線"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.close()
+
+    def _replay(self, last_event_id):
+        """找出 last_event_id 之後的事件（需持有鎖）"""
+        if not last_event_id:
+            return [], False
+
+        boot_id, _, seq = last_event_id.partition('-')
+        if boot_id != self.boot_id or not seq.isdigit():
+            return [], True
+
+        seq = int(seq)
+        oldest_seq = self._history[0].seq if self._history else self._seq + 1
+        if seq + 1 < oldest_seq:
+            return [], True
+        return [e for e in self._history if e.seq > seq], False
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'max_subscribers': self.max_subscribers,
+                'rejected': self.rejected,
+                'last_event_id': f"{self.boot_id}-{self._seq}",
+            }
+
+
+event_broker = EventBroker()
@@ -1,20 +1,56 @@
+import asyncio
+import base64
+import json
 import os
+import re
 import time
-import requests
-import threading
-from io import BytesIO
-from pathlib import Path
+import uuid
+from contextlib import asynccontextmanager
+import httpx
 import google.generativeai as genai
-from openai import OpenAI
-from minio import Minio
+from openai import AsyncOpenAI, BadRequestError
+from adaptive_limiter import AdaptiveLimiter, QueueTimeout
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from async_runner import EventLoopThread
+from provider_router import ProviderRouter
+from thumbnails import ThumbnailPipeline
+from storage import create_storage
+from retry_policy import (RetryPolicy, TerminalError, SafetyFilterError,
+                          is_safety_block, is_terminal_error)
 from config import Config
+from metrics import metrics
+from translation_cache import translation_cache
+
+# 猜測提示詞版本：修改提示詞時遞增，讓先前快取的猜測失效
+GUESS_PROMPT_VERSION = 2
+
+# 支援的圖片引擎（failover 時依此順序嘗試其他引擎）
+IMAGE_ENGINES = ('openai', 'gemini')
+
+# 圖片檔頭與對應的 Content-Type / 副檔名（WebP 另以 RIFF....WEBP 判斷）
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png', 'png'),
+    (b'\xff\xd8\xff', 'image/jpeg', 'jpg'),
+)
+
+# 結構化猜測回應的欄位長度上限
+MAX_GUESS_LENGTH = 20
+MAX_SUBJECT_LENGTH = 80
 
 
 class GeminiService:
-    """AI 服務類（Gemini 用於文字，OpenAI 用於圖片，MinIO 用於儲存）"""
+    """AI 服務類（Gemini 用於文字，OpenAI 用於圖片，MinIO 或本機目錄用於儲存）
+
+    對外網路 I/O 都以非同步客戶端在背景事件迴圈（self.runner）上執行，
+    同一行程可同時維持大量進行中的請求；公開方法維持同步介面，
+    *_async 方法可供協程直接使用。
+    """
 
     def __init__(self):
-        """初始化 AI APIs 和 MinIO"""
+        """初始化 AI APIs 和圖片儲存"""
+        # 所有供應商呼叫共用的背景事件迴圈
+        self.runner = EventLoopThread('ai-provider-loop')
+
         # Gemini 用於文字生成
         gemini_key = Config.GEMINI_API_KEY
         if gemini_key:
@@ -30,7 +66,10 @@ class GeminiService:
         openai_key = Config.OPENAI_API_KEY
         if openai_key:
             os.environ['OPENAI_API_KEY'] = openai_key
-            self.openai_client = OpenAI()
+            self.openai_client = AsyncOpenAI(
+                http_client=httpx.AsyncClient(
+                    timeout=httpx.Timeout(Config.IMAGE_GENERATION_TIMEOUT, connect=10.0),
+                    limits=httpx.Limits(max_connections=Config.AI_HTTP_MAX_CONNECTIONS)))
         else:
             self.openai_client = None
 
@@ -46,33 +85,76 @@ class GeminiService:
         else:
             self.genai_imagen_client = None
 
-        # MinIO 客戶端
+        # 圖片儲存（MinIO 或本機目錄）；bucket 在第一次上傳時才確認，不在啟動時連線
         try:
-            self.minio_client = Minio(
-                Config.MINIO_ENDPOINT,
-                access_key=Config.MINIO_ACCESS_KEY,
-                secret_key=Config.MINIO_SECRET_KEY,
-                secure=Config.MINIO_USE_SSL
-            )
-            self.minio_bucket = Config.MINIO_BUCKET
-            print(
-                f"MinIO client initialized: {Config.MINIO_ENDPOINT}/{self.minio_bucket}", flush=True)
-
-            # 確認 bucket 存在
-            if not self.minio_client.bucket_exists(self.minio_bucket):
-                print(
-                    f"Warning: Bucket {self.minio_bucket} does not exist", flush=True)
+            self.storage = create_storage()
+            print(f"Storage initialized: {self.storage.name} "
+                  f"{self.storage.location}/{self.storage.bucket}", flush=True)
         except Exception as e:
-            print(f"Error initializing MinIO: {e}", flush=True)
-            self.minio_client = None
-
-        # 並發控制：Semaphore 限制同時最多 N 個 Imagen API 請求
-        self.imagen_semaphore = threading.Semaphore(
-            Config.MAX_CONCURRENT_IMAGE_GENERATION)
-        self.active_count = 0
-        self.queue_lock = threading.Lock()
+            print(f"Error initializing storage: {e}", flush=True)
+            self.storage = None
+
+        # 並發控制：每個供應商一個自適應上限（AIMD），依延遲與 429/5xx 自動調整
+        # （等待中的請求只是事件迴圈上的協程，不佔用執行緒）
+        self.limiters = {
+            'openai': self._create_limiter('openai', Config.OPENAI_IMAGE_CONCURRENCY),
+            'gemini': self._create_limiter('gemini', Config.GEMINI_IMAGE_CONCURRENCY),
+        }
+        # 斷路器：供應商持續失敗時暫停呼叫，改用其他引擎或立即失敗
+        self.breakers = {engine: self._create_breaker(engine)
+                         for engine in IMAGE_ENGINES}
+        # 縮圖：原圖上傳後在 process pool 產生 WebP 縮圖並上傳到原圖旁邊
+        self.thumbnails = ThumbnailPipeline(
+            lambda filename, data, content_type: self._upload_image(
+                filename, data, content_type),
+            sizes=Config.THUMBNAIL_SIZES,
+            quality=Config.THUMBNAIL_QUALITY,
+            workers=Config.THUMBNAIL_WORKERS,
+            timeout=Config.THUMBNAIL_TIMEOUT)
+        # 重試策略：jitter 指數退避、不可重試錯誤立即失敗、整體期限
+        self.retry_policy = RetryPolicy(
+            Config.IMAGE_GENERATION_MAX_RETRIES,
+            base_delay=Config.IMAGE_RETRY_BASE_DELAY,
+            max_delay=Config.IMAGE_RETRY_MAX_DELAY,
+            deadline=Config.IMAGE_GENERATION_DEADLINE)
+        # 供應商路由：失敗時改用其他引擎，啟用對沖時主要引擎過慢會同時送出第二個請求
+        self.router = ProviderRouter(
+            self._generate_on,
+            hedge_enabled=Config.IMAGE_HEDGE_ENABLED,
+            hedge_percentile=Config.IMAGE_HEDGE_PERCENTILE,
+            hedge_min_samples=Config.IMAGE_HEDGE_MIN_SAMPLES,
+            hedge_default_delay=Config.IMAGE_HEDGE_DEFAULT_DELAY)
         print(
-            f"Image generation concurrency limit: {Config.MAX_CONCURRENT_IMAGE_GENERATION}", flush=True)
+            f"Image generation concurrency limit: openai={Config.OPENAI_IMAGE_CONCURRENCY}, "
+            f"gemini={Config.GEMINI_IMAGE_CONCURRENCY} "
+            f"(adaptive {Config.IMAGE_CONCURRENCY_MIN}-{Config.IMAGE_CONCURRENCY_MAX})", flush=True)
+
+    @staticmethod
+    def _create_limiter(engine, initial_limit):
+        return AdaptiveLimiter(
+            engine,
+            initial_limit=initial_limit,
+            min_limit=Config.IMAGE_CONCURRENCY_MIN,
+            max_limit=Config.IMAGE_CONCURRENCY_MAX,
+            backoff=Config.IMAGE_CONCURRENCY_BACKOFF,
+            latency_tolerance=Config.IMAGE_LATENCY_TOLERANCE)
+
+    @staticmethod
+    def _create_breaker(engine):
+        return CircuitBreaker(
+            engine,
+            error_rate=Config.CIRCUIT_BREAKER_ERROR_RATE,
+            window=Config.CIRCUIT_BREAKER_WINDOW,
+            min_requests=Config.CIRCUIT_BREAKER_MIN_REQUESTS,
+            open_seconds=Config.CIRCUIT_BREAKER_OPEN_SECONDS)
+
+    def _generate_text(self, prompt):
+        """呼叫 Gemini 文字模型（同步介面）"""
+        return self.runner.run(self._generate_text_async(prompt))
+
+    async def _generate_text_async(self, prompt):
+        """以非同步 API 呼叫 Gemini 文字模型"""
+        return await self.model.generate_content_async(prompt)
 
     def guess_gift(self, appearance, who_likes, usage_time):
         """根據描述猜測禮物"""
@@ -90,7 +172,8 @@ class GeminiService:
         """
 
         try:
-            response = self.model.generate_content(prompt)
+            with metrics.timer('llm.guess'):
+                response = self._generate_text(prompt)
             guess = response.text.strip()
             return guess
         except Exception as e:
@@ -98,22 +181,121 @@ class GeminiService:
             print(f"✗ {error_msg}", flush=True)
             raise Exception(error_msg)
 
-    def generate_gift_image_prompt(self, gift_name, appearance, who_likes):
-        """使用固定模板生成圖片描述提示詞"""
-        # 如果是中文禮物名稱，用 AI 快速翻譯成英文
-        if self.model and any('\u4e00' <= char <= '\u9fff' for char in gift_name):
-            try:
-                translate_response = self.model.generate_content(
+    def guess_gift_with_translation(self, appearance, who_likes, usage_time):
+        """一次呼叫同時取得中文猜測與英文圖片主題，回傳 (猜測, 英文名稱)
+
+        回應須為符合格式的 JSON；解析或驗證失敗時改用 guess_gift 兩段式流程，
+        此時英文名稱為 None，由 generate_gift_image_prompt 另外翻譯。
+        連線、逾時或伺服器錯誤不改用兩段式流程（再呼叫兩次只會更慢），直接拋出由呼叫端處理。
+        """
+        if not self.model:
+            raise Exception("Gemini API 未初始化，請設定 GEMINI_API_KEY 環境變數")
+
+        prompt = f"""
+        請根據以下線索猜測這是什麼禮物：
+
+        1. 這個禮物的外型或材質：{appearance}
+        2. 這個禮物通常是什麼人會喜歡的：{who_likes}
+        3. 這個禮物通常是在什麼時候使用：{usage_time}
+
+        只回答一個 JSON 物件，不要其他內容，格式如下：
+        {{"guess": "禮物名稱（中文，不超過10個字）", "english": "禮物名稱的英文單詞或短語"}}
+
+        例如：{{"guess": "香氛蠟燭", "english": "scented candle"}}
+        """
+
+        try:
+            with metrics.timer('llm.guess_translate'):
+                response = self._generate_text(prompt)
+        except Exception as e:
+            error_msg = f"Gemini API 猜測禮物失敗: {str(e)}"
+            print(f"✗ {error_msg}", flush=True)
+            raise Exception(error_msg)
+
+        try:
+            # 回應被安全過濾時 response.text 同樣拋出 ValueError
+            guess, gift_name_en = parse_guess_response(response.text)
+        except ValueError as e:
+            print(
+                f"Structured guess invalid, falling back to two calls: {e}", flush=True)
+            metrics.increment('guess_translate_fallback')
+            return self.guess_gift(appearance, who_likes, usage_time), None
+
+        print(f"Guessed gift: {guess} ({gift_name_en})", flush=True)
+        return guess, gift_name_en
+
+    def translate_gift_name(self, gift_name):
+        """將中文禮物名稱翻譯成英文（先查翻譯快取，未命中才呼叫 Gemini）"""
+        if not any('\u4e00' <= char <= '\u9fff' for char in gift_name):
+            return gift_name
+
+        cached = translation_cache.get(gift_name)
+        if cached:
+            print(
+                f"Translated gift name (cached): {gift_name} -> {cached}", flush=True)
+            return cached
+
+        if not self.model:
+            return gift_name
+
+        try:
+            with metrics.timer('llm.translate'):
+                translate_response = self._generate_text(
                     f"請將「{gift_name}」翻譯成英文，只回答英文單詞或短語，不要其他內容。"
                 )
-                gift_name_en = translate_response.text.strip().strip('"\'')
-                print(
-                    f"Translated gift name: {gift_name} -> {gift_name_en}", flush=True)
-            except Exception as e:
-                print(f"Translation failed, using original: {e}", flush=True)
-                gift_name_en = gift_name
-        else:
-            gift_name_en = gift_name
+            gift_name_en = translate_response.text.strip().strip('"\'')
+            print(
+                f"Translated gift name: {gift_name} -> {gift_name_en}", flush=True)
+        except Exception as e:
+            print(f"Translation failed, using original: {e}", flush=True)
+            return gift_name
+
+        if gift_name_en:
+            translation_cache.set(gift_name, gift_name_en)
+            return gift_name_en
+        return gift_name
+
+    def guess_gifts_batch(self, clues):
+        """一次呼叫猜測多個禮物
+
+        clues 為 [(外型, 誰會喜歡, 使用時機), ...]，回傳與 clues 等長的列表，
+        每項為 (猜測, 英文名稱)，回應中缺少或格式不符的項目為 None。
+        """
+        if not self.model:
+            raise Exception("Gemini API 未初始化，請設定 GEMINI_API_KEY 環境變數")
+        if not clues:
+            return []
+
+        items = "\n".join(
+            f"        {i}. 外型或材質：{appearance}；什麼人會喜歡：{who_likes}；什麼時候使用：{usage_time}"
+            for i, (appearance, who_likes, usage_time) in enumerate(clues, start=1))
+        prompt = f"""
+        以下每一行是一個禮物的線索，請分別猜測每個禮物是什麼：
+
+{items}
+
+        只回答一個 JSON 陣列，不要其他內容，每個禮物一個物件，id 為上面的編號：
+        [{{"id": 1, "guess": "禮物名稱（中文，不超過10個字）", "english": "禮物名稱的英文單詞或短語"}}]
+        """
+
+        try:
+            with metrics.timer('llm.guess_batch'):
+                response = self._generate_text(prompt)
+            results = parse_batch_guess_response(response.text, len(clues))
+        except Exception as e:
+            error_msg = f"Gemini API 批次猜測禮物失敗: {str(e)}"
+            print(f"✗ {error_msg}", flush=True)
+            raise Exception(error_msg)
+
+        metrics.increment('guess_batch_items', len(clues))
+        print(
+            f"Batch guessed {len(results)}/{len(clues)} gifts in one request", flush=True)
+        return [results.get(i) for i in range(1, len(clues) + 1)]
+
+    def generate_gift_image_prompt(self, gift_name, appearance, who_likes):
+        """使用固定模板生成圖片描述提示詞"""
+        # 如果是中文禮物名稱，翻譯成英文（翻譯快取命中時不呼叫 AI）
+        gift_name_en = self.translate_gift_name(gift_name)
 
         # 固定模板：包含溫馨節慶氛圍和精美包裝
         prompt = f"A beautiful {gift_name_en}, elegantly wrapped with festive ribbon and gift paper, warm cozy lighting, holiday atmosphere, product photography, high quality, professional"
@@ -123,49 +305,130 @@ class GeminiService:
         return prompt
 
     def generate_gift_image(self, prompt, output_dir=None):
-        """使用選定的引擎生成圖片並上傳到 MinIO"""
-        try:
-            print(f"Image generation engine: {self.image_engine}", flush=True)
+        """使用選定的引擎生成圖片並上傳到 MinIO（同步介面）"""
+        return self.runner.run(self.generate_gift_image_async(prompt))
 
-            if self.image_engine == 'gemini':
-                return self._generate_with_gemini(prompt)
-            else:  # 預設使用 openai
-                return self._generate_with_openai(prompt)
+    async def generate_gift_image_async(self, prompt):
+        """使用選定的引擎生成圖片並上傳到 MinIO，失敗時回傳 None
 
+        所有引擎的斷路器都開啟時立即拋出 CircuitOpenError，不等待重試。
+        """
+        try:
+            return await self._generate_and_upload(prompt)
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"✗ Failed to generate image: {e}", flush=True)
             import traceback
             traceback.print_exc()
             return None
 
-    def _generate_with_openai(self, prompt):
-        """使用 OpenAI DALL-E 生成圖片並上傳到 MinIO"""
-        if not self.openai_client:
-            print("✗ OpenAI client not initialized", flush=True)
-            return None
+    async def _generate_and_upload(self, prompt, deadline=None):
+        """生成圖片並上傳到 MinIO，回傳相對路徑；失敗時拋出例外
 
-        if not self.minio_client:
-            print("✗ MinIO client not initialized", flush=True)
-            return None
+        由 self.router 在可用的引擎之間 failover / hedge；每個引擎的 API 呼叫
+        都經過該引擎的斷路器與並發名額（image_slot），上傳不佔用名額。
+        deadline 為整體期限（time.monotonic() 時間），限制等待並發名額的時間。
+        """
+        engines = self.available_engines()
+        print(f"Image generation engines: {engines}", flush=True)
+        if not engines:
+            raise TerminalError("No image generation engine available")
+
+        if not self.storage:
+            raise TerminalError("Storage not initialized")
+
+        # 檢查 MINIO_PUBLIC_URL（本機儲存的圖片由後端提供，不需要）
+        if self.storage.name == 'minio' and not Config.MINIO_PUBLIC_URL:
+            raise TerminalError("MINIO_PUBLIC_URL is not configured")
+
+        healthy = [engine for engine in engines
+                   if self.breakers[engine].available]
+        if not healthy:
+            raise self._circuit_open_error(engines)
+
+        image_bytes, engine = await self.router.route(healthy, prompt, deadline)
+
+        # 依供應商回傳的格式命名與上傳，不重新編碼
+        content_type, extension = detect_image_format(image_bytes)
+        # 同一秒內完成的並發生成不可共用物件名稱（也是縮圖工作的索引）
+        filename = f"gift_image_{int(time.time())}_{uuid.uuid4().hex}.{extension}"
+
+        # 上傳到儲存後端（不佔用生成並發名額）
+        image_url = await self._upload_image(filename, image_bytes, content_type)
+        if not image_url:
+            raise Exception("圖片上傳失敗")
+
+        # 縮圖在背景產生，完成後交給 on_thumbnails() 登記的回呼
+        self.thumbnails.schedule(image_url, image_bytes)
+        return image_url
+
+    def available_engines(self):
+        """可用的圖片引擎，目前設定的引擎優先（IMAGE_FAILOVER 關閉時只用目前的引擎）"""
+        ready = self._configured_engines()
+        if self.current_engine not in ready:
+            print(f"✗ {self.current_engine} client not initialized", flush=True)
+        return ready
+
+    def _configured_engines(self):
+        primary = self.current_engine
+        engines = [primary]
+        if Config.IMAGE_FAILOVER:
+            engines += [engine for engine in IMAGE_ENGINES if engine != primary]
+        return [engine for engine in engines if self._engine_client(engine)]
+
+    def _circuit_open_error(self, engines):
+        """所有引擎都暫停時的錯誤（retry_after 取最快恢復的引擎）"""
+        breaker = min((self.breakers[engine] for engine in engines),
+                      key=lambda breaker: breaker.retry_after)
+        return CircuitOpenError(breaker.name, breaker.retry_after)
+
+    def _engine_client(self, engine):
+        return self.genai_imagen_client if engine == 'gemini' else self.openai_client
+
+    async def _generate_on(self, engine, prompt, deadline=None):
+        """在指定引擎的斷路器與並發名額內生成圖片，回傳圖片 bytes"""
+        breaker = self.breakers[engine]
+        breaker.before_call()
+        try:
+            async with self.image_slot(engine, deadline):
+                if engine == 'gemini':
+                    result = await self._generate_with_gemini(prompt)
+                else:
+                    result = await self._generate_with_openai(prompt)
+        except (asyncio.CancelledError, QueueTimeout):
+            # 被取消或在本地排隊逾時，不代表供應商故障
+            breaker.record_cancelled()
+            raise
+        except SafetyFilterError:
+            # 供應商正常回應，只是內容被擋下
+            breaker.record_success()
+            raise
+        except Exception as e:
+            breaker.record_failure(e)
+            raise
+        breaker.record_success()
+        return result
 
+    async def _generate_with_openai(self, prompt):
+        """使用 OpenAI gpt-image-1-mini 生成圖片，回傳 PNG bytes"""
         print(f"Generating image with gpt-image-1-mini...", flush=True)
         print(f"Prompt: {prompt}", flush=True)
 
         # 使用 gpt-image-1-mini 生成圖片 (預設回傳 base64)
-        response = self.openai_client.images.generate(
-            model="gpt-image-1-mini",
-            prompt=prompt,
-            size="1024x1024",
-            n=1
-        )
-
-        # 檢查 MINIO_PUBLIC_URL
-        if not Config.MINIO_PUBLIC_URL:
-            print("✗ MINIO_PUBLIC_URL is not configured", flush=True)
-            return None
+        try:
+            response = await self.openai_client.images.generate(
+                model="gpt-image-1-mini",
+                prompt=prompt,
+                size="1024x1024",
+                n=1
+            )
+        except BadRequestError as e:
+            if is_safety_block(e):
+                raise SafetyFilterError(f"OpenAI 安全過濾: {e}") from e
+            raise
 
         # 獲取 base64 圖片數據 (gpt-image-1-mini 預設回傳格式)
-        import base64
         b64_data = response.data[0].b64_json
         if not b64_data:
             print("✗ No image data returned", flush=True)
@@ -173,27 +436,88 @@ class GeminiService:
 
         print(f"✓ Image generated, decoding base64...", flush=True)
 
-        # 解碼 base64 到記憶體
-        image_bytes = base64.b64decode(b64_data)
-        image_data = BytesIO(image_bytes)
-        image_size = len(image_bytes)
+        # 解碼後 response（base64 文字，約 1.33 倍圖片大小）即可釋放，上傳期間只持有
+        # 解碼後的 bytes；解碼在事件迴圈上同步執行，同時只有一個生成處於解碼中
+        return base64.b64decode(b64_data)
 
-        timestamp = int(time.time())
-        filename = f"gift_image_{timestamp}_0.png"
-
-        # 上傳到 MinIO
+    async def _generate_with_gemini(self, prompt):
+        """使用 Gemini Imagen 4.0 生成圖片，回傳供應商編碼好的圖片 bytes"""
         try:
-            self.minio_client.put_object(
-                self.minio_bucket,
-                filename,
-                image_data,
-                length=image_size,
-                content_type='image/png'
+            from google.genai import types
+        except ImportError as e:
+            print(f"✗ Failed to import Gemini types: {e}", flush=True)
+            return None
+
+        # 使用 Imagen 4.0 生成圖片（非同步客戶端）
+        response = await self.genai_imagen_client.aio.models.generate_images(
+            model='imagen-4.0-generate-001',
+            prompt=prompt,
+            config=types.GenerateImagesConfig(
+                number_of_images=1,
+                aspect_ratio='1:1',
+                safety_filter_level='block_low_and_above',
+                person_generation='allow_adult',
+                include_rai_reason=True
             )
+        )
+
+        for generated_image in response.generated_images or []:
+            if generated_image.image is None:
+                if generated_image.rai_filtered_reason:
+                    raise SafetyFilterError(
+                        f"Imagen 安全過濾: {generated_image.rai_filtered_reason}")
+                continue
+            # 直接上傳供應商編碼好的圖片 bytes，不重新編碼
+            if generated_image.image.image_bytes:
+                return generated_image.image.image_bytes
+
+        return None
+
+    @property
+    def current_engine(self):
+        """目前使用的圖片引擎（未知設定值時預設使用 openai）"""
+        return self.image_engine if self.image_engine == 'gemini' else 'openai'
+
+    @property
+    def active_count(self):
+        """所有供應商進行中的圖片生成請求數"""
+        return sum(limiter.in_flight for limiter in self.limiters.values())
+
+    @asynccontextmanager
+    async def image_slot(self, engine=None, deadline=None):
+        """取得一個圖片生成並發名額（等待超過 IMAGE_GENERATION_TIMEOUT 或期限時拋出 QueueTimeout）
+
+        未指定 engine 時使用目前的引擎；區塊內的例外與耗時會回饋給該供應商的自適應上限。
+        deadline 為整體期限（time.monotonic() 時間），與重試間隔共用。
+        """
+        engine = engine or self.current_engine
+        limiter = self.limiters[engine]
+        timeout = Config.IMAGE_GENERATION_TIMEOUT
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        queued_at = time.perf_counter()
+        async with limiter.acquire(timeout=timeout):
+            metrics.record(f'image.admission_wait.{engine}',
+                           time.perf_counter() - queued_at)
+            print(
+                f"🎨 開始生成圖片 (活躍: {limiter.in_flight}/{limiter.limit})", flush=True)
+            try:
+                yield
+            finally:
+                print(
+                    f"✓ 圖片生成完成，釋放佇列位置 (活躍: {limiter.in_flight - 1}/{limiter.limit})", flush=True)
+
+    async def _upload_image(self, filename, image_bytes, content_type='image/png'):
+        """非同步上傳圖片到儲存後端，回傳相對路徑（失敗時回傳 None）
 
+        image_bytes 可為 bytes 或 memoryview；上傳時以 memoryview 切片分段送出，
+        不複製整張圖片（大型物件由 MinioStorage 改用 multipart 上傳）。
+        """
+        image_size = memoryview(image_bytes).nbytes
+        try:
             # 回傳相對路徑 (不含 base URL)
-            relative_path = f"/{self.minio_bucket}/{filename}"
-            full_url = f"{Config.MINIO_PUBLIC_URL}{relative_path}"
+            relative_path = await self.storage.upload(filename, image_bytes, content_type)
+            full_url = self.storage.full_url(relative_path)
 
             print(f"✓ Image generated and uploaded successfully!", flush=True)
             print(f"  Full URL: {full_url}", flush=True)
@@ -203,141 +527,156 @@ class GeminiService:
             return relative_path
 
         except Exception as e:
-            print(f"✗ Failed to upload to MinIO: {e}", flush=True)
+            print(f"✗ Failed to upload to {self.storage.name}: {e}", flush=True)
             import traceback
             traceback.print_exc()
             return None
 
-    def _generate_with_gemini(self, prompt):
-        """使用 Gemini Imagen 4.0 生成圖片並上傳到 MinIO（含並發控制）"""
-        if not self.genai_imagen_client:
-            print("✗ Gemini Imagen client not initialized", flush=True)
-            return None
-
-        if not self.minio_client:
-            print("✗ MinIO client not initialized", flush=True)
-            return None
-
-        # 使用 Semaphore 控制並發（含 timeout）
-        acquired = self.imagen_semaphore.acquire(
-            timeout=Config.IMAGE_GENERATION_TIMEOUT)
-        if not acquired:
-            raise TimeoutError(
-                f"等待圖片生成佇列超時 ({Config.IMAGE_GENERATION_TIMEOUT} 秒)")
-
-        try:
-            # 更新活躍計數
-            with self.queue_lock:
-                self.active_count += 1
-            print(
-                f"🎨 開始生成圖片 (活躍: {self.active_count}/{Config.MAX_CONCURRENT_IMAGE_GENERATION})", flush=True)
-
-            from google.genai import types
-
-            # 使用 Imagen 4.0 生成圖片
-            response = self.genai_imagen_client.models.generate_images(
-                model='imagen-4.0-generate-001',
-                prompt=prompt,
-                config=types.GenerateImagesConfig(
-                    number_of_images=1,
-                    aspect_ratio='1:1',
-                    safety_filter_level='block_low_and_above',
-                    person_generation='allow_adult'
-                )
-            )
-
-            # 上傳到 MinIO
-            for idx, generated_image in enumerate(response.generated_images):
-                timestamp = int(time.time())
-                filename = f"gift_image_{timestamp}_{idx}.png"
-
-                # generated_image.image 是 PIL Image 物件，轉為 BytesIO
-                pil_image = generated_image.image
-                image_buffer = BytesIO()
-                pil_image.save(image_buffer, format='PNG')
-                image_buffer.seek(0)
-                image_size = image_buffer.getbuffer().nbytes
-
-                # 上傳到 MinIO
-                try:
-                    self.minio_client.put_object(
-                        self.minio_bucket,
-                        filename,
-                        image_buffer,
-                        length=image_size,
-                        content_type='image/png'
-                    )
-
-                    # 回傳相對路徑 (不含 base URL)
-                    relative_path = f"/{self.minio_bucket}/{filename}"
-                    full_url = f"{Config.MINIO_PUBLIC_URL}{relative_path}"
-
-                    print(f"✓ Image generated and uploaded successfully!", flush=True)
-                    print(f"  Full URL: {full_url}", flush=True)
-                    print(f"  Relative path: {relative_path}", flush=True)
-                    print(f"  Size: {image_size / 1024:.2f} KB", flush=True)
-
-                    return relative_path
-
-                except Exception as e:
-                    print(f"✗ Failed to upload to MinIO: {e}", flush=True)
-                    import traceback
-                    traceback.print_exc()
-                    return None
-
-            return None
+    def generate_gift_image_with_retry(self, prompt, output_dir=None):
+        """生成圖片並自動重試（最多 N 次，同步介面）"""
+        return self.runner.run(self.generate_gift_image_with_retry_async(prompt))
 
-        except ImportError as e:
-            print(f"✗ Failed to import Gemini types: {e}", flush=True)
-            return None
-        finally:
-            # 釋放 Semaphore 並更新計數
-            with self.queue_lock:
-                self.active_count -= 1
-            self.imagen_semaphore.release()
-            print(
-                f"✓ 圖片生成完成，釋放佇列位置 (活躍: {self.active_count}/{Config.MAX_CONCURRENT_IMAGE_GENERATION})", flush=True)
+    async def generate_gift_image_with_retry_async(self, prompt):
+        """生成圖片並依 self.retry_policy 重試，回傳 (圖片路徑, 重試次數)
 
-    def generate_gift_image_with_retry(self, prompt, output_dir=None):
-        """生成圖片並自動重試（最多 N 次）"""
-        max_retries = Config.IMAGE_GENERATION_MAX_RETRIES
-        last_error = None
+        安全過濾等不可重試的錯誤立即拋出；等待並發名額與重試間隔共用
+        IMAGE_GENERATION_DEADLINE 的期限。
+        """
+        policy = self.retry_policy
+        deadline = policy.deadline_from_now()
+        delay = policy.base_delay
 
-        for attempt in range(max_retries + 1):
+        for attempt in range(policy.max_retries + 1):
             try:
+                with metrics.timer('image.attempt'):
+                    result = await self._generate_and_upload(prompt, deadline)
                 if attempt > 0:
-                    wait_time = attempt * 5  # exponential backoff: 5s, 10s
-                    print(f"⏳ 等待 {wait_time} 秒後重試...", flush=True)
-                    time.sleep(wait_time)
-                    print(f"🔄 重試第 {attempt} 次...", flush=True)
-
-                result = self.generate_gift_image(prompt, output_dir)
-                if result:
-                    if attempt > 0:
-                        print(f"✓ 重試成功！(第 {attempt} 次)", flush=True)
-                    return result, attempt  # 回傳結果與重試次數
-                else:
-                    raise Exception("圖片生成回傳 None")
+                    print(f"✓ 重試成功！(第 {attempt} 次)", flush=True)
+                return result, attempt  # 回傳結果與重試次數
 
             except Exception as e:
-                last_error = e
                 print(
-                    f"✗ 圖片生成失敗 (嘗試 {attempt + 1}/{max_retries + 1}): {str(e)}", flush=True)
-                if attempt >= max_retries:
-                    print(f"✗ 已達最大重試次數 ({max_retries} 次)，放棄重試", flush=True)
+                    f"✗ 圖片生成失敗 (嘗試 {attempt + 1}/{policy.max_retries + 1}): {str(e)}", flush=True)
+                if is_terminal_error(e):
+                    # 安全過濾、請求錯誤或供應商暫停中，重試也不會成功：立即失敗
+                    print(f"✗ 不可重試的錯誤，放棄重試", flush=True)
+                    raise
+                if attempt >= policy.max_retries:
+                    print(f"✗ 已達最大重試次數 ({policy.max_retries} 次)，放棄重試", flush=True)
                     raise Exception(
-                        f"圖片生成失敗 (已重試 {max_retries} 次): {str(last_error)}")
+                        f"圖片生成失敗 (已重試 {policy.max_retries} 次): {str(e)}")
+
+                delay = policy.next_delay(e, delay, deadline)
+                if delay is None:
+                    print(f"✗ 已接近生成期限，放棄重試", flush=True)
+                    raise Exception(f"圖片生成失敗 (已超過期限): {str(e)}")
+
+            metrics.increment('image.retries')
+            print(f"⏳ 等待 {delay:.1f} 秒後重試...", flush=True)
+            await asyncio.sleep(delay)
+            print(f"🔄 重試第 {attempt + 1} 次...", flush=True)
+
+    def on_thumbnails(self, image_url, callback):
+        """登記原圖的縮圖完成回呼（不等待縮圖）；沒有排程縮圖時回傳 False
 
-        raise Exception(f"圖片生成失敗: {str(last_error)}")
+        callback({尺寸: 相對路徑}) 在背景執行緒中呼叫，失敗或逾時時不呼叫。
+        """
+        async def attach():
+            return self.thumbnails.attach(image_url, callback)
+        return self.runner.run(attach())
 
     def get_queue_info(self):
-        """取得目前佇列資訊"""
-        with self.queue_lock:
-            return {
-                'active_count': self.active_count,
-                'max_concurrent': Config.MAX_CONCURRENT_IMAGE_GENERATION,
-                'available_slots': Config.MAX_CONCURRENT_IMAGE_GENERATION - self.active_count
-            }
+        """取得目前佇列資訊（max_concurrent 為目前引擎的自適應上限）
+
+        provider_busy 表示所有可用引擎的斷路器都開啟中，新的生成請求會立即失敗。
+        """
+        engine = self.current_engine
+        limiter = self.limiters[engine]
+        engines = self._configured_engines()
+        busy = bool(engines) and not any(
+            self.breakers[name].available for name in engines)
+        retry_after = self._circuit_open_error(engines).retry_after if busy else 0
+        return {
+            'provider_busy': busy,
+            'retry_after_seconds': round(retry_after, 1),
+            'engine': engine,
+            'active_count': limiter.in_flight,
+            'waiting_count': limiter.waiting,
+            'max_concurrent': limiter.limit,
+            'available_slots': max(limiter.limit - limiter.in_flight, 0),
+            'providers': {name: limiter.stats()
+                          for name, limiter in self.limiters.items()},
+            'circuits': {name: breaker.stats()
+                         for name, breaker in self.breakers.items()},
+            'storage': self.storage.stats() if self.storage else None
+        }
+
+
+def detect_image_format(data):
+    """依檔頭判斷圖片格式，回傳 (Content-Type, 副檔名)；無法判斷時視為 PNG"""
+    header = bytes(memoryview(data)[:12])
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return content_type, extension
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp', 'webp'
+    return 'image/png', 'png'
+
+
+def _load_json(text, pattern, kind):
+    """從回應文字中取出 JSON（模型常把 JSON 包在 ```json 區塊中）"""
+    match = re.search(pattern, text or '', re.DOTALL)
+    if not match:
+        raise ValueError(f"回應中沒有 JSON {kind}: {text!r}")
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON 格式錯誤: {e}")
+
+
+def validate_guess_item(data):
+    """驗證單筆 {"guess", "english"}，回傳 (猜測, 英文名稱)，格式不符時拋出 ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("回應不是 JSON 物件")
+
+    guess = data.get('guess')
+    gift_name_en = data.get('english')
+    if not isinstance(guess, str) or not guess.strip():
+        raise ValueError("缺少 guess 欄位")
+    if not isinstance(gift_name_en, str) or not gift_name_en.strip():
+        raise ValueError("缺少 english 欄位")
+
+    guess = guess.strip().strip('「」"\'')
+    gift_name_en = gift_name_en.strip().strip('"\'')
+    if len(guess) > MAX_GUESS_LENGTH:
+        raise ValueError(f"guess 過長: {guess}")
+    if len(gift_name_en) > MAX_SUBJECT_LENGTH or any(
+            '\u4e00' <= char <= '\u9fff' for char in gift_name_en):
+        raise ValueError(f"english 不是英文名稱: {gift_name_en}")
+    return guess, gift_name_en
+
+
+def parse_guess_response(text):
+    """解析並驗證結構化猜測回應，格式不符時拋出 ValueError"""
+    return validate_guess_item(_load_json(text, r'\{.*\}', '物件'))
+
+
+def parse_batch_guess_response(text, count):
+    """解析批次猜測回應，回傳 {序號: (猜測, 英文名稱)}；格式不符的項目略過"""
+    data = _load_json(text, r'\[.*\]', '陣列')
+    if not isinstance(data, list):
+        raise ValueError("回應不是 JSON 陣列")
+
+    results = {}
+    for item in data:
+        try:
+            index = int(item.get('id')) if isinstance(item, dict) else None
+            if index is None or not 1 <= index <= count:
+                raise ValueError(f"無效的 id: {item!r}")
+            results[index] = validate_guess_item(item)
+        except (TypeError, ValueError) as e:
+            print(f"Skipping invalid batch guess item: {e}", flush=True)
+    return results
 
 
 # 創建全局服務實例
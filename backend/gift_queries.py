@@ -0,0 +1,94 @@
+"""禮物列表查詢：增量查詢與 keyset 分頁
+
+cursor 依 (change_seq, id) 分頁：change_seq 在持有 'gifts' 計數器列鎖時寫入，
+順序與交易提交順序一致，較晚提交的變更一定排在游標之後，不會漏掉。
+updated_since 依應用程式在 flush 時寫入的 updated_at，與提交順序可能不同，
+因此多回傳 UPDATED_SINCE_OVERLAP 內的變更，前端依 id 合併重複的禮物。
+"""
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from models import Gift, gift_load_options
+
+MAX_PAGE_SIZE = 500
+
+UPDATED_SINCE_OVERLAP = timedelta(seconds=30)
+
+
+def encode_cursor(change_seq, gift_id):
+    """將 (change_seq, id) 編碼為不透明的游標字串"""
+    raw = f"{change_seq}|{gift_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解碼游標，格式錯誤（含舊版以時間為準的游標）時拋出 ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        change_seq, gift_id = base64.urlsafe_b64decode(
+            padded.encode()).decode().split('|')
+        return int(change_seq), int(gift_id)
+    except Exception:
+        raise ValueError('無效的 cursor 參數')
+
+
+def parse_updated_since(value):
+    """解析 ISO 8601 時間字串，格式錯誤時拋出 ValueError"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError('無效的 updated_since 參數')
+
+
+def parse_limit(value):
+    """解析分頁大小（1..MAX_PAGE_SIZE），未指定時回傳 None 表示不分頁"""
+    if value is None:
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('無效的 limit 參數')
+    if limit < 1:
+        raise ValueError('無效的 limit 參數')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def list_gifts(updated_since=None, cursor=None, limit=None, fields=None):
+    """查詢禮物，回傳 (禮物列表, 下一頁游標, 是否還有更多)
+
+    有 updated_since / cursor / limit 時依 (change_seq, id) 排序並只回傳之後變更的禮物；
+    下一頁游標指向最後一筆，前端之後帶著它查詢即可只取得新的變更。
+    指定 fields 時只載入這些欄位（游標另需 change_seq）。
+    """
+    query = Gift.query.options(*gift_load_options(fields, 'change_seq'))
+    incremental = any(v is not None for v in (updated_since, cursor, limit))
+
+    if cursor is not None:
+        cursor_seq, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Gift.change_seq > cursor_seq,
+            and_(Gift.change_seq == cursor_seq, Gift.id > cursor_id)))
+    elif updated_since is not None:
+        query = query.filter(
+            Gift.updated_at > parse_updated_since(updated_since) - UPDATED_SINCE_OVERLAP)
+
+    if incremental:
+        query = query.order_by(Gift.change_seq, Gift.id)
+    else:
+        query = query.order_by(Gift.id)
+
+    if limit is not None:
+        gifts = query.limit(limit + 1).all()
+        has_more = len(gifts) > limit
+        gifts = gifts[:limit]
+    else:
+        gifts = query.all()
+        has_more = False
+
+    if gifts:
+        last = max(gifts, key=lambda g: (g.change_seq, g.id))
+        next_cursor = encode_cursor(last.change_seq, last.id)
+    else:
+        next_cursor = cursor
+
+    return gifts, next_cursor, has_more
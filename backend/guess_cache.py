@@ -0,0 +1,146 @@
+"""AI 猜測結果快取：以正規化線索 + 提示詞版本的雜湊為鍵
+
+猜測結果與鍵一起存在 gifts 表（ai_guess / ai_guess_key）。重新生成時
+線索未變更、或其他禮物已有相同線索時直接沿用，不再呼叫 Gemini；
+並發的相同猜測以 single-flight 合併為一次上游呼叫。未命中時以一次
+結構化呼叫同時取得英文名稱，並寫入翻譯快取供圖片提示詞使用。
+"""
+import hashlib
+import threading
+import unicodedata
+from gemini_service import GUESS_PROMPT_VERSION, gemini_service
+from models import db, Gift, GenerationJob
+from single_flight import SingleFlight
+from translation_cache import translation_cache
+
+
+def normalize_clue(text):
+    """全形轉半形、合併空白並轉小寫"""
+    return ' '.join(unicodedata.normalize('NFKC', text or '').split()).lower()
+
+
+def guess_cache_key(appearance, who_likes, usage_time):
+    """線索的內容雜湊（含提示詞版本）"""
+    parts = [f'v{GUESS_PROMPT_VERSION}'] + [
+        normalize_clue(clue) for clue in (appearance, who_likes, usage_time)]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class GuessCache:
+    """guess_gift 結果快取與並發合併"""
+
+    def __init__(self):
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self.gift_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.batch_requests = 0
+        self.batch_items = 0
+
+    def lookup(self, gift, key):
+        """先看禮物本身，再找線索相同的其他禮物；未命中時回傳 None"""
+        if gift.ai_guess and gift.ai_guess_key == key:
+            self._count('gift_hits')
+            return gift.ai_guess
+
+        guess = (db.session.query(Gift.ai_guess)
+                 .filter(Gift.ai_guess_key == key, Gift.ai_guess.isnot(None))
+                 .limit(1)
+                 .scalar())
+        if guess:
+            self._count('shared_hits')
+        return guess
+
+    def guess(self, gift, bypass=False):
+        """取得禮物的猜測，回傳 (猜測, 快取鍵)；bypass=True 時一律重新猜測"""
+        key = guess_cache_key(gift.appearance, gift.who_likes, gift.usage_time)
+        if bypass:
+            self._count('bypassed')
+        else:
+            cached = self.lookup(gift, key)
+            if cached:
+                print(f"Reusing cached guess for gift {gift.id}: {cached}", flush=True)
+                return cached, key
+
+        self._count('misses')
+        (guess, gift_name_en), shared = self._flight.do(
+            key, lambda: gemini_service.guess_gift_with_translation(
+                gift.appearance, gift.who_likes, gift.usage_time))
+        if shared:
+            self._count('coalesced')
+        elif gift_name_en:
+            translation_cache.set(guess, gift_name_en)
+        return guess, key
+
+    def prime_batch(self, batch_id):
+        """以一次 AI 請求猜測同一批次中尚未有猜測的禮物，並存回禮物
+
+        同一批次的多個工作並發執行時只有第一個會呼叫 AI，其他工作等待共用；
+        批次請求失敗或漏掉的禮物之後會在各自的工作中個別猜測。
+        """
+        try:
+            self._flight.do(f'batch:{batch_id}',
+                            lambda: self._guess_batch(batch_id))
+        except Exception as e:
+            print(f"✗ 批次猜測失敗，改為個別猜測: {e}", flush=True)
+            db.session.rollback()
+
+    def _guess_batch(self, batch_id):
+        gifts = (Gift.query
+                 .join(GenerationJob, GenerationJob.gift_id == Gift.id)
+                 .filter(GenerationJob.batch_id == batch_id)
+                 .order_by(Gift.id)
+                 .all())
+        missing = []
+        for gift in gifts:
+            key = guess_cache_key(
+                gift.appearance, gift.who_likes, gift.usage_time)
+            if not (gift.ai_guess and gift.ai_guess_key == key):
+                missing.append((gift, key))
+        if len(missing) < 2:
+            # 只剩一個禮物（或批次回應漏掉的禮物）時由各自的工作個別猜測即可
+            return
+
+        results = gemini_service.guess_gifts_batch(
+            [(gift.appearance, gift.who_likes, gift.usage_time) for gift, _ in missing])
+        with self._lock:
+            self.batch_requests += 1
+            self.batch_items += len(missing)
+
+        translations = []
+        for (gift, key), result in zip(missing, results):
+            if result is None:
+                continue
+            guess, gift_name_en = result
+            gift.ai_guess = guess
+            gift.ai_guess_key = key
+            translations.append((guess, gift_name_en))
+        db.session.commit()
+
+        for guess, gift_name_en in translations:
+            translation_cache.set(guess, gift_name_en)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._lock:
+            hits = self.gift_hits + self.shared_hits
+            lookups = hits + self.misses
+            return {
+                'gift_hits': self.gift_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'coalesced': self.coalesced,
+                'bypassed': self.bypassed,
+                'batch_requests': self.batch_requests,
+                'batch_items': self.batch_items,
+            }
+
+
+guess_cache = GuessCache()
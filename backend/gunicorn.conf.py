@@ -0,0 +1,79 @@
+"""gunicorn 設定：正式環境以 `gunicorn -c gunicorn.conf.py wsgi:app` 啟動
+
+所有數值都可以用環境變數覆寫，預設值依 CPU 數量與
+圖片生成並發上限（IMAGE_CONCURRENCY_MAX）推算。
+"""
+import math
+import multiprocessing
+import os
+import signal
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+cpu_count = multiprocessing.cpu_count()
+max_generation = int(os.getenv(
+    'IMAGE_CONCURRENCY_MAX',
+    int(os.getenv('MAX_CONCURRENT_IMAGE_GENERATION', 5)) * 4))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# SSE 事件與回應快取預設都只存在於單一行程內，因此預設只開 1 個行程，
+# 以執行緒處理並發；設定 JOB_BROKER=database 與 RESPONSE_CACHE_BACKEND=redis
+# 並讓反向代理以 sticky session 轉送 /api/events 後才適合增加行程數
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+
+# 一般請求使用 2 * CPU + 1 個執行緒，另外保留給長時間連線的 SSE 串流。
+# 每個串流佔用一個執行緒直到結束，因此同時串流數限制在保留的執行緒數內，
+# 超過時 /api/events 回傳 503 與 Retry-After，一般請求不會因串流而拿不到執行緒。
+# 不使用 gevent/eventlet：生成 worker 執行緒與供應商的 asyncio 事件迴圈都依賴
+# 原生執行緒，monkey patch 後會互相干擾
+request_threads = 2 * cpu_count + 1
+stream_threads = int(os.getenv('GUNICORN_STREAM_THREADS', 64))
+threads = int(os.getenv('GUNICORN_THREADS', request_threads + stream_threads))
+os.environ.setdefault('EVENT_STREAM_MAX_SUBSCRIBERS',
+                      str(max(1, min(stream_threads, threads - request_threads))))
+
+# 所有行程合計同時執行中的工作不超過自適應並發上限的最大值；
+# 圖片生成在事件迴圈上等待，不佔用 worker 執行緒
+os.environ.setdefault(
+    'JOB_MAX_IN_FLIGHT', str(max(1, math.ceil(max_generation / workers))))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# 關閉時先等待執行中的圖片生成工作，保留 5 秒給行程結束
+graceful_timeout = int(os.getenv('GRACEFUL_SHUTDOWN_TIMEOUT', 120))
+job_drain_timeout = max(graceful_timeout - 5, 0)
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """行程載入 app 後立即啟動背景 worker，接手資料表中待處理的工作"""
+    from events import event_broker
+    from job_queue import job_queue
+    job_queue.start()
+
+    # gthread worker 收到 SIGTERM 後會等待所有連線結束才呼叫 worker_exit，
+    # SSE 長連線不會自行結束，因此收到訊號時就先關閉串流
+    handle_exit = worker.handle_exit
+
+    def begin_shutdown(sig, frame):
+        handle_exit(sig, frame)
+        threading.Thread(target=event_broker.close, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, begin_shutdown)
+
+
+def worker_exit(server, worker):
+    """優雅關閉：結束 SSE 串流、等待執行中的圖片生成工作完成並結束縮圖子行程"""
+    from events import event_broker
+    from job_queue import job_queue
+    from gemini_service import gemini_service
+    event_broker.close()
+    job_queue.shutdown(timeout=job_drain_timeout)
+    gemini_service.thumbnails.shutdown()
@@ -0,0 +1,683 @@
+"""背景工作佇列：行程內 worker pool + generation_jobs 資料表持久化
+
+API 端點只負責把工作寫入資料表並交給代理（broker），由 worker 執行緒
+取出後執行已註冊的處理函式，避免 Flask 請求執行緒被 AI 呼叫卡住。
+處理函式可回傳 AsyncResult，把耗時的供應商 I/O 交給事件迴圈：worker 不等待，
+立即領取下一個工作，完成後由完成執行緒寫入結果。同時執行中的工作數由
+max_in_flight（JOB_MAX_IN_FLIGHT）限制，與 worker 執行緒數無關。
+工作分成三個優先順序通道（第一次生成 > 重新生成 > 批次補生成），
+通道之間依權重分配（smooth weighted round-robin），同一通道內依
+(created_at, id) 先來後到；estimate() 以此順序回報排隊位置與預估開始/完成時間。
+
+執行中的工作帶有租約（lease_expires_at），由每個行程的租約執行緒定期續約；
+行程當掉後租約過期的工作會被任一行程改回 pending 重新執行。
+同一禮物最多一個進行中工作由資料表的部分唯一索引保證。
+"""
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from config import Config, parse_lane_weights
+from metrics import metrics
+from models import db, GenerationJob
+
+ACTIVE_JOB_STATUSES = ('pending', 'processing')
+
+# 優先順序通道（數字越小越優先）
+PRIORITY_FIRST = 0        # 第一次生成
+PRIORITY_REGENERATE = 1   # 重新生成
+PRIORITY_BACKFILL = 2     # 管理員批次補生成
+PRIORITY_LANES = (PRIORITY_FIRST, PRIORITY_REGENERATE, PRIORITY_BACKFILL)
+JOB_TYPE_PRIORITY = {'generate': PRIORITY_FIRST,
+                     'regenerate': PRIORITY_REGENERATE}
+
+
+class LaneScheduler:
+    """依權重在有工作的通道之間挑選（smooth weighted round-robin）
+
+    所有通道都有工作時，各通道取得的 worker 比例等於權重比例；
+    只有部分通道有工作時，空閒通道的份額由其他通道分享。
+    """
+
+    def __init__(self, weights):
+        if isinstance(weights, str):
+            weights = parse_lane_weights(weights)
+        weights = tuple(weights)
+        if len(weights) != len(PRIORITY_LANES) or any(w <= 0 for w in weights):
+            raise ValueError(
+                f"通道權重需要 {len(PRIORITY_LANES)} 個正整數: {weights}")
+        self.weights = dict(zip(PRIORITY_LANES, weights))
+        self._current = {lane: 0 for lane in PRIORITY_LANES}
+        self._lock = threading.Lock()
+
+    def choose(self, ready_lanes):
+        ready_lanes = list(ready_lanes)
+        if not ready_lanes:
+            return None
+        with self._lock:
+            total = sum(self.weights[lane] for lane in ready_lanes)
+            for lane in ready_lanes:
+                self._current[lane] += self.weights[lane]
+            # 同分時優先順序高的通道先
+            chosen = max(ready_lanes, key=lambda lane: (self._current[lane], -lane))
+            self._current[chosen] -= total
+            return chosen
+
+
+class InProcessBroker:
+    """行程內代理：每個通道一個 FIFO 佇列傳遞工作 ID（僅限同一個行程）"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._lanes = {lane: deque() for lane in PRIORITY_LANES}
+        self._ready = threading.Condition()
+
+    def put(self, job_id, priority=PRIORITY_FIRST):
+        with self._ready:
+            self._lanes[priority].append(job_id)
+            self._ready.notify()
+
+    def get(self, timeout):
+        with self._ready:
+            if not self._ready.wait_for(
+                    lambda: any(self._lanes.values()), timeout):
+                return None
+            lane = self.scheduler.choose(
+                lane for lane in PRIORITY_LANES if self._lanes[lane])
+            return self._lanes[lane].popleft()
+
+
+class DatabaseBroker:
+    """資料表代理：直接輪詢 generation_jobs，可讓多個行程共用同一份佇列"""
+
+    def __init__(self, scheduler, poll_interval):
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+
+    def put(self, job_id, priority=PRIORITY_FIRST):
+        # 工作已寫入資料表，只需喚醒本行程中正在等待的 worker
+        self._wakeup.set()
+
+    def get(self, timeout):
+        ready_lanes = {priority for (priority,) in
+                       db.session.query(GenerationJob.priority)
+                       .filter_by(status='pending')
+                       .distinct()}
+        lane = self.scheduler.choose(
+            lane for lane in PRIORITY_LANES if lane in ready_lanes)
+        job = None
+        if lane is not None:
+            job = (GenerationJob.query
+                   .filter(GenerationJob.status == 'pending',
+                           GenerationJob.priority == lane)
+                   .order_by(GenerationJob.created_at, GenerationJob.id)
+                   .with_for_update(skip_locked=True)
+                   .first())
+        job_id = job.id if job else None
+        db.session.commit()  # 結束交易並釋放列鎖，實際搶佔由 _claim 完成
+        if job_id is None:
+            self._wakeup.wait(timeout=min(timeout, self.poll_interval))
+            self._wakeup.clear()
+        return job_id
+
+
+class AsyncResult:
+    """處理函式把耗時的 I/O 交給事件迴圈時的回傳值
+
+    future 為 EventLoopThread.submit() 回傳的 concurrent.futures.Future。
+    future 完成後在完成執行緒中（app context 內）呼叫 then(result)；
+    future 失敗時先呼叫 on_error(exc)，工作記為失敗。
+    """
+
+    def __init__(self, future, then, on_error=None):
+        self.future = future
+        self.then = then
+        self.on_error = on_error
+
+
+class ServiceTimeAverage:
+    """最近 N 個完成工作的平均處理時間（移動平均，秒）"""
+
+    def __init__(self, window, default):
+        self.default = default
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    @property
+    def value(self):
+        with self._lock:
+            if not self._samples:
+                return self.default
+            return sum(self._samples) / len(self._samples)
+
+    @property
+    def sample_count(self):
+        with self._lock:
+            return len(self._samples)
+
+
+BROKERS = {
+    'inprocess': lambda scheduler: InProcessBroker(scheduler),
+    'database': lambda scheduler: DatabaseBroker(scheduler, Config.JOB_POLL_INTERVAL),
+}
+
+
+class JobQueue:
+    """圖片生成工作佇列（持久化於 generation_jobs 資料表）"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.broker = None
+        self.scheduler = None
+        self.handlers = {}
+        self.worker_count = Config.JOB_WORKER_COUNT
+        self.max_in_flight = Config.JOB_MAX_IN_FLIGHT
+        self.service_time = ServiceTimeAverage(
+            Config.JOB_SERVICE_TIME_WINDOW, Config.JOB_DEFAULT_SERVICE_TIME)
+        self._threads = []
+        self._running = False
+        # 執行中的工作 ID -> (worker_id, 事件迴圈上的 future)，由租約執行緒續約
+        self._active = {}
+        self._idle = threading.Condition()
+        self._slots = None
+        self._completions = None
+        self._lease_thread = None
+        self._lease_stop = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """綁定 Flask app 並依設定建立代理"""
+        self.app = app
+        broker_name = app.config.get('JOB_BROKER', Config.JOB_BROKER)
+        if broker_name not in BROKERS:
+            raise ValueError(f"未知的工作佇列代理: {broker_name}")
+        self.scheduler = LaneScheduler(
+            app.config.get('JOB_LANE_WEIGHTS', Config.JOB_LANE_WEIGHTS))
+        self.broker = BROKERS[broker_name](self.scheduler)
+        self.worker_count = app.config.get(
+            'JOB_WORKER_COUNT', Config.JOB_WORKER_COUNT)
+        self.max_in_flight = app.config.get(
+            'JOB_MAX_IN_FLIGHT', Config.JOB_MAX_IN_FLIGHT)
+        app.extensions['job_queue'] = self
+
+    def register(self, job_type, handler):
+        """註冊工作處理函式，handler(job) 在 app context 中執行
+
+        handler 直接回傳時工作即完成；回傳 AsyncResult 時於 future 完成後才完成。
+        """
+        self.handlers[job_type] = handler
+
+    def enqueue(self, gift_id, job_type='generate', prepare=None, **options):
+        """建立工作並放入佇列；同一禮物已有進行中的工作時直接回傳該工作
+
+        options 為 GenerationJob 的其他欄位（例如 new_guess、priority），
+        未指定 priority 時依 job_type 決定通道。prepare(job) 在同一個交易中
+        執行（例如重置禮物的生成狀態），提交後工作才交給代理，worker 不會在
+        prepare 的變更寫入前領取工作。兩個請求同時建立時由部分唯一索引
+        uq_job_active_gift 擋下後寫入的一方，改回傳先寫入的工作。
+        """
+        existing = self._active_job(gift_id)
+        if existing:
+            return existing, False
+
+        options.setdefault(
+            'priority', JOB_TYPE_PRIORITY.get(job_type, PRIORITY_FIRST))
+        job = GenerationJob(gift_id=gift_id, job_type=job_type,
+                            status='pending', **options)
+        db.session.add(job)
+        if prepare is not None:
+            prepare(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            existing = self._active_job(gift_id)
+            if existing is None:
+                raise
+            return existing, False
+        self.broker.put(job.id, job.priority)
+        return job, True
+
+    def _active_job(self, gift_id):
+        return (GenerationJob.query
+                .filter(GenerationJob.gift_id == gift_id,
+                        GenerationJob.status.in_(ACTIVE_JOB_STATUSES))
+                .order_by(GenerationJob.id.desc())
+                .first())
+
+    def enqueue_many(self, gift_ids, job_type='generate', prepare=None, **options):
+        """一次建立多個工作，全部寫入資料表後才交給代理，回傳建立的工作
+
+        prepare(job) 對每個新工作在同一個交易中執行（見 enqueue）。
+        呼叫端需先排除已有進行中工作的禮物；排除後才被其他請求建立工作的禮物
+        會違反唯一索引，此時改為逐一 enqueue，只回傳實際新建的工作。
+        """
+        options.setdefault(
+            'priority', JOB_TYPE_PRIORITY.get(job_type, PRIORITY_FIRST))
+        jobs = [GenerationJob(gift_id=gift_id, job_type=job_type,
+                              status='pending', **options)
+                for gift_id in gift_ids]
+        db.session.add_all(jobs)
+        if prepare is not None:
+            for job in jobs:
+                prepare(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            created = []
+            for gift_id in gift_ids:
+                job, is_new = self.enqueue(gift_id, job_type, prepare, **options)
+                if is_new:
+                    created.append(job)
+            return created
+        for job in jobs:
+            self.broker.put(job.id, job.priority)
+        return jobs
+
+    def estimate(self, job, capacity=None):
+        """回報工作的排隊位置與預估開始/完成時間
+
+        position 為 1 起算的排隊順位（執行中為 0），ahead 為需要先開始的工作數
+        （含執行中的工作，其他通道依權重比例計入）；以 capacity 個工作同時處理、
+        每個工作平均 service_time 秒估算。
+        """
+        capacity = max(1, min(capacity or self.max_in_flight, self.max_in_flight))
+        service_time = self.service_time.value
+        now = datetime.utcnow()
+
+        if job.status == 'processing':
+            started_at = job.started_at or now
+            finish_at = max(started_at + timedelta(seconds=service_time), now)
+            return {
+                'job_id': job.id,
+                'status': job.status,
+                'priority': job.priority,
+                'position': 0,
+                'ahead': 0,
+                'service_time_seconds': round(service_time, 1),
+                'estimated_wait_seconds': 0,
+                'estimated_start_at': started_at,
+                'estimated_finish_at': finish_at,
+            }
+
+        # 同一通道內排在前面的工作（先來後到）
+        lane_ahead = (GenerationJob.query
+                      .filter(GenerationJob.status == 'pending',
+                              GenerationJob.priority == job.priority,
+                              or_(GenerationJob.created_at < job.created_at,
+                                  and_(GenerationJob.created_at == job.created_at,
+                                       GenerationJob.id < job.id)))
+                      .count())
+        # 其他通道依權重比例穿插：本通道每處理一個工作，其他通道約處理 w_o / w_L 個
+        other_ahead = 0
+        weights = self.scheduler.weights
+        for priority, count in (db.session.query(GenerationJob.priority, func.count())
+                                .filter(GenerationJob.status == 'pending',
+                                        GenerationJob.priority != job.priority)
+                                .group_by(GenerationJob.priority)):
+            share = (lane_ahead + 1) * weights.get(priority, 1) / \
+                weights.get(job.priority, 1)
+            other_ahead += min(count, int(share))
+        pending_ahead = lane_ahead + other_ahead
+        processing = GenerationJob.query.filter_by(status='processing').count()
+        ahead = pending_ahead + processing
+
+        # 前面的工作超過同時處理數時，每多一個工作約多等 service_time / capacity
+        wait = max(0, ahead - capacity + 1) * service_time / capacity
+        start_at = now + timedelta(seconds=wait)
+        return {
+            'job_id': job.id,
+            'status': job.status,
+            'priority': job.priority,
+            'position': pending_ahead + 1,
+            'ahead': ahead,
+            'service_time_seconds': round(service_time, 1),
+            'estimated_wait_seconds': round(wait, 1),
+            'estimated_start_at': start_at,
+            'estimated_finish_at': start_at + timedelta(seconds=service_time),
+        }
+
+    def start(self):
+        """啟動 worker 執行緒（可重複呼叫）"""
+        with self._start_lock:
+            if self._running:
+                return
+            self._running = True
+            self._recover()
+            self._slots = threading.BoundedSemaphore(max(1, self.max_in_flight))
+            self._completions = ThreadPoolExecutor(
+                max_workers=max(1, self.worker_count),
+                thread_name_prefix=f"job-complete-{os.getpid()}")
+            for i in range(self.worker_count):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"job-worker-{os.getpid()}-{i}",
+                    daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            # 沒有 worker 的行程不續約也不收回工作（收回的工作沒有 worker 執行）
+            if self.worker_count:
+                self._lease_stop.clear()
+                self._lease_thread = threading.Thread(
+                    target=self._lease_loop, name=f"job-lease-{os.getpid()}", daemon=True)
+                self._lease_thread.start()
+        print(
+            f"Job queue started: {self.worker_count} workers, max_in_flight={self.max_in_flight}, "
+            f"broker={type(self.broker).__name__}", flush=True)
+
+    def shutdown(self, timeout=None):
+        """停止領取新工作並等待執行中的工作完成（優雅關閉）
+
+        逾時仍未完成的工作改回 pending，由下一個行程啟動時重新執行；
+        回傳是否所有工作都已完成。
+        """
+        with self._start_lock:
+            if not self._running:
+                return True
+            self._running = False
+            threads, self._threads = self._threads, []
+
+        print(f"Job queue shutting down, waiting up to {timeout}s for running jobs", flush=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(self._remaining(deadline))
+        # 等待事件迴圈上執行中的工作完成
+        with self._idle:
+            self._idle.wait_for(lambda: not self._active, self._remaining(deadline))
+            unfinished = dict(self._active)
+
+        # 執行中的工作結束（或逾時）後才停止續約
+        self._lease_stop.set()
+        if self._lease_thread is not None:
+            self._lease_thread.join()
+            self._lease_thread = None
+        if self._completions is not None:
+            self._completions.shutdown(wait=False)
+
+        if unfinished:
+            # 先改回 pending 再取消：取消後的完成處理發現已不擁有工作，不會寫入失敗狀態
+            self._requeue(list(unfinished))
+            for _, future in unfinished.values():
+                if future is not None:
+                    future.cancel()
+            return False
+        print("✓ Job queue drained", flush=True)
+        return True
+
+    @staticmethod
+    def _remaining(deadline):
+        return None if deadline is None else max(0, deadline - time.monotonic())
+
+    def _requeue(self, job_ids):
+        """把本行程仍在執行的工作改回 pending"""
+        with self.app.app_context():
+            try:
+                requeued = (GenerationJob.query
+                            .filter(GenerationJob.status == 'processing',
+                                    GenerationJob.id.in_(job_ids))
+                            .update({'status': 'pending',
+                                     'worker_id': None,
+                                     'started_at': None,
+                                     'lease_expires_at': None},
+                                    synchronize_session=False))
+                db.session.commit()
+                print(f"♻️  關閉逾時，{requeued} 個執行中的工作改回 pending", flush=True)
+            except Exception as e:
+                print(f"✗ 無法重新排入執行中的工作: {e}", flush=True)
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+    def _recover(self):
+        """行程啟動時收回租約過期的工作，並把資料表中尚未處理的工作重新交給代理"""
+        with self.app.app_context():
+            try:
+                self._reclaim_expired(requeue=False)
+                pending = (db.session.query(GenerationJob.id, GenerationJob.priority)
+                           .filter_by(status='pending')
+                           .order_by(GenerationJob.created_at, GenerationJob.id)
+                           .all())
+                self._seed_service_time()
+            except Exception as e:
+                print(f"✗ 無法讀取待處理工作: {e}", flush=True)
+                db.session.rollback()
+                return
+            finally:
+                db.session.remove()
+        for job_id, priority in pending:
+            self.broker.put(job_id, priority)
+        if pending:
+            print(f"♻️  重新排入 {len(pending)} 個待處理工作", flush=True)
+
+    def _seed_service_time(self):
+        """以最近完成的工作初始化平均處理時間（重新啟動後預估不必從預設值開始）"""
+        recent = (db.session.query(GenerationJob.started_at, GenerationJob.completed_at)
+                  .filter(GenerationJob.status == 'completed',
+                          GenerationJob.started_at.isnot(None),
+                          GenerationJob.completed_at.isnot(None))
+                  .order_by(GenerationJob.completed_at.desc())
+                  .limit(Config.JOB_SERVICE_TIME_WINDOW)
+                  .all())
+        for started_at, completed_at in reversed(recent):
+            self.service_time.record(
+                (completed_at - started_at).total_seconds())
+
+    def _reclaim_expired(self, requeue=True):
+        """把租約過期的 processing 工作改回 pending（執行的行程已當掉或卡住）
+
+        沒有租約的 processing 工作（加入租約前留下的資料）也視為過期。
+        逐筆以條件式 UPDATE 收回，多個行程同時收回時只有一個會成功；
+        requeue=True 時把收回的工作交給代理。在 app context 中呼叫。
+        """
+        now = datetime.utcnow()
+        expired = (db.session.query(GenerationJob.id, GenerationJob.priority)
+                   .filter(GenerationJob.status == 'processing',
+                           or_(GenerationJob.lease_expires_at < now,
+                               GenerationJob.lease_expires_at.is_(None)))
+                   .all())
+        reclaimed = []
+        for job_id, priority in expired:
+            updated = (GenerationJob.query
+                       .filter(GenerationJob.id == job_id,
+                               GenerationJob.status == 'processing',
+                               or_(GenerationJob.lease_expires_at < now,
+                                   GenerationJob.lease_expires_at.is_(None)))
+                       .update({'status': 'pending',
+                                'worker_id': None,
+                                'started_at': None,
+                                'lease_expires_at': None},
+                               synchronize_session=False))
+            if updated:
+                reclaimed.append((job_id, priority))
+        db.session.commit()
+        if reclaimed:
+            print(f"♻️  收回 {len(reclaimed)} 個租約過期的工作", flush=True)
+        if requeue:
+            for job_id, priority in reclaimed:
+                self.broker.put(job_id, priority)
+        return reclaimed
+
+    def _lease_loop(self):
+        """定期為本行程執行中的工作續約，並收回其他行程遺留的過期工作"""
+        interval = Config.JOB_LEASE_SECONDS / 3
+        while not self._lease_stop.wait(interval):
+            with self.app.app_context():
+                try:
+                    self._renew_leases()
+                    self._reclaim_expired()
+                except Exception as e:
+                    print(f"✗ 工作租約續約失敗: {e}", flush=True)
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _renew_leases(self):
+        with self._idle:
+            active = dict(self._active)
+        if not active:
+            return 0
+        renewed = (GenerationJob.query
+                   .filter(GenerationJob.id.in_(active.keys()),
+                           GenerationJob.status == 'processing',
+                           GenerationJob.worker_id.in_(
+                               {worker_id for worker_id, _ in active.values()}))
+                   .update({'lease_expires_at': self._lease_deadline()},
+                           synchronize_session=False))
+        db.session.commit()
+        return renewed
+
+    @staticmethod
+    def _lease_deadline():
+        return datetime.utcnow() + timedelta(seconds=Config.JOB_LEASE_SECONDS)
+
+    def _claim(self, job_id, worker_id):
+        """以條件式 UPDATE 搶佔工作，確保同一工作只會被一個 worker 執行"""
+        claimed = (GenerationJob.query
+                   .filter_by(id=job_id, status='pending')
+                   .update({'status': 'processing',
+                            'worker_id': worker_id,
+                            'started_at': datetime.utcnow(),
+                            'lease_expires_at': self._lease_deadline()},
+                           synchronize_session=False))
+        db.session.commit()
+        return claimed == 1
+
+    def _worker_loop(self):
+        worker_id = threading.current_thread().name
+        while self._running:
+            # 執行中的工作數達上限時不再領取
+            if not self._slots.acquire(timeout=Config.JOB_POLL_INTERVAL):
+                continue
+            job_id = None
+            dispatched = False
+            with self.app.app_context():
+                try:
+                    job_id = self.broker.get(timeout=Config.JOB_POLL_INTERVAL)
+                    # 關閉中不再搶佔新工作，留在資料表中由下一個行程接手
+                    if (job_id is not None and self._running
+                            and self._claim(job_id, worker_id)):
+                        self._track(job_id, worker_id)
+                        dispatched = self._run(
+                            db.session.get(GenerationJob, job_id), worker_id)
+                except Exception as e:
+                    print(f"✗ Worker {worker_id} 發生錯誤: {e}", flush=True)
+                    traceback.print_exc()
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+                    # 交給事件迴圈的工作在完成處理後才釋放名額
+                    if not dispatched:
+                        self._release(job_id, worker_id)
+
+    def _track(self, job_id, worker_id, future=None):
+        with self._idle:
+            self._active[job_id] = (worker_id, future)
+
+    def _release(self, job_id, worker_id):
+        with self._idle:
+            # 同一工作可能因重新排入而被本行程另一個 worker 持有，只移除自己的紀錄
+            if self._active.get(job_id, (None, None))[0] == worker_id:
+                del self._active[job_id]
+                self._idle.notify_all()
+        self._slots.release()
+
+    def _run(self, job, worker_id):
+        """執行單一工作，回傳是否已交給事件迴圈（尚未完成）"""
+        job_id, started_at = job.id, job.started_at
+        handler = self.handlers.get(job.job_type)
+        if job.created_at and started_at:
+            metrics.record('queue_wait',
+                           (started_at - job.created_at).total_seconds())
+        started = time.perf_counter()
+        try:
+            if handler is None:
+                raise Exception(f"未註冊的工作類型: {job.job_type}")
+            result = handler(job)
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ 工作 {job_id} 失敗: {e}", flush=True)
+            metrics.record('job', time.perf_counter() - started)
+            self._finish(job_id, worker_id, started_at, 'failed', str(e))
+            return False
+
+        if isinstance(result, AsyncResult):
+            self._track(job_id, worker_id, result.future)
+            result.future.add_done_callback(
+                lambda _: self._completions.submit(
+                    self._complete, job_id, worker_id, started_at, started, result))
+            return True
+
+        metrics.record('job', time.perf_counter() - started)
+        self._finish(job_id, worker_id, started_at, 'completed', None)
+        return False
+
+    def _complete(self, job_id, worker_id, started_at, started, result):
+        """事件迴圈上的工作完成後寫入結果（在完成執行緒中執行）"""
+        with self.app.app_context():
+            try:
+                # 租約已被收回（或關閉時已改回 pending）時不再寫入禮物與工作
+                if not self._owns(job_id, worker_id):
+                    print(f"⚠️  工作 {job_id} 已不屬於 {worker_id}，捨棄結果", flush=True)
+                    return
+                status, error = 'completed', None
+                try:
+                    try:
+                        value = result.future.result()
+                    except Exception as e:
+                        if result.on_error is not None:
+                            result.on_error(e)
+                        raise
+                    result.then(value)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"✗ 工作 {job_id} 失敗: {e}", flush=True)
+                    status, error = 'failed', str(e)
+                metrics.record('job', time.perf_counter() - started)
+                self._finish(job_id, worker_id, started_at, status, error)
+            except Exception as e:
+                print(f"✗ 工作 {job_id} 完成處理發生錯誤: {e}", flush=True)
+                traceback.print_exc()
+                db.session.rollback()
+            finally:
+                db.session.remove()
+                self._release(job_id, worker_id)
+
+    def _owns(self, job_id, worker_id):
+        return db.session.query(GenerationJob.id).filter_by(
+            id=job_id, worker_id=worker_id, status='processing').first() is not None
+
+    def _finish(self, job_id, worker_id, started_at, status, error):
+        """記錄工作結果
+
+        以條件式 UPDATE 寫入：租約過期後工作可能已被收回並交給其他 worker，
+        此時本 worker 已不再擁有該工作，捨棄結果不覆寫新擁有者的狀態。
+        """
+        completed_at = datetime.utcnow()
+        finished = (GenerationJob.query
+                    .filter_by(id=job_id, worker_id=worker_id, status='processing')
+                    .update({'status': status,
+                             'error': error,
+                             'completed_at': completed_at,
+                             'lease_expires_at': None},
+                            synchronize_session=False))
+        db.session.commit()
+        if not finished:
+            print(f"⚠️  工作 {job_id} 的租約已被收回，捨棄 {worker_id} 的結果 ({status})", flush=True)
+            return
+        if status == 'completed' and started_at:
+            self.service_time.record((completed_at - started_at).total_seconds())
+
+job_queue = JobQueue()
@@ -0,0 +1,58 @@
+"""快速 JSON 編碼：優先使用 orjson，未安裝時退回標準庫 json
+
+兩種實作都原生輸出 ISO 8601 datetime（與 datetime.isoformat() 相同），
+因此 to_dict 可以直接放入 datetime 物件。
+"""
+import decimal
+import json
+import uuid
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """標準庫與 orjson 都不支援的型別"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj, indent=False):
+    """序列化為 UTF-8 bytes"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    return json.dumps(obj, default=_default, ensure_ascii=False,
+                      indent=2 if indent else None,
+                      separators=None if indent else (',', ':')).encode('utf-8')
+
+
+def dumps(obj, indent=False):
+    """序列化為字串"""
+    return dumps_bytes(obj, indent).decode('utf-8')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider：jsonify 與 app.json 都會使用此編碼器"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, indent=bool(kwargs.get('indent')))
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (
+            self.compact is None and self._app.debug)
+        return self._app.response_class(
+            dumps_bytes(obj, indent) + b'\n', mimetype=self.mimetype)
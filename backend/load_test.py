@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+API 負載測試
+
+以多個執行緒持續請求讀取量大的端點，統計每秒請求數與延遲分佈，
+用來比較 Flask 開發伺服器（python app.py）與 gunicorn 的差異。
+
+使用方式:
+    # 開發伺服器
+    python app.py
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 50 --duration 20
+
+    # 正式環境設定
+    gunicorn -c gunicorn.conf.py wsgi:app
+    python load_test.py --url http://127.0.0.1:5000 --concurrency 50 --duration 20
+"""
+import argparse
+import statistics
+import threading
+import time
+from collections import defaultdict
+import requests
+
+DEFAULT_PATHS = [
+    '/api/health',
+    '/api/gifts',
+    '/api/gifts?fields=id,image_url,is_confirmed,is_exchanged',
+    '/api/voting/results',
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def run_client(base_url, paths, deadline, results, lock, client_id):
+    """單一客戶端：依序輪流請求各端點直到時間結束"""
+    session = requests.Session()
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    i = client_id
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            response = session.get(base_url + path, timeout=30)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok:
+            latencies[path].append(elapsed)
+        else:
+            errors[path] += 1
+
+    with lock:
+        for path, values in latencies.items():
+            results['latencies'][path].extend(values)
+        for path, count in errors.items():
+            results['errors'][path] += count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API 負載測試')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20, help='秒')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='要測試的路徑（可重複指定，預設為讀取量大的端點）')
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/')
+    paths = args.paths or DEFAULT_PATHS
+    results = {'latencies': defaultdict(list), 'errors': defaultdict(int)}
+    lock = threading.Lock()
+
+    print(f"負載測試 {base_url}：{args.concurrency} 個並發客戶端，{args.duration:.0f} 秒")
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=run_client,
+                                args=(base_url, paths, deadline, results, lock, i))
+               for i in range(args.concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print("=" * 86)
+    total_ok = 0
+    total_errors = 0
+    for path in paths:
+        values = results['latencies'][path]
+        errors = results['errors'][path]
+        total_ok += len(values)
+        total_errors += errors
+        mean = statistics.mean(values) if values else 0.0
+        print(f"{path[:40]:<40} {len(values) / elapsed:8.1f} req/s  "
+              f"平均 {mean:7.1f} ms  p95 {percentile(values, 95):7.1f} ms  錯誤 {errors}")
+    print("=" * 86)
+    all_latencies = [v for values in results['latencies'].values() for v in values]
+    print(f"總計 {total_ok / elapsed:.1f} req/s  "
+          f"p50 {percentile(all_latencies, 50):.1f} ms  "
+          f"p99 {percentile(all_latencies, 99):.1f} ms  錯誤 {total_errors}")
+
+
+if __name__ == '__main__':
+    main()
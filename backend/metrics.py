@@ -0,0 +1,70 @@
+"""各處理階段的耗時統計（供 /api/admin/metrics 查詢）
+
+每個階段保留最近的樣本計算百分位數，另有累計次數與簡單計數器
+（例如結構化輸出解析失敗後改用兩次呼叫的次數）。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SAMPLE_SIZE = 500
+
+
+def _percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1,
+                int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class PhaseMetrics:
+    """行程內的階段計時與計數器"""
+
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._counts = {}
+        self._counters = {}
+
+    def record(self, phase, seconds):
+        with self._lock:
+            if phase not in self._samples:
+                self._samples[phase] = deque(maxlen=self.sample_size)
+                self._counts[phase] = 0
+            self._samples[phase].append(seconds)
+            self._counts[phase] += 1
+
+    @contextmanager
+    def timer(self, phase):
+        """計時 with 區塊（發生例外時同樣記錄）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def stats(self):
+        with self._lock:
+            samples = {phase: sorted(values)
+                       for phase, values in self._samples.items()}
+            counts = dict(self._counts)
+            counters = dict(self._counters)
+
+        phases = {}
+        for phase, values in samples.items():
+            phases[phase] = {
+                'count': counts[phase],
+                'mean_ms': round(sum(values) / len(values) * 1000, 1),
+                'p50_ms': round(_percentile(values, 50) * 1000, 1),
+                'p95_ms': round(_percentile(values, 95) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1),
+            }
+        return {'phases': phases, 'counters': counters}
+
+
+metrics = PhaseMetrics()
@@ -0,0 +1,37 @@
+"""add_gift_vote_counters
+
+Revision ID: 8d2c6a4e7f13
+Revises: 5b8e1f2a9c41
+Create Date: 2026-10-17 10:03:27.551904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2c6a4e7f13'
+down_revision = '5b8e1f2a9c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('gifts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('creative_votes', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('blessing_votes', sa.Integer(), server_default='0', nullable=False))
+
+    # 由既有投票回填計數
+    op.execute("""
+        UPDATE gifts SET
+            creative_votes = (SELECT COUNT(*) FROM votes
+                              WHERE votes.gift_id = gifts.id AND votes.award_type = 'creative'),
+            blessing_votes = (SELECT COUNT(*) FROM votes
+                              WHERE votes.gift_id = gifts.id AND votes.award_type = 'blessing')
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('gifts', schema=None) as batch_op:
+        batch_op.drop_column('blessing_votes')
+        batch_op.drop_column('creative_votes')
@@ -0,0 +1,67 @@
+"""enforce_vote_quota_constraints
+
+Revision ID: a41f7c9e2b68
+Revises: 8d2c6a4e7f13
+Create Date: 2026-10-17 11:20:09.874512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f7c9e2b68'
+down_revision = '8d2c6a4e7f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('votes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('slot', sa.Integer(), nullable=True))
+
+    # 清除競態造成的重複投票（保留最早一筆）
+    op.execute("""
+        DELETE FROM votes WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY voter_fingerprint, gift_id, award_type
+                    ORDER BY created_at, id) AS rn
+                FROM votes) duplicated
+            WHERE rn > 1)
+    """)
+
+    # 依投票時間回填名額序號，並移除超過上限的投票
+    op.execute("""
+        UPDATE votes SET slot = ranked.rn
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY voter_fingerprint, award_type
+                ORDER BY created_at, id) AS rn
+            FROM votes) ranked
+        WHERE votes.id = ranked.id
+    """)
+    op.execute("DELETE FROM votes WHERE slot > 3")
+
+    # 刪除投票後重建票數計數
+    op.execute("""
+        UPDATE gifts SET
+            creative_votes = (SELECT COUNT(*) FROM votes
+                              WHERE votes.gift_id = gifts.id AND votes.award_type = 'creative'),
+            blessing_votes = (SELECT COUNT(*) FROM votes
+                              WHERE votes.gift_id = gifts.id AND votes.award_type = 'blessing')
+    """)
+
+    with op.batch_alter_table('votes', schema=None) as batch_op:
+        batch_op.alter_column('slot', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_unique_constraint('uq_vote_voter_gift_award', ['voter_fingerprint', 'gift_id', 'award_type'])
+        batch_op.create_unique_constraint('uq_vote_voter_award_slot', ['voter_fingerprint', 'award_type', 'slot'])
+        batch_op.create_check_constraint('ck_vote_slot_range', 'slot BETWEEN 1 AND 3')
+
+
+def downgrade():
+    with op.batch_alter_table('votes', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_vote_slot_range', type_='check')
+        batch_op.drop_constraint('uq_vote_voter_award_slot', type_='unique')
+        batch_op.drop_constraint('uq_vote_voter_gift_award', type_='unique')
+        batch_op.drop_column('slot')
@@ -1,8 +1,16 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
+from functools import lru_cache
+from operator import attrgetter
 
 db = SQLAlchemy()
 
+# 每位投票者每個獎項可投的票數
+VOTES_PER_AWARD = 3
+
 
 class Gift(db.Model):
     """禮物資料模型"""
@@ -20,7 +28,11 @@ class Gift(db.Model):
 
     # AI 生成結果
     ai_guess = db.Column(db.String(200))  # AI 猜測的禮物
+    # 產生 ai_guess 的線索雜湊（正規化線索 + 提示詞版本），線索未變更時沿用猜測
+    ai_guess_key = db.Column(db.String(64))
     image_url = db.Column(db.String(500))  # 生成的圖片 URL
+    # 圖片的 WebP 縮圖 {邊長: 相對路徑}，產生失敗或舊資料為 NULL
+    thumbnails = db.Column(db.JSON)
 
     # 圖片生成狀態追蹤
     # pending/processing/completed/failed
@@ -35,38 +47,80 @@ class Gift(db.Model):
     is_exchanged = db.Column(db.Boolean, default=False)  # 是否已被交換
     exchanged_with = db.Column(db.String(100))  # 與誰交換
 
+    # 票數計數（與投票寫入同一交易中更新，讀取結果時不需查 votes 表）
+    creative_votes = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    blessing_votes = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+
     # 時間戳記
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # 最後一次變更時的 'gifts' 計數器值（在持有計數器列鎖時寫入，順序與交易提交順序一致）
+    change_seq = db.Column(
+        db.BigInteger, nullable=False, default=0, server_default='0')
 
-    def to_dict(self, include_happiness=True):
-        """轉換為字典格式"""
-        data = {
-            'id': self.id,
-            'player_name': self.player_name,
-            'gift_name': self.gift_name,
-            'appearance': self.appearance,
-            'who_likes': self.who_likes,
-            'usage_time': self.usage_time,
-            'ai_guess': self.ai_guess,
-            'image_url': self.image_url,
-            'is_confirmed': self.is_confirmed,
-            'is_exchanged': self.is_exchanged,
-            'exchanged_with': self.exchanged_with,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'image_generation_status': self.image_generation_status,
-            'image_generation_started_at': self.image_generation_started_at.isoformat() if self.image_generation_started_at else None,
-            'image_generation_completed_at': self.image_generation_completed_at.isoformat() if self.image_generation_completed_at else None,
-            'image_generation_error': self.image_generation_error,
-            'image_generation_retry_count': self.image_generation_retry_count,
-        }
+    # 建立索引以支援增量查詢（updated_since 依更新時間，cursor 依 change_seq 的 keyset 分頁）
+    __table_args__ = (
+        db.Index('idx_gift_updated_at', 'updated_at', 'id'),
+        db.Index('idx_gift_change_seq', 'change_seq', 'id'),
+        db.Index('idx_gift_ai_guess_key', 'ai_guess_key'),
+    )
+
+    def to_dict(self, include_happiness=True, fields=None):
+        """轉換為字典格式；fields 為要輸出的欄位（見 parse_gift_fields）"""
+        if fields is None:
+            fields = GIFT_DEFAULT_FIELDS if include_happiness else GIFT_PUBLIC_FIELDS
+        return compile_gift_serializer(fields)(self)
+
+
+# Gift 對外輸出的欄位（依 to_dict 既有順序），幸福理由預設附加在最後
+GIFT_PUBLIC_FIELDS = (
+    'id', 'player_name', 'gift_name', 'appearance', 'who_likes', 'usage_time',
+    'ai_guess', 'image_url', 'thumbnails', 'is_confirmed', 'is_exchanged',
+    'exchanged_with', 'created_at', 'image_generation_status', 'image_generation_started_at',
+    'image_generation_completed_at', 'image_generation_error',
+    'image_generation_retry_count',
+)
+GIFT_DEFAULT_FIELDS = GIFT_PUBLIC_FIELDS + ('happiness_reason',)
+
+
+def parse_gift_fields(value, include_happiness=True):
+    """解析 fields 查詢參數（逗號分隔），回傳欄位 tuple；未指定時回傳 None
+
+    id 一律輸出；未知欄位拋出 ValueError。
+    """
+    if not value:
+        return None
 
-        # 預設包含幸福理由
-        if include_happiness:
-            data['happiness_reason'] = self.happiness_reason
+    allowed = GIFT_DEFAULT_FIELDS if include_happiness else GIFT_PUBLIC_FIELDS
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f"無效的欄位: {', '.join(sorted(unknown))}")
 
-        return data
+    requested.add('id')
+    return tuple(name for name in allowed if name in requested)
+
+
+def gift_load_options(fields, *extra):
+    """只載入輸出所需欄位（及 extra 欄位）的查詢選項；未指定欄位時載入全部"""
+    if fields is None:
+        return []
+    return [load_only(*[getattr(Gift, name) for name in fields + extra])]
+
+
+@lru_cache(maxsize=128)
+def compile_gift_serializer(fields):
+    """依欄位組合產生序列化函式（每種組合只建立一次）
+
+    datetime 欄位直接輸出物件，由 JSON provider 編碼為 ISO 8601。
+    """
+    getter = attrgetter(*fields)
+    if len(fields) == 1:
+        return lambda gift: {fields[0]: getter(gift)}
+    return lambda gift: dict(zip(fields, getter(gift)))
 
 
 class Vote(db.Model):
@@ -79,12 +133,20 @@ class Vote(db.Model):
     award_type = db.Column(db.String(50), nullable=False)
     voter_fingerprint = db.Column(db.String(255), nullable=False)  # 投票者指紋
     voter_ip = db.Column(db.String(50))  # IP 地址
+    # 投票者在此獎項使用的名額序號 (1..VOTES_PER_AWARD)
+    slot = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # 建立索引以提高查詢效率
+    # 建立索引以提高查詢效率；由資料庫約束保證不重複投票且不超過票數上限
     __table_args__ = (
         db.Index('idx_voter_fingerprint', 'voter_fingerprint'),
         db.Index('idx_gift_award', 'gift_id', 'award_type'),
+        db.UniqueConstraint('voter_fingerprint', 'gift_id', 'award_type',
+                            name='uq_vote_voter_gift_award'),
+        db.UniqueConstraint('voter_fingerprint', 'award_type', 'slot',
+                            name='uq_vote_voter_award_slot'),
+        db.CheckConstraint(f'slot BETWEEN 1 AND {VOTES_PER_AWARD}',
+                           name='ck_vote_slot_range'),
     )
 
     def to_dict(self):
@@ -93,5 +155,130 @@ class Vote(db.Model):
             'id': self.id,
             'gift_id': self.gift_id,
             'award_type': self.award_type,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'created_at': self.created_at,
         }
+
+
+class GenerationJob(db.Model):
+    """圖片生成背景工作資料模型"""
+    __tablename__ = 'generation_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    gift_id = db.Column(db.Integer, db.ForeignKey('gifts.id'), nullable=False)
+    # 'generate' 或 'regenerate'
+    job_type = db.Column(db.String(20), nullable=False, default='generate')
+    # pending/processing/completed/failed
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    # 不沿用快取的猜測，強制重新呼叫 AI 猜測禮物
+    new_guess = db.Column(db.Boolean, nullable=False,
+                          default=False, server_default=db.false())
+    # 批次生成時同一批的工作共用此 ID，由第一個執行的工作一次猜測整批禮物
+    batch_id = db.Column(db.String(32))
+    # 優先順序通道：0 第一次生成、1 重新生成、2 管理員批次補生成（見 job_queue）
+    priority = db.Column(db.SmallInteger, nullable=False,
+                         default=0, server_default='0')
+    worker_id = db.Column(db.String(100))  # 處理此工作的 worker
+    # 執行中工作的租約到期時間，由 worker 定期續約（見 job_queue）
+    lease_expires_at = db.Column(db.DateTime)
+    error = db.Column(db.Text)  # 錯誤訊息
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    # 建立索引以便 worker 快速取得待處理工作
+    __table_args__ = (
+        db.Index('idx_job_status_created', 'status', 'created_at'),
+        db.Index('idx_job_gift', 'gift_id'),
+        db.Index('idx_job_batch', 'batch_id'),
+        db.Index('idx_job_status_priority', 'status', 'priority', 'created_at'),
+        # 同一禮物最多一個進行中的工作（部分唯一索引，完成/失敗的工作不受限）
+        db.Index('uq_job_active_gift', 'gift_id', unique=True,
+                 postgresql_where=db.text("status IN ('pending', 'processing')"),
+                 sqlite_where=db.text("status IN ('pending', 'processing')")),
+    )
+
+    def to_dict(self):
+        """轉換為字典格式"""
+        return {
+            'id': self.id,
+            'gift_id': self.gift_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'new_guess': self.new_guess,
+            'batch_id': self.batch_id,
+            'priority': self.priority,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'completed_at': self.completed_at,
+        }
+
+
+class GiftNameTranslation(db.Model):
+    """禮物名稱翻譯快取（正規化後的中文名稱 -> 英文）"""
+    __tablename__ = 'gift_name_translations'
+
+    name = db.Column(db.String(100), primary_key=True)
+    translation = db.Column(db.String(200), nullable=False)
+    source = db.Column(db.String(20), nullable=False,
+                       default='llm')  # 'llm' 或 'csv'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ChangeCounter(db.Model):
+    """全域變更計數器（用於 ETag，不需載入資料列即可判斷資料是否變更）"""
+    __tablename__ = 'change_counters'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+def bump_change_counter(connection, name):
+    """在目前交易中將計數器加一，回傳新的值
+
+    UPDATE 會鎖住計數器列直到交易結束，同時修改的交易依序取得遞增的值，
+    取得較小值的交易一定較早提交。
+    """
+    counters = ChangeCounter.__table__
+    result = connection.execute(
+        update(counters)
+        .where(counters.c.name == name)
+        .values(value=counters.c.value + 1))
+    if result.rowcount == 0:
+        connection.execute(insert(counters).values(name=name, value=1))
+        return 1
+    return connection.execute(
+        select(counters.c.value).where(counters.c.name == name)).scalar()
+
+
+def get_change_counter(name):
+    """讀取計數器目前的值（單一主鍵查詢，不經過 ORM 物件）"""
+    counters = ChangeCounter.__table__
+    value = db.session.execute(
+        select(counters.c.value).where(counters.c.name == name)).scalar()
+    return value or 0
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_gift_counter(session, flush_context):
+    """任何禮物新增、修改或刪除時遞增 'gifts' 計數器，並把新值寫入變更的禮物"""
+    changed = [obj for obj in session.new | session.deleted
+               if isinstance(obj, Gift)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, Gift) and session.is_modified(obj)]
+    if not changed:
+        return
+    connection = session.connection()
+    seq = bump_change_counter(connection, 'gifts')
+    kept = [obj for obj in changed if obj not in session.deleted]
+    if kept:
+        gifts = Gift.__table__
+        connection.execute(
+            update(gifts)
+            .where(gifts.c.id.in_([obj.id for obj in kept]))
+            # 保留 updated_at（避免 onupdate 以不同的時間覆寫）
+            .values(change_seq=seq, updated_at=gifts.c.updated_at))
+        for obj in kept:
+            set_committed_value(obj, 'change_seq', seq)
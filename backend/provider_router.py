@@ -0,0 +1,144 @@
+"""圖片供應商路由：失敗時切換供應商，並可在主要供應商過慢時對沖（hedge）
+
+依序嘗試可用的供應商（目前設定的引擎優先）：
+- 失敗（例外或沒有圖片）時立即改用下一個供應商（failover）
+- 啟用對沖時，主要供應商超過其 p90 延遲仍未回應，就同時向下一個供應商
+  送出請求，取先成功的結果並取消另一個請求
+
+每個供應商記錄最近成功請求的延遲與勝出次數，供 /api/admin/metrics 查詢。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from metrics import metrics
+from retry_policy import SafetyFilterError
+
+LATENCY_SAMPLE_SIZE = 100
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class ProviderRouter:
+    """在多個圖片供應商之間 failover / hedge"""
+
+    def __init__(self, generate, hedge_enabled=False, hedge_percentile=90,
+                 hedge_min_samples=20, hedge_default_delay=45.0):
+        # generate(engine, prompt, deadline) 為協程，回傳圖片 bytes，失敗時拋出例外
+        self.generate = generate
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self.wins = {}
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self, engine):
+        """主要供應商的 p90 延遲（樣本不足時使用預設值）"""
+        with self._lock:
+            samples = list(self._latencies.get(engine, ()))
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return _percentile(samples, self.hedge_percentile)
+
+    async def route(self, engines, prompt, deadline=None):
+        """依 engines 順序產生圖片，回傳 (圖片 bytes, 勝出的供應商)
+
+        所有供應商都失敗時拋出最後一個錯誤；被安全過濾擋下時不改用其他供應商。
+        """
+        if not engines:
+            raise Exception("沒有可用的圖片生成供應商")
+
+        remaining = list(engines)
+        running = {}  # task -> (engine, 開始時間)
+        hedged = set()
+        last_error = None
+
+        def launch():
+            engine = remaining.pop(0)
+            task = asyncio.ensure_future(self.generate(engine, prompt, deadline))
+            running[task] = (engine, time.monotonic())
+            return engine
+
+        primary = launch()
+        hedge_at = time.monotonic() + self.hedge_delay(primary) \
+            if self.hedge_enabled and remaining else None
+
+        try:
+            while running:
+                timeout = None
+                if hedge_at is not None:
+                    timeout = max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 主要供應商超過 p90 延遲：同時向下一個供應商送出請求
+                    hedge_at = None
+                    engine = launch()
+                    hedged.add(engine)
+                    self.hedges += 1
+                    metrics.increment('image.hedges')
+                    print(f"⏱️  {primary} 超過 p90 延遲，同時改送 {engine}", flush=True)
+                    continue
+
+                for task in done:
+                    engine, started_at = running.pop(task)
+                    error = task.exception()
+                    if error is None and task.result():
+                        self._record_win(engine, time.monotonic() - started_at,
+                                         hedged=engine in hedged)
+                        return task.result(), engine
+                    last_error = error or Exception(f"{engine} 沒有回傳圖片")
+                    print(f"✗ {engine} 圖片生成失敗: {last_error}", flush=True)
+                    if isinstance(last_error, SafetyFilterError):
+                        raise last_error
+
+                # 失敗的供應商沒有其他請求在跑時，立即改用下一個供應商
+                if not running and remaining:
+                    hedge_at = None
+                    engine = launch()
+                    self.failovers += 1
+                    metrics.increment('image.failovers')
+                    print(f"🔀 改用 {engine} 生成圖片", flush=True)
+        finally:
+            # 取消落後的請求（名額由 image_slot 歸還，不計入供應商過載）
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        raise last_error
+
+    def _record_win(self, engine, latency, hedged):
+        with self._lock:
+            self._latencies.setdefault(
+                engine, deque(maxlen=LATENCY_SAMPLE_SIZE)).append(latency)
+            self.wins[engine] = self.wins.get(engine, 0) + 1
+            if hedged:
+                self.hedge_wins += 1
+        metrics.increment(f'image.winner.{engine}')
+        print(f"🏁 {engine} 完成圖片生成 ({latency:.1f}s)", flush=True)
+
+    def stats(self):
+        with self._lock:
+            latencies = {engine: list(samples)
+                         for engine, samples in self._latencies.items()}
+            wins = dict(self.wins)
+        return {
+            'hedge_enabled': self.hedge_enabled,
+            'wins': wins,
+            'failovers': self.failovers,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'p90_latency_ms': {
+                engine: round(_percentile(samples, 90) * 1000, 1)
+                for engine, samples in latencies.items() if samples},
+        }
@@ -0,0 +1,150 @@
+"""讀取量大的 API 回應快取：儲存已序列化的 JSON bytes
+
+預設使用行程內 LRU（含 TTL）；設定 RESPONSE_CACHE_BACKEND=redis 可改用
+本機 Redis 相容服務，讓多個行程共用快取與失效。
+"""
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+
+class MemoryCacheBackend:
+    """行程內 LRU 快取（含 TTL）"""
+
+    def __init__(self, max_entries, default_ttl):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+class RedisCacheBackend:
+    """Redis 相容服務快取（多個行程共用）"""
+
+    def __init__(self, url, default_ttl, namespace='giftgame:cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.namespace + key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.namespace + key, value,
+                        ex=int(ttl or self.default_ttl))
+
+    def delete(self, key):
+        self.client.delete(self.namespace + key)
+
+    def delete_prefix(self, prefix):
+        keys = list(self.client.scan_iter(match=f"{self.namespace}{prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        self.delete_prefix('')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'backend': 'redis',
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        try:
+            stats['evictions'] = self.client.info('stats').get('evicted_keys', 0)
+        except Exception as e:
+            stats['error'] = str(e)
+        return stats
+
+
+def create_cache_backend():
+    """依設定建立快取後端，Redis 無法使用時退回行程內快取"""
+    if Config.RESPONSE_CACHE_BACKEND == 'redis':
+        try:
+            backend = RedisCacheBackend(
+                Config.RESPONSE_CACHE_REDIS_URL, Config.RESPONSE_CACHE_TTL)
+            backend.client.ping()
+            print(
+                f"Response cache: redis ({Config.RESPONSE_CACHE_REDIS_URL})", flush=True)
+            return backend
+        except ImportError:
+            print("Warning: redis not installed, using in-memory response cache", flush=True)
+        except Exception as e:
+            print(
+                f"Warning: Redis unavailable ({e}), using in-memory response cache", flush=True)
+
+    return MemoryCacheBackend(
+        Config.RESPONSE_CACHE_MAX_ENTRIES, Config.RESPONSE_CACHE_TTL)
+
+
+response_cache = create_cache_backend()
@@ -0,0 +1,110 @@
+"""圖片生成的重試策略
+
+- 等待時間使用 decorrelated jitter 指數退避：下一次等待為
+  uniform(base_delay, 上一次等待 × 3)，上限 max_delay，避免同時失敗的
+  請求在同一時間一起重試
+- 供應商回傳 Retry-After / retry-after-ms 標頭或 Google RetryInfo
+  (retryDelay) 時，至少等待該秒數
+- 安全過濾、4xx 請求錯誤與斷路器開啟屬於不可重試的錯誤，立即失敗
+- 整個生成（含等待並發名額與重試間隔）共用一個期限，剩餘時間不足以
+  再等待一次時放棄
+"""
+import random
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from adaptive_limiter import error_status
+from circuit_breaker import CircuitOpenError
+
+# 4xx 中仍可重試的狀態碼（逾時、衝突、頻率限制）
+RETRYABLE_CLIENT_STATUSES = (408, 409, 429)
+
+SAFETY_MARKERS = ('moderation_blocked', 'content_policy_violation',
+                  'safety system', 'safety_violations', 'rai_filtered')
+
+# google-genai 的 429 錯誤內容：'retryDelay': '30s'
+RETRY_DELAY_PATTERN = re.compile(
+    r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s")
+
+
+class TerminalError(Exception):
+    """不應重試的圖片生成錯誤（例如設定缺失）"""
+
+
+class SafetyFilterError(TerminalError):
+    """提示詞或圖片被供應商的安全過濾擋下"""
+
+
+def is_safety_block(error):
+    if isinstance(error, SafetyFilterError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in SAFETY_MARKERS)
+
+
+def is_terminal_error(error):
+    """判斷錯誤是否不應重試（安全過濾、4xx 請求錯誤、斷路器開啟）"""
+    if isinstance(error, (TerminalError, CircuitOpenError)) or is_safety_block(error):
+        return True
+    status = error_status(error)
+    return status is not None and 400 <= status < 500 \
+        and status not in RETRYABLE_CLIENT_STATUSES
+
+
+def retry_after_hint(error):
+    """供應商建議的重試等待秒數，沒有提示時回傳 None"""
+    retry_after = getattr(error, 'retry_after', None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers:
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except (KeyError, TypeError, ValueError):
+            pass
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+            try:
+                retry_at = parsedate_to_datetime(value)
+                return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+
+    match = RETRY_DELAY_PATTERN.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class RetryPolicy:
+    """重試次數、退避時間與整體期限"""
+
+    def __init__(self, max_retries, base_delay=2.0, max_delay=30.0,
+                 deadline=None, rng=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max(base_delay, max_delay)
+        self.deadline = deadline  # 整體期限（秒），None 表示不限制
+        self._rng = rng or random.Random()
+
+    def deadline_from_now(self):
+        """本次生成的期限（time.monotonic() 時間），不限制時回傳 None"""
+        return time.monotonic() + self.deadline if self.deadline else None
+
+    def next_delay(self, error, previous_delay, deadline=None):
+        """下一次重試前等待的秒數；剩餘時間不足以等待時回傳 None
+
+        previous_delay 為上一次的等待秒數（第一次重試傳入 base_delay）。
+        """
+        delay = min(self.max_delay, self._rng.uniform(
+            self.base_delay, max(self.base_delay, previous_delay * 3)))
+        hint = retry_after_hint(error)
+        if hint is not None:
+            delay = max(delay, hint)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
@@ -0,0 +1,48 @@
+"""Single-flight：相同鍵的並發呼叫合併為一次上游請求
+
+第一個呼叫者實際執行，其餘呼叫者等待並共用同一個結果（或例外）。
+"""
+import threading
+
+
+class _Call:
+    """進行中的呼叫"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """以鍵合併並發呼叫"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """執行 func()，回傳 (結果, 是否共用其他呼叫者的結果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
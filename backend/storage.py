@@ -0,0 +1,238 @@
+"""圖片儲存後端
+
+- MinioStorage：以預簽章 URL 透過 httpx 非同步上傳（連線數依生成並發上限設定，
+  keep-alive 重複使用連線）；超過 multipart_threshold 的物件交給 SDK 的
+  put_object 在執行緒中分段並行上傳。bucket 在第一次上傳時才確認，建立時不連線。
+- LocalStorage：寫入本機目錄（<root>/<bucket>/<key>），測試與離線執行不需要物件儲存；
+  圖片由後端的 /api/storage/<bucket>/<key> 提供。
+
+upload() 回傳前端使用的路徑（資料可為 bytes 或 memoryview）：MinIO 為 /<bucket>/<key>
+（前端加上 MinIO 的主機與連接埠），本機為 /api/storage/<bucket>/<key>（經由後端）。
+
+SDK 的同步呼叫（確認 bucket、預簽章、multipart）都在執行緒中執行，不阻塞事件迴圈；
+未指定 region 時預簽章需要查詢 bucket 位置。
+"""
+import asyncio
+import os
+from datetime import timedelta
+import httpx
+import urllib3
+from minio import Minio
+from config import Config
+
+# 上傳時每次送出的大小
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# S3 multipart 每段最小 5 MB（最後一段除外）
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# 本機儲存的圖片路徑前綴（app.py 的路由）
+LOCAL_URL_PREFIX = '/api/storage'
+
+PRESIGNED_URL_EXPIRES = timedelta(minutes=15)
+
+
+async def _iter_chunks(view):
+    """以 memoryview 切片分段送出上傳內容（切片不複製資料）"""
+    for offset in range(0, view.nbytes, UPLOAD_CHUNK_SIZE):
+        yield view[offset:offset + UPLOAD_CHUNK_SIZE]
+
+
+class _ViewReader:
+    """memoryview 的 read() 介面（SDK 的 put_object 每次讀取一段，不先複製整個物件）"""
+
+    def __init__(self, view):
+        self.view = view
+        self.offset = 0
+
+    def read(self, size=-1):
+        end = self.view.nbytes if size < 0 else min(self.offset + size, self.view.nbytes)
+        chunk = self.view[self.offset:end].tobytes()
+        self.offset = end
+        return chunk
+
+
+class MinioStorage:
+    """MinIO / S3 相容物件儲存"""
+
+    def __init__(self, endpoint, access_key, secret_key, bucket, secure=False,
+                 region=None, max_connections=10, multipart_threshold=8 * 1024 * 1024,
+                 part_size=MIN_PART_SIZE, public_url='', transport=None):
+        self.bucket = bucket
+        self.location = endpoint
+        self.public_url = public_url  # 瀏覽器存取 MinIO 的網址（MINIO_PUBLIC_URL）
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_connections = max_connections
+        # SDK 的同步呼叫（確認 bucket、multipart）使用固定大小的 urllib3 連線池
+        self.client = Minio(
+            endpoint, access_key=access_key, secret_key=secret_key,
+            secure=secure,
+            # 指定 region，產生預簽章 URL 時不需查詢 bucket 位置
+            region=region,
+            http_client=urllib3.PoolManager(
+                maxsize=max_connections, block=False,
+                timeout=urllib3.Timeout(connect=10.0, read=60.0),
+                retries=urllib3.Retry(total=3, backoff_factor=0.2,
+                                      status_forcelist=[500, 502, 503, 504])))
+        # 物件內容以 httpx 非同步上傳，keep-alive 連線數與並發上限一致
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections,
+                                keepalive_expiry=60.0),
+            transport=transport)
+        self._bucket_checked = None
+        self.bucket_verified = False
+        self.uploads = 0
+        self.multipart_uploads = 0
+        self.bytes_uploaded = 0
+
+    @property
+    def name(self):
+        return 'minio'
+
+    def full_url(self, path):
+        """upload() 回傳路徑的完整網址（記錄用）"""
+        return f"{self.public_url}{path}"
+
+    async def ensure_bucket(self):
+        """第一次上傳時確認 bucket 存在（之後不再查詢）"""
+        if self._bucket_checked is None:
+            self._bucket_checked = asyncio.ensure_future(asyncio.to_thread(
+                self.client.bucket_exists, self.bucket))
+        try:
+            exists = await asyncio.shield(self._bucket_checked)
+        except Exception:
+            # 確認失敗時下次上傳再試
+            self._bucket_checked = None
+            raise
+        if not exists:
+            self._bucket_checked = None
+            raise Exception(f"Bucket {self.bucket} does not exist")
+        self.bucket_verified = True
+
+    async def upload(self, key, data, content_type='application/octet-stream'):
+        view = memoryview(data)
+        await self.ensure_bucket()
+        if view.nbytes > self.multipart_threshold:
+            await self._upload_multipart(key, view, content_type)
+        else:
+            url = await asyncio.to_thread(
+                self.client.presigned_put_object, self.bucket, key,
+                expires=PRESIGNED_URL_EXPIRES)
+            await self._put(url, view, content_type)
+        self.uploads += 1
+        self.bytes_uploaded += view.nbytes
+        return f"/{self.bucket}/{key}"
+
+    async def _put(self, url, view, content_type=None):
+        headers = {'Content-Length': str(view.nbytes)}
+        if content_type:
+            headers['Content-Type'] = content_type
+        response = await self.http_client.put(
+            url, content=_iter_chunks(view), headers=headers)
+        response.raise_for_status()
+        return response
+
+    async def _upload_multipart(self, key, view, content_type):
+        """分段並行上傳：SDK 的 put_object 在執行緒中以 part_size 分段，失敗時取消 multipart
+
+        上傳在執行緒中進行，呼叫端被取消時仍會上傳完成（或失敗後由 SDK 取消）。
+        """
+        parts = -(-view.nbytes // self.part_size)
+        await asyncio.to_thread(
+            self.client.put_object, self.bucket, key, _ViewReader(view), view.nbytes,
+            content_type=content_type, part_size=self.part_size,
+            num_parallel_uploads=max(1, min(parts, self.max_connections)))
+        self.multipart_uploads += 1
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'bucket': self.bucket,
+            'max_connections': self.max_connections,
+            'bucket_verified': self.bucket_verified,
+            'uploads': self.uploads,
+            'multipart_uploads': self.multipart_uploads,
+            'bytes_uploaded': self.bytes_uploaded,
+        }
+
+
+class LocalStorage:
+    """本機目錄儲存（測試與離線執行用）"""
+
+    def __init__(self, root, bucket, url_prefix=LOCAL_URL_PREFIX):
+        self.root = root
+        self.location = root
+        self.bucket = bucket
+        self.url_prefix = url_prefix
+        self.uploads = 0
+        self.bytes_uploaded = 0
+
+    @property
+    def name(self):
+        return 'local'
+
+    @property
+    def directory(self):
+        """bucket 對應的本機目錄"""
+        return os.path.abspath(os.path.join(self.root, self.bucket))
+
+    def full_url(self, path):
+        """upload() 回傳路徑的完整網址（記錄用；本機圖片經由後端提供）"""
+        return path
+
+    def path(self, key):
+        """物件在本機的檔案路徑"""
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if not path.startswith(self.directory + os.sep):
+            raise ValueError(f"無效的物件名稱: {key}")
+        return path
+
+    async def ensure_bucket(self):
+        await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+
+    async def upload(self, key, data, content_type='application/octet-stream'):
+        view = memoryview(data)
+        await self.ensure_bucket()
+        await asyncio.to_thread(self._write, self.path(key), view)
+        self.uploads += 1
+        self.bytes_uploaded += view.nbytes
+        return f"{self.url_prefix}/{self.bucket}/{key}"
+
+    @staticmethod
+    def _write(path, view):
+        # 先寫入暫存檔再改名，讀取端不會看到寫到一半的檔案
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(view)
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        return {
+            'backend': self.name,
+            'bucket': self.bucket,
+            'root': self.root,
+            'uploads': self.uploads,
+            'bytes_uploaded': self.bytes_uploaded,
+        }
+
+
+def create_storage():
+    """依 STORAGE_BACKEND 建立儲存後端"""
+    if Config.STORAGE_BACKEND == 'local':
+        return LocalStorage(Config.LOCAL_STORAGE_DIR, Config.MINIO_BUCKET)
+    if Config.STORAGE_BACKEND != 'minio':
+        raise ValueError(f"未知的儲存後端: {Config.STORAGE_BACKEND}")
+    return MinioStorage(
+        Config.MINIO_ENDPOINT,
+        access_key=Config.MINIO_ACCESS_KEY,
+        secret_key=Config.MINIO_SECRET_KEY,
+        bucket=Config.MINIO_BUCKET,
+        secure=Config.MINIO_USE_SSL,
+        region=Config.MINIO_REGION,
+        max_connections=Config.STORAGE_MAX_CONNECTIONS,
+        multipart_threshold=Config.STORAGE_MULTIPART_THRESHOLD,
+        part_size=Config.STORAGE_PART_SIZE,
+        public_url=Config.MINIO_PUBLIC_URL)
@@ -0,0 +1,141 @@
+"""背景工作處理函式（由 job_queue 的 worker 執行）"""
+from datetime import datetime
+from models import db, Gift, GenerationJob
+from gemini_service import gemini_service
+from job_queue import job_queue, AsyncResult, ACTIVE_JOB_STATUSES
+from guess_cache import guess_cache
+from events import event_broker
+from metrics import metrics
+
+
+def estimate_generation_queue(gift_id, queue_info):
+    """禮物進行中工作的排隊順位與預估時間，沒有進行中的工作時回傳 None"""
+    job = (GenerationJob.query
+           .filter(GenerationJob.gift_id == gift_id,
+                   GenerationJob.status.in_(ACTIVE_JOB_STATUSES))
+           .order_by(GenerationJob.id.desc())
+           .first())
+    if job is None:
+        return None
+    return job_queue.estimate(job, capacity=queue_info['max_concurrent'])
+
+
+def publish_generation_status(gift):
+    """推送禮物生成狀態變更事件"""
+    queue_info = gemini_service.get_queue_info()
+    event_broker.publish('generation-status-changed', {
+        'gift_id': gift.id,
+        'status': gift.image_generation_status,
+        'retry_count': gift.image_generation_retry_count,
+        'error': gift.image_generation_error,
+        'queue_info': queue_info,
+        'queue': estimate_generation_queue(gift.id, queue_info),
+        'gift': gift.to_dict(include_happiness=False)
+    })
+
+
+def run_generation_job(job):
+    """使用 AI 猜測禮物並生成圖片（含重試機制），驅動 Gift 的生成狀態
+
+    猜測與提示詞在 worker 執行緒中完成；圖片生成交給事件迴圈，回傳 AsyncResult，
+    worker 不等待圖片即可領取下一個工作，結果由 finish_generation 寫入。
+    """
+    gift = db.session.get(Gift, job.gift_id)
+    if gift is None:
+        raise Exception(f"禮物不存在: {job.gift_id}")
+    gift_id = gift.id
+
+    # 記錄開始生成
+    gift.image_generation_status = 'processing'
+    gift.image_generation_started_at = datetime.utcnow()
+    gift.image_generation_completed_at = None
+    gift.image_generation_error = None
+    gift.image_generation_retry_count = 0
+    db.session.commit()
+    publish_generation_status(gift)
+
+    try:
+        with metrics.timer('text'):
+            if job.batch_id and not job.new_guess:
+                # 批次生成：整批禮物以一次 AI 請求猜測，之後直接命中猜測快取
+                guess_cache.prime_batch(job.batch_id)
+                db.session.refresh(gift)
+
+            # 使用 Gemini 猜測禮物（線索未變更時沿用快取的猜測，new_guess 可強制重新猜測）
+            ai_guess, ai_guess_key = guess_cache.guess(
+                gift, bypass=job.new_guess)
+            if (gift.ai_guess, gift.ai_guess_key) != (ai_guess, ai_guess_key):
+                # 先保存猜測，圖片生成失敗後重新生成時不需再次猜測
+                gift.ai_guess = ai_guess
+                gift.ai_guess_key = ai_guess_key
+                db.session.commit()
+
+            # 生成圖片提示詞（猜測時已取得英文名稱則直接命中翻譯快取）
+            image_prompt = gemini_service.generate_gift_image_prompt(
+                ai_guess,
+                gift.appearance,
+                gift.who_likes
+            )
+    except Exception as e:
+        fail_generation(gift_id, e)
+        raise
+
+    # 使用 AI 生成圖片並上傳到 MinIO（含自動重試）
+    async def generate_image():
+        with metrics.timer('image'):
+            return await gemini_service.generate_gift_image_with_retry_async(image_prompt)
+
+    return AsyncResult(
+        gemini_service.runner.submit(generate_image()),
+        then=lambda result: finish_generation(gift_id, ai_guess, *result),
+        on_error=lambda e: fail_generation(gift_id, e))
+
+
+def fail_generation(gift_id, error):
+    """生成失敗，記錄錯誤"""
+    db.session.rollback()
+    gift = db.session.get(Gift, gift_id)
+    if gift is None:
+        return
+    gift.image_generation_status = 'failed'
+    gift.image_generation_completed_at = datetime.utcnow()
+    gift.image_generation_error = str(error)
+    db.session.commit()
+    publish_generation_status(gift)
+
+
+def finish_generation(gift_id, ai_guess, image_url, retry_count):
+    """圖片生成完成後更新禮物記錄（在工作佇列的完成執行緒中呼叫）"""
+    if not image_url:
+        error = Exception("圖片生成失敗")
+        fail_generation(gift_id, error)
+        raise error
+    gift = db.session.get(Gift, gift_id)
+    if gift is None:
+        raise Exception(f"禮物不存在: {gift_id}")
+
+    # 更新禮物記錄（新圖片的縮圖稍後寫入）
+    gift.ai_guess = ai_guess
+    gift.image_url = image_url
+    gift.thumbnails = None
+    gift.image_generation_status = 'completed'
+    gift.image_generation_completed_at = datetime.utcnow()
+    gift.image_generation_retry_count = retry_count
+    db.session.commit()
+    publish_generation_status(gift)
+
+    # 縮圖在上傳原圖後已於 process pool 中產生；不等待，完成時再寫入並推送
+    if not gemini_service.on_thumbnails(
+            image_url, lambda thumbnails: attach_thumbnails(gift_id, image_url, thumbnails)):
+        print(f"⚠️  禮物 {gift_id} 沒有縮圖工作，thumbnails 維持 null", flush=True)
+
+
+def attach_thumbnails(gift_id, image_url, thumbnails):
+    """縮圖完成後寫入禮物並推送（在背景執行緒中呼叫）；期間已換新圖時略過"""
+    with job_queue.app.app_context():
+        gift = db.session.get(Gift, gift_id)
+        if gift is None or gift.image_url != image_url:
+            return
+        gift.thumbnails = thumbnails
+        db.session.commit()
+        publish_generation_status(gift)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+測試 SSE 串流在 gunicorn gthread worker 下的連線上限
+
+以 gunicorn.conf.py 啟動真正的 gunicorn（保留 4 個串流執行緒、串流最長 3 秒），
+同時開啟 3 倍於串流執行緒數的 /api/events 連線，驗證:
+1. 只有串流執行緒數個連線被接受，其餘立即收到 503 與 Retry-After
+2. 串流佔滿名額時一般 API 請求仍能立即回應（執行緒沒有被串流耗盡）
+3. 串流到達最長存活時間後結束，被拒絕的客戶端重新連線可以取得名額
+
+預設使用暫存的 SQLite 資料庫與本機圖片儲存。
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+STREAM_THREADS = 4
+SUBSCRIBERS = 3 * STREAM_THREADS
+MAX_LIFETIME = 3
+
+workdir = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'test_streams.db')}"
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['LOCAL_STORAGE_DIR'] = os.path.join(workdir, 'storage')
+os.environ['GUNICORN_STREAM_THREADS'] = str(STREAM_THREADS)
+os.environ['EVENT_STREAM_MAX_LIFETIME'] = str(MAX_LIFETIME)
+os.environ['EVENT_STREAM_HEARTBEAT'] = '1'
+os.environ['GUNICORN_ACCESS_LOG'] = os.devnull
+
+from app import app  # noqa: E402
+from models import db  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server():
+    """建立資料表並以 gunicorn.conf.py 啟動 gunicorn，回傳 (行程, base_url)"""
+    with app.app_context():
+        db.create_all()
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}/api/health", timeout=1)
+            return server, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("gunicorn 沒有在 30 秒內啟動")
+
+
+def open_stream(base_url, results, lock):
+    """開啟一個 SSE 連線並讀到伺服器結束為止，記錄狀態碼與連線時間"""
+    start = time.monotonic()
+    try:
+        response = requests.get(f"{base_url}/api/events", stream=True,
+                                timeout=MAX_LIFETIME + 10)
+        status = response.status_code
+        retry_after = response.headers.get('Retry-After')
+        if status == 200:
+            for _ in response.iter_lines():
+                pass
+        response.close()
+    except requests.RequestException as e:
+        status, retry_after = f"錯誤: {e}", None
+    with lock:
+        results.append((status, retry_after, time.monotonic() - start))
+
+
+def test_stream_limit():
+    """測試: 訂閱數超過串流執行緒數"""
+    print("\n" + "="*70)
+    print(f"測試: {SUBSCRIBERS} 個 SSE 訂閱者，{STREAM_THREADS} 個串流執行緒 "
+          f"(串流最長 {MAX_LIFETIME} 秒)")
+    print("="*70)
+
+    server, base_url = start_server()
+    try:
+        results = []
+        lock = threading.Lock()
+        streams = [threading.Thread(target=open_stream, args=(base_url, results, lock))
+                   for _ in range(SUBSCRIBERS)]
+        for thread in streams:
+            thread.start()
+        time.sleep(0.5)
+
+        # 串流名額用完時，一般請求仍應立即回應
+        latencies = []
+        statuses = []
+        for path in ['/api/health', '/api/gifts', '/api/voting/results'] * 5:
+            start = time.perf_counter()
+            try:
+                statuses.append(requests.get(base_url + path, timeout=5).status_code)
+            except requests.RequestException:
+                statuses.append(None)
+            latencies.append(time.perf_counter() - start)
+
+        for thread in streams:
+            thread.join()
+
+        # 串流到期結束後，被拒絕的客戶端重新連線可以取得名額
+        retry = []
+        open_stream(base_url, retry, lock)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    accepted = [r for r in results if r[0] == 200]
+    rejected = [r for r in results if r[0] == 503]
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"接受的串流: {len(accepted)}，連線時間: "
+          f"{[round(r[2], 1) for r in accepted]} 秒")
+    print(f"拒絕的串流: {len(rejected)}，Retry-After: {sorted({r[1] for r in rejected})}")
+    print(f"其他結果: {[r for r in results if r[0] not in (200, 503)]}")
+    print(f"一般請求狀態: {sorted(set(statuses), key=str)}，最長 {max(latencies) * 1000:.0f} ms")
+    print(f"串流到期後重新連線: {retry[0][0]}")
+
+    if len(accepted) == STREAM_THREADS \
+            and len(rejected) == SUBSCRIBERS - STREAM_THREADS \
+            and all(r[1] for r in rejected) \
+            and all(r[2] <= MAX_LIFETIME + 2 for r in accepted) \
+            and all(s == 200 for s in statuses) and max(latencies) < 2 \
+            and retry[0][0] == 200:
+        print("✅ 測試通過: 超過名額的串流被拒絕，一般請求不受影響，串流到期後可重新連線")
+        return True
+    print("❌ 測試失敗: 串流佔滿執行緒或未依上限拒絕")
+    return False
+
+
+def main():
+    tests = [
+        ("SSE 串流連線上限", test_stream_limit),
+    ]
+
+    results = []
+    for name, func in tests:
+        try:
+            results.append((name, func()))
+        except Exception as e:
+            print(f"\n❌ 測試 '{name}' 發生異常: {e}")
+            import traceback
+            traceback.print_exc()
+            results.append((name, False))
+
+    print("\n" + "="*70)
+    print("測試總結")
+    print("="*70)
+    for name, passed in results:
+        print(f"{'✅ 通過' if passed else '❌ 失敗'} - {name}")
+    passed = sum(1 for _, ok in results if ok)
+    print(f"\n總計: {passed}/{len(results)} 個測試通過")
+    return passed == len(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
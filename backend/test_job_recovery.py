@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+測試生成工作的租約與重複工作防護
+
+驗證:
+1. 同時對同一禮物建立工作時只會寫入一筆，所有請求拿到同一個工作
+2. 行程當掉留下的 processing 工作（租約過期）在啟動時被收回並重新執行，
+   租約仍有效的工作（其他行程執行中）不受影響
+3. 執行時間超過租約的工作會被持續續約，不會被重複執行
+4. 執行中的行程定期收回其他行程遺留的過期工作
+5. 工作被收回並交給其他 worker 後，原本的 worker 才完成時不覆寫新擁有者的狀態
+6. 建立工作時禮物的生成狀態與工作在同一個交易中寫入，worker 拿到工作時狀態已重置
+7. 處理函式把 I/O 交給事件迴圈時 worker 不等待，同時執行中的工作數由
+   max_in_flight 限制，與 worker 執行緒數無關
+
+預設使用暫存的 SQLite 資料庫；設定 TEST_DATABASE_URL 可改用 PostgreSQL
+（注意：會清空該資料庫的資料表）。
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# 必須在載入 app 之前設定；租約縮短為 2 秒，每約 0.7 秒續約/收回一次
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_job_recovery.db')}"
+os.environ['JOB_WORKER_COUNT'] = '0'
+os.environ['JOB_LEASE_SECONDS'] = '2'
+
+from app import app  # noqa: E402
+from config import Config  # noqa: E402
+from gemini_service import gemini_service  # noqa: E402
+from job_queue import AsyncResult, JobQueue, job_queue  # noqa: E402
+from models import db, Gift, GenerationJob  # noqa: E402
+
+
+def setup_gifts(count):
+    """重建資料表並建立禮物"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(count):
+            db.session.add(Gift(
+                player_name=f'玩家{i}', gift_name=f'禮物{i}', appearance='圓形',
+                who_likes='上班族', usage_time='早上', happiness_reason='溫暖',
+                image_generation_status='pending'))
+        db.session.commit()
+        return [gift_id for (gift_id,) in db.session.query(Gift.id).order_by(Gift.id)]
+
+
+def make_queue(worker_count, handler, max_in_flight=None):
+    """建立獨立的工作佇列，'generate' 工作由 handler 執行"""
+    queue = JobQueue()
+    queue.init_app(app)
+    queue.worker_count = worker_count
+    queue.max_in_flight = max_in_flight or worker_count
+    queue.register('generate', handler)
+    return queue
+
+
+def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.1)
+    return predicate()
+
+
+def job_statuses():
+    with app.app_context():
+        return {job.id: job.status for job in GenerationJob.query}
+
+
+def test_concurrent_enqueue():
+    """測試 1: 同時建立同一禮物的工作"""
+    print("\n" + "="*70)
+    print("測試 1: 20 個請求同時為同一禮物建立工作")
+    print("="*70)
+
+    gift_id = setup_gifts(1)[0]
+    queue = make_queue(0, lambda job: None)
+    barrier = threading.Barrier(20)
+    results = []
+    errors = []
+
+    def request():
+        with app.app_context():
+            try:
+                barrier.wait()
+                job, created = queue.enqueue(gift_id)
+                results.append((job.id, created))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        rows = GenerationJob.query.filter_by(gift_id=gift_id).count()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"資料表中的工作數: {rows}")
+    print(f"回傳的工作 ID: {sorted({job_id for job_id, _ in results})}")
+    print(f"新建立的次數: {sum(1 for _, created in results if created)}")
+    print(f"錯誤: {errors}")
+
+    if rows == 1 and not errors and len(results) == 20 \
+            and len({job_id for job_id, _ in results}) == 1 \
+            and sum(1 for _, created in results if created) == 1:
+        print("✅ 測試通過: 只建立一個工作，其他請求拿到同一個工作")
+        return True
+    print("❌ 測試失敗: 同一禮物出現多個進行中的工作")
+    return False
+
+
+def test_recover_expired_lease():
+    """測試 2: 啟動時收回租約過期的工作"""
+    print("\n" + "="*70)
+    print("測試 2: 行程當掉後遺留的 processing 工作")
+    print("="*70)
+
+    dead_gift, live_gift = setup_gifts(2)
+    with app.app_context():
+        now = datetime.utcnow()
+        dead = GenerationJob(gift_id=dead_gift, status='processing',
+                             worker_id='job-worker-99999-0', started_at=now,
+                             lease_expires_at=now - timedelta(seconds=30))
+        live = GenerationJob(gift_id=live_gift, status='processing',
+                             worker_id='job-worker-88888-0', started_at=now,
+                             lease_expires_at=now + timedelta(minutes=10))
+        db.session.add_all([dead, live])
+        db.session.commit()
+        dead_id, live_id = dead.id, live.id
+
+    ran = []
+    queue = make_queue(1, lambda job: ran.append(job.id))
+    # 重新啟動前再次請求生成，拿到的是遺留的工作而不是新工作
+    with app.app_context():
+        before_restart, created = queue.enqueue(dead_gift)
+        before_restart_id = before_restart.id
+        db.session.remove()
+
+    queue.start()
+    try:
+        finished = wait_until(lambda: job_statuses()[dead_id] == 'completed', 5)
+    finally:
+        queue.shutdown(timeout=5)
+    statuses = job_statuses()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"重新啟動前 enqueue 回傳: 工作 {before_restart_id} (新建立: {created})")
+    print(f"執行過的工作: {ran}")
+    print(f"工作狀態: 過期 {statuses[dead_id]}，租約有效 {statuses[live_id]}")
+
+    if finished and ran == [dead_id] and before_restart_id == dead_id and not created \
+            and statuses[live_id] == 'processing':
+        print("✅ 測試通過: 過期的工作被收回重新執行，租約有效的工作不受影響")
+        return True
+    print("❌ 測試失敗: 遺留的工作沒有被正確收回")
+    return False
+
+
+def test_lease_renewal():
+    """測試 3: 長時間執行的工作持續續約"""
+    print("\n" + "="*70)
+    print(f"測試 3: 執行 {3 * Config.JOB_LEASE_SECONDS} 秒的工作 "
+          f"(租約 {Config.JOB_LEASE_SECONDS} 秒)")
+    print("="*70)
+
+    gift_id = setup_gifts(1)[0]
+    runs = []
+
+    def slow_handler(job):
+        runs.append(job.id)
+        time.sleep(3 * Config.JOB_LEASE_SECONDS)
+
+    # 兩個 worker：若租約沒有續約，另一個 worker 會收回並重複執行
+    queue = make_queue(2, slow_handler)
+    with app.app_context():
+        job, _ = queue.enqueue(gift_id)
+        job_id = job.id
+        db.session.remove()
+
+    queue.start()
+    leases = []
+    try:
+        wait_until(lambda: runs, 5)
+        for _ in range(int(2 * Config.JOB_LEASE_SECONDS)):
+            time.sleep(1)
+            with app.app_context():
+                current = db.session.get(GenerationJob, job_id)
+                leases.append((current.lease_expires_at - datetime.utcnow()).total_seconds())
+        finished = wait_until(lambda: job_statuses()[job_id] == 'completed',
+                              3 * Config.JOB_LEASE_SECONDS)
+    finally:
+        queue.shutdown(timeout=10)
+    with app.app_context():
+        lease_after = db.session.get(GenerationJob, job_id).lease_expires_at
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"執行期間租約剩餘秒數: {[round(s, 1) for s in leases]}")
+    print(f"執行次數: {len(runs)}，完成後租約: {lease_after}")
+
+    if finished and runs == [job_id] and all(s > 0 for s in leases) and lease_after is None:
+        print("✅ 測試通過: 租約持續續約，工作只執行一次")
+        return True
+    print("❌ 測試失敗: 執行中的工作租約過期或被重複執行")
+    return False
+
+
+def test_reclaim_while_running():
+    """測試 4: 執行中的行程收回其他行程遺留的工作"""
+    print("\n" + "="*70)
+    print("測試 4: 其他行程在執行期間當掉")
+    print("="*70)
+
+    gift_id = setup_gifts(1)[0]
+    ran = []
+    queue = make_queue(1, lambda job: ran.append(job.id))
+    queue.start()
+    try:
+        # 模擬另一個行程剛領取工作後就當掉（不再續約）
+        with app.app_context():
+            job = GenerationJob(gift_id=gift_id, status='processing',
+                                worker_id='job-worker-77777-0',
+                                started_at=datetime.utcnow(),
+                                lease_expires_at=datetime.utcnow() +
+                                timedelta(seconds=Config.JOB_LEASE_SECONDS))
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+        start = time.monotonic()
+        finished = wait_until(lambda: job_statuses()[job_id] == 'completed',
+                              4 * Config.JOB_LEASE_SECONDS)
+        elapsed = time.monotonic() - start
+    finally:
+        queue.shutdown(timeout=5)
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"執行過的工作: {ran}，收回並完成耗時 {elapsed:.1f} 秒")
+
+    if finished and ran == [job_id] and elapsed >= Config.JOB_LEASE_SECONDS:
+        print("✅ 測試通過: 租約過期後由執行中的行程收回並完成")
+        return True
+    print("❌ 測試失敗: 遺留的工作沒有在租約過期後被收回")
+    return False
+
+
+def test_lost_lease_result_dropped():
+    """測試 5: 租約被收回後原 worker 才完成"""
+    print("\n" + "="*70)
+    print("測試 5: 原本的 worker 在工作被收回後才完成")
+    print("="*70)
+
+    gift_id = setup_gifts(1)[0]
+    started = threading.Event()
+    release = threading.Event()
+
+    def stalled_handler(job):
+        started.set()
+        release.wait(10)
+
+    queue = make_queue(1, stalled_handler)
+    with app.app_context():
+        job, _ = queue.enqueue(gift_id)
+        job_id = job.id
+        db.session.remove()
+
+    queue.start()
+    try:
+        started.wait(5)
+        # 模擬租約過期後被另一個行程收回並重新領取（重試執行中）
+        with app.app_context():
+            GenerationJob.query.filter_by(id=job_id).update({
+                'worker_id': 'job-worker-66666-0',
+                'started_at': datetime.utcnow(),
+                'lease_expires_at': datetime.utcnow() + timedelta(minutes=10)})
+            db.session.commit()
+        release.set()
+        time.sleep(1)
+    finally:
+        release.set()
+        queue.shutdown(timeout=5)
+    with app.app_context():
+        job = db.session.get(GenerationJob, job_id)
+        state = (job.status, job.worker_id, job.completed_at, job.lease_expires_at)
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"原 worker 完成後的工作狀態: {state[0]}，擁有者 {state[1]}，"
+          f"completed_at {state[2]}，租約 {state[3]}")
+
+    if state[0] == 'processing' and state[1] == 'job-worker-66666-0' \
+            and state[2] is None and state[3] is not None:
+        print("✅ 測試通過: 原 worker 的結果被捨棄，新擁有者的狀態不受影響")
+        return True
+    print("❌ 測試失敗: 原 worker 覆寫了重新領取後的工作狀態")
+    return False
+
+
+def test_status_reset_before_dispatch():
+    """測試 6: 工作交給代理前禮物的生成狀態已寫入"""
+    print("\n" + "="*70)
+    print("測試 6: 重新生成時生成狀態與工作同時提交")
+    print("="*70)
+
+    gift_ids = setup_gifts(3)
+    with app.app_context():
+        Gift.query.update({'image_generation_status': 'failed',
+                           'image_generation_error': '上一次生成失敗'})
+        db.session.commit()
+
+    # 記錄工作交給代理時資料表中（其他連線看到的）禮物狀態
+    seen = []
+    original_put = job_queue.broker.put
+
+    def recording_put(job_id, priority=0):
+        with db.engine.connect() as connection:
+            seen.extend(connection.execute(db.text(
+                "SELECT g.image_generation_status FROM generation_jobs j "
+                "JOIN gifts g ON g.id = j.gift_id WHERE j.id = :id"), {'id': job_id}).scalars())
+        original_put(job_id, priority)
+
+    job_queue.broker.put = recording_put
+    try:
+        client = app.test_client()
+        single = client.post(f'/api/regenerate/{gift_ids[0]}').status_code
+        batch = client.post('/api/admin/generate-batch',
+                            json={'gift_ids': gift_ids[1:]}).status_code
+    finally:
+        job_queue.broker.put = original_put
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"回應狀態: 重新生成 {single}，批次生成 {batch}")
+    print(f"交給代理時的禮物狀態: {seen}")
+
+    if single == 202 and batch == 202 and seen == ['pending'] * 3:
+        print("✅ 測試通過: worker 領取工作前生成狀態已重置")
+        return True
+    print("❌ 測試失敗: 工作已交給代理但生成狀態尚未提交")
+    return False
+
+
+def test_async_in_flight():
+    """測試 7: 交給事件迴圈的工作不佔用 worker 執行緒"""
+    jobs, max_in_flight, duration = 30, 10, 1
+    print("\n" + "="*70)
+    print(f"測試 7: 1 個 worker 執行緒，{jobs} 個各需 {duration} 秒的工作 "
+          f"(max_in_flight={max_in_flight})")
+    print("="*70)
+
+    gift_ids = setup_gifts(jobs)
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+    finished = []
+
+    async def provider_call():
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    def async_handler(job):
+        job_id = job.id
+        return AsyncResult(gemini_service.runner.submit(provider_call()),
+                           then=lambda _: finished.append(job_id))
+
+    queue = make_queue(1, async_handler, max_in_flight=max_in_flight)
+    with app.app_context():
+        job_ids = [queue.enqueue(gift_id)[0].id for gift_id in gift_ids]
+        db.session.remove()
+
+    threads_before = threading.active_count()
+    start = time.monotonic()
+    queue.start()
+    threads_peak = threading.active_count()
+    try:
+        while not wait_until(lambda: len(finished) == jobs, 0.2):
+            threads_peak = max(threads_peak, threading.active_count())
+            if time.monotonic() - start > 10:
+                break
+        done = wait_until(
+            lambda: all(job_statuses()[job_id] == 'completed' for job_id in job_ids), 5)
+        elapsed = time.monotonic() - start
+    finally:
+        queue.shutdown(timeout=5)
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"完成: {len(finished)}/{jobs}，耗時 {elapsed:.1f} 秒 "
+          f"(依序執行需 {jobs * duration} 秒)")
+    print(f"同時執行中的工作峰值: {peak[0]}，"
+          f"執行緒數: 啟動前 {threads_before}，執行中最多 {threads_peak}")
+
+    expected = jobs * duration / max_in_flight
+    if done and peak[0] == max_in_flight and expected <= elapsed < expected + 3 \
+            and threads_peak - threads_before <= 4:
+        print("✅ 測試通過: worker 不等待事件迴圈，同時執行數受 max_in_flight 限制")
+        return True
+    print("❌ 測試失敗: 工作沒有並行執行或超過同時執行上限")
+    return False
+
+
+def main():
+    tests = [
+        ("同時建立工作", test_concurrent_enqueue),
+        ("啟動時收回過期工作", test_recover_expired_lease),
+        ("租約續約", test_lease_renewal),
+        ("執行中收回過期工作", test_reclaim_while_running),
+        ("收回後捨棄原 worker 的結果", test_lost_lease_result_dropped),
+        ("生成狀態與工作同時提交", test_status_reset_before_dispatch),
+        ("交給事件迴圈的工作數上限", test_async_in_flight),
+    ]
+
+    results = []
+    for name, func in tests:
+        try:
+            results.append((name, func()))
+        except Exception as e:
+            print(f"\n❌ 測試 '{name}' 發生異常: {e}")
+            import traceback
+            traceback.print_exc()
+            results.append((name, False))
+
+    print("\n" + "="*70)
+    print("測試總結")
+    print("="*70)
+    for name, passed in results:
+        print(f"{'✅ 通過' if passed else '❌ 失敗'} - {name}")
+    passed = sum(1 for _, ok in results if ok)
+    print(f"\n總計: {passed}/{len(results)} 個測試通過")
+    return passed == len(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
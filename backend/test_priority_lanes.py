@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+測試生成工作的優先順序通道
+
+驗證:
+1. 各通道都有工作時，worker 依權重 (6:3:1) 分配；權重數量不對或非正數時立即報錯
+2. 模擬尖峰：管理員批次補生成 + 玩家狂按重新生成時，第一次生成的 p95 等待
+   時間仍維持在數個處理時間內（單一 FIFO 佇列則會被拖長）
+3. 同一玩家短時間內重新生成超過上限時回傳 429 與 Retry-After
+4. 各端點建立的工作放入正確的通道
+
+預設使用暫存的 SQLite 資料庫；設定 TEST_DATABASE_URL 可改用 PostgreSQL
+（注意：會清空該資料庫的資料表）。
+"""
+
+import heapq
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+# 必須在載入 app 之前設定資料庫；不啟動 worker，工作只留在佇列中
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or \
+    f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_lanes.db')}"
+os.environ['JOB_WORKER_COUNT'] = '0'
+os.environ['REGENERATE_RATE_LIMIT'] = '3'
+
+from app import app  # noqa: E402
+from config import Config, parse_lane_weights  # noqa: E402
+from job_queue import (job_queue, InProcessBroker, LaneScheduler,  # noqa: E402
+                       PRIORITY_FIRST, PRIORITY_REGENERATE, PRIORITY_BACKFILL,
+                       PRIORITY_LANES)
+from models import db, Gift, GenerationJob  # noqa: E402
+
+NUM_WORKERS = 5
+SIMULATION_SECONDS = 300
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def test_weighted_share():
+    """測試 1: 各通道都有工作時依權重分配"""
+    print("\n" + "="*70)
+    print(f"測試 1: 通道權重分配 ({Config.JOB_LANE_WEIGHTS})")
+    print("="*70)
+
+    scheduler = LaneScheduler(Config.JOB_LANE_WEIGHTS)
+    picks = Counter(scheduler.choose(PRIORITY_LANES) for _ in range(1000))
+    total_weight = sum(Config.JOB_LANE_WEIGHTS)
+    expected = {lane: 1000 * weight // total_weight
+                for lane, weight in zip(PRIORITY_LANES, Config.JOB_LANE_WEIGHTS)}
+
+    print(f"實際分配: {dict(sorted(picks.items()))}")
+    print(f"預期分配: {expected}")
+
+    # 只剩低優先通道時不應閒置
+    only_backfill = scheduler.choose([PRIORITY_BACKFILL])
+
+    # 權重少於通道數或非正數時在載入設定時報錯，不在 dispatcher 中才 KeyError
+    rejected = []
+    for value in ('6,3', '6,3,0', '6,3,-1', '6,3,1,1', 'a,b,c'):
+        try:
+            parse_lane_weights(value)
+        except ValueError:
+            rejected.append(value)
+    try:
+        LaneScheduler((6, 3))
+    except ValueError:
+        rejected.append((6, 3))
+    print(f"拒絕的權重設定: {rejected}")
+
+    if all(abs(picks[lane] - expected[lane]) <= 1 for lane in PRIORITY_LANES) \
+            and only_backfill == PRIORITY_BACKFILL and len(rejected) == 6:
+        print("✅ 測試通過: worker 依權重分配給各通道")
+        return True
+    print("❌ 測試失敗: 分配比例與權重不符")
+    return False
+
+
+def simulate(arrivals, use_lanes, seed=42):
+    """以離散事件模擬 NUM_WORKERS 個 worker 處理工作，回傳每個工作的完成延遲
+
+    arrivals 為 [(到達時間, 通道), ...]；use_lanes=False 時所有工作放入同一個 FIFO 通道。
+    """
+    rng = random.Random(seed)
+    broker = InProcessBroker(LaneScheduler(Config.JOB_LANE_WEIGHTS))
+    arrivals = sorted(enumerate(arrivals), key=lambda item: item[1][0])
+    by_id = dict(arrivals)
+    next_arrival = 0
+    workers = [0.0] * NUM_WORKERS  # 每個 worker 下一次空閒的時間
+    heapq.heapify(workers)
+    latencies = {lane: [] for lane in PRIORITY_LANES}
+
+    while next_arrival < len(arrivals) or any(broker._lanes.values()):
+        now = heapq.heappop(workers)
+        # 把目前時間前到達的工作放入佇列
+        while next_arrival < len(arrivals) and arrivals[next_arrival][1][0] <= now:
+            job_id, (_, lane) = arrivals[next_arrival]
+            broker.put(job_id, lane if use_lanes else PRIORITY_FIRST)
+            next_arrival += 1
+
+        job_id = broker.get(timeout=0)
+        if job_id is None:
+            # 佇列空了，worker 等到下一個工作到達
+            heapq.heappush(workers, arrivals[next_arrival][1][0])
+            continue
+
+        arrived_at, lane = by_id[job_id]
+        finish = now + rng.uniform(15, 25)
+        latencies[lane].append(finish - arrived_at)
+        heapq.heappush(workers, finish)
+
+    return latencies
+
+
+def burst_arrivals():
+    """尖峰情境：開場批次補生成 60 個、8 位玩家每 10 秒按一次重新生成、30 位玩家陸續第一次生成"""
+    arrivals = [(0.0, PRIORITY_BACKFILL)] * 60
+    arrivals += [(t + player * 0.5, PRIORITY_REGENERATE)
+                 for player in range(8)
+                 for t in range(0, SIMULATION_SECONDS, 10)]
+    arrivals += [(i * SIMULATION_SECONDS / 30, PRIORITY_FIRST) for i in range(30)]
+    return arrivals
+
+
+def test_burst_first_image_latency():
+    """測試 2: 尖峰時第一次生成的 p95 延遲"""
+    print("\n" + "="*70)
+    print(f"測試 2: 尖峰模擬 ({NUM_WORKERS} 個 worker，每個工作 15-25 秒)")
+    print("="*70)
+
+    arrivals = burst_arrivals()
+    print(f"\n工作數: {Counter(lane for _, lane in arrivals)}")
+
+    fifo = simulate(arrivals, use_lanes=False)
+    lanes = simulate(arrivals, use_lanes=True)
+    fifo_p95 = percentile(fifo[PRIORITY_FIRST], 95)
+    lanes_p95 = percentile(lanes[PRIORITY_FIRST], 95)
+    bound = 3 * 25  # 最多約等於 3 個最長處理時間
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"單一 FIFO 佇列 - 第一次生成 p95: {fifo_p95:7.1f} 秒")
+    print(f"優先順序通道   - 第一次生成 p95: {lanes_p95:7.1f} 秒 (上限 {bound} 秒)")
+    print(f"優先順序通道   - 重新生成   p95: {percentile(lanes[PRIORITY_REGENERATE], 95):7.1f} 秒")
+    print(f"優先順序通道   - 批次補生成 p95: {percentile(lanes[PRIORITY_BACKFILL], 95):7.1f} 秒")
+
+    if lanes_p95 <= bound and lanes_p95 < fifo_p95 \
+            and all(len(lanes[lane]) for lane in PRIORITY_LANES):
+        print("✅ 測試通過: 第一次生成的 p95 延遲維持在上限內，低優先通道仍有進度")
+        return True
+    print("❌ 測試失敗: 第一次生成被其他工作拖慢")
+    return False
+
+
+def setup_gifts():
+    """重建資料表並建立兩位玩家的禮物"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(4):
+            db.session.add(Gift(
+                player_name=f'玩家{i % 2}', gift_name=f'禮物{i}', appearance='圓形',
+                who_likes='上班族', usage_time='早上', happiness_reason='溫暖',
+                image_generation_status='completed'))
+        db.session.commit()
+        return [gift_id for (gift_id,) in db.session.query(Gift.id).order_by(Gift.id)]
+
+
+def finish_all_jobs():
+    with app.app_context():
+        GenerationJob.query.update({'status': 'completed'})
+        db.session.commit()
+
+
+def test_regenerate_rate_limit():
+    """測試 3: 同一玩家重新生成頻率限制"""
+    print("\n" + "="*70)
+    print(f"測試 3: 重新生成頻率限制 ({Config.REGENERATE_RATE_LIMIT} 次 / "
+          f"{Config.REGENERATE_RATE_WINDOW} 秒)")
+    print("="*70)
+
+    gift_ids = setup_gifts()
+    client = app.test_client()
+    statuses = []
+    # 玩家0 有兩個禮物（gift_ids[0]、gift_ids[2]），頻率限制以玩家計算
+    for i in range(Config.REGENERATE_RATE_LIMIT + 1):
+        response = client.post(f'/api/regenerate/{gift_ids[(i % 2) * 2]}')
+        statuses.append(response.status_code)
+        finish_all_jobs()
+
+    limited = response
+    other_player = client.post(f'/api/regenerate/{gift_ids[1]}')
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"玩家0 的回應狀態: {statuses}")
+    print(f"429 訊息: {limited.get_json().get('error')}")
+    print(f"Retry-After: {limited.headers.get('Retry-After')}")
+    print(f"玩家1 的回應狀態: {other_player.status_code}")
+
+    expected = [202] * Config.REGENERATE_RATE_LIMIT + [429]
+    retry_after = int(limited.headers.get('Retry-After', 0))
+    if statuses == expected and 0 < retry_after <= Config.REGENERATE_RATE_WINDOW \
+            and other_player.status_code == 202:
+        print("✅ 測試通過: 超過上限的玩家收到 429，其他玩家不受影響")
+        return True
+    print("❌ 測試失敗: 頻率限制未正確運作")
+    return False
+
+
+def test_job_lanes():
+    """測試 4: 各端點建立的工作放入正確通道"""
+    print("\n" + "="*70)
+    print("測試 4: 工作通道指派")
+    print("="*70)
+
+    gift_ids = setup_gifts()
+    client = app.test_client()
+    client.post('/api/admin/generate-batch', json={'gift_ids': gift_ids[2:]})
+    client.post(f'/api/generate-gift/{gift_ids[0]}')
+    client.post(f'/api/regenerate/{gift_ids[1]}')
+
+    with app.app_context():
+        lanes = {job.gift_id: job.priority for job in GenerationJob.query}
+        # 後到的第一次生成排在批次補生成之前
+        job = GenerationJob.query.filter_by(gift_id=gift_ids[0]).first()
+        backfill = GenerationJob.query.filter_by(gift_id=gift_ids[3]).first()
+        first_position = job_queue.estimate(job)['position']
+        backfill_position = job_queue.estimate(backfill)['position']
+
+    expected = {gift_ids[0]: PRIORITY_FIRST, gift_ids[1]: PRIORITY_REGENERATE,
+                gift_ids[2]: PRIORITY_BACKFILL, gift_ids[3]: PRIORITY_BACKFILL}
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"工作通道: {lanes}")
+    print(f"排隊順位: 第一次生成 {first_position}，最後一個批次補生成 {backfill_position}")
+
+    if lanes == expected and first_position == 1 and backfill_position > 1:
+        print("✅ 測試通過: 工作依類型放入對應通道")
+        return True
+    print("❌ 測試失敗: 通道指派不正確")
+    return False
+
+
+def main():
+    tests = [
+        ("通道權重分配", test_weighted_share),
+        ("尖峰第一次生成延遲", test_burst_first_image_latency),
+        ("重新生成頻率限制", test_regenerate_rate_limit),
+        ("工作通道指派", test_job_lanes),
+    ]
+
+    results = []
+    for name, func in tests:
+        try:
+            results.append((name, func()))
+        except Exception as e:
+            print(f"\n❌ 測試 '{name}' 發生異常: {e}")
+            import traceback
+            traceback.print_exc()
+            results.append((name, False))
+
+    print("\n" + "="*70)
+    print("測試總結")
+    print("="*70)
+    for name, passed in results:
+        print(f"{'✅ 通過' if passed else '❌ 失敗'} - {name}")
+    passed = sum(1 for _, ok in results if ok)
+    print(f"\n總計: {passed}/{len(results)} 個測試通過")
+    return passed == len(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -2,71 +2,55 @@
 測試 Imagen 4.0 並發限制排隊機制
 
 此測試會模擬多個並發請求來驗證:
-1. Semaphore 是否正確限制並發數量 (最多 5 個)
+1. asyncio.Semaphore 是否正確限制並發數量 (最多 5 個)
 2. 超過限制的請求是否正確排隊等待
 3. 重試機制是否正常運作
 4. 佇列資訊是否正確追蹤
+5. 供應商事件迴圈能否同時維持大量進行中的呼叫（不需每個呼叫一條執行緒）
+6. 自適應並發上限是否在健康時提高、過載 (429) 時降低
+7. OpenAI 引擎是否同樣經過並發名額，且佇列資訊反映排隊深度與等待時間
+8. 主要引擎失敗時是否改用另一個引擎 (failover)
+9. 主要引擎過慢時是否對沖到另一個引擎，並取消落後的請求 (hedge)
+10. 供應商持續失敗時斷路器是否開啟、立即失敗，並在試探成功後關閉
+11. 重試策略：jitter 退避不同步、遵守 Retry-After、安全過濾不重試、期限內放棄
 """
 
-from config import Config
-from gemini_service import GeminiService
-import sys
-import time
-import threading
-from datetime import datetime
-from io import BytesIO
-from unittest.mock import Mock, patch, MagicMock
 import os
 
-# 設定測試環境變數
+# 設定測試環境變數（需在載入 Config 之前）
 os.environ['MAX_CONCURRENT_IMAGE_GENERATION'] = '5'
+os.environ['IMAGE_CONCURRENCY_MAX'] = '5'  # 固定上限，自適應行為另外測試
 os.environ['IMAGE_GENERATION_TIMEOUT'] = '10'  # 測試時使用較短的超時時間
 os.environ['IMAGE_GENERATION_MAX_RETRIES'] = '2'
+os.environ['IMAGE_RETRY_BASE_DELAY'] = '0.5'  # 縮短重試等待，總等待不超過生成期限
+os.environ['IMAGE_RETRY_MAX_DELAY'] = '2'
+os.environ['THUMBNAIL_SIZES'] = ''  # 不產生縮圖（另見 test_thumbnails.py）
+
+from config import Config
+from adaptive_limiter import AdaptiveLimiter, QueueTimeout
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from retry_policy import RetryPolicy, SafetyFilterError
+from gemini_service import GeminiService
+import asyncio
+import base64
+import sys
+import time
+import threading
+from unittest.mock import AsyncMock, Mock
 
 
 class TestResults:
     """記錄測試結果"""
 
     def __init__(self):
-        self.lock = threading.Lock()
         self.concurrent_count = []  # 記錄每次進入 API 時的並發數
         self.max_concurrent = 0
-        self.total_requests = 0
+        self.active = 0
         self.successful_requests = 0
         self.failed_requests = 0
-        self.retry_counts = []
-        self.start_times = []
-        self.end_times = []
         self.errors = []
 
 
-def mock_imagen_api_call(test_results, request_id, should_fail_first=False):
-    """模擬 Imagen API 呼叫"""
-    # 記錄進入時的並發數
-    with test_results.lock:
-        test_results.concurrent_count.append(test_results.total_requests)
-        test_results.max_concurrent = max(
-            test_results.max_concurrent,
-            test_results.total_requests
-        )
-
-    # 模擬 API 處理時間 (1-2 秒)
-    time.sleep(1 + (request_id % 3) * 0.5)
-
-    # 第一次失敗測試重試機制
-    if should_fail_first and not hasattr(mock_imagen_api_call, f'failed_{request_id}'):
-        setattr(mock_imagen_api_call, f'failed_{request_id}', True)
-        raise Exception(f"模擬 API 失敗 (請求 {request_id})")
-
-    # 回傳模擬的圖片物件
-    mock_image = Mock()
-    mock_pil_image = Mock()
-    mock_pil_image.save = Mock()
-    mock_image.image = mock_pil_image
-
-    return Mock(generated_images=[mock_image])
-
-
 def test_concurrent_limit():
     """測試 1: 驗證並發限制"""
     print("\n" + "="*70)
@@ -80,70 +64,55 @@ def test_concurrent_limit():
 
     # 模擬 10 個並發請求
     num_requests = 10
-    threads = []
 
-    def make_request(request_id):
+    async def make_request(request_id):
+        await asyncio.sleep(request_id * 0.1)  # 稍微錯開啟動時間
         try:
-            test_results.start_times.append(datetime.now())
-
-            # 獲取 Semaphore
-            acquired = service.imagen_semaphore.acquire(timeout=30)
-            if not acquired:
-                raise TimeoutError("無法獲取 Semaphore")
-
-            try:
+            async with service.image_slot():
                 # 記錄進入臨界區
-                with test_results.lock:
-                    test_results.total_requests += 1
-                    current_active = service.active_count
-                    print(
-                        f"  ✓ 請求 {request_id:2d} 開始執行 (活躍數: {current_active})")
+                test_results.active += 1
+                test_results.max_concurrent = max(
+                    test_results.max_concurrent, test_results.active)
+                print(
+                    f"  ✓ 請求 {request_id:2d} 開始執行 (活躍數: {service.active_count})")
 
                 # 模擬 API 呼叫
-                time.sleep(1)
+                await asyncio.sleep(1)
 
-                with test_results.lock:
-                    test_results.successful_requests += 1
-                    print(f"  ✓ 請求 {request_id:2d} 完成")
-
-            finally:
-                service.imagen_semaphore.release()
-                test_results.end_times.append(datetime.now())
+                test_results.active -= 1
+                test_results.successful_requests += 1
+                print(f"  ✓ 請求 {request_id:2d} 完成")
 
         except Exception as e:
-            with test_results.lock:
-                test_results.failed_requests += 1
-                test_results.errors.append(str(e))
-                print(f"  ✗ 請求 {request_id:2d} 失敗: {e}")
+            test_results.failed_requests += 1
+            test_results.errors.append(str(e))
+            print(f"  ✗ 請求 {request_id:2d} 失敗: {e}")
+
+    async def run_all():
+        await asyncio.gather(*(make_request(i) for i in range(num_requests)))
 
     # 啟動所有請求
     print(f"\n啟動 {num_requests} 個並發請求...")
-    for i in range(num_requests):
-        thread = threading.Thread(target=make_request, args=(i,))
-        threads.append(thread)
-        thread.start()
-        time.sleep(0.1)  # 稍微錯開啟動時間
-
-    # 等待所有請求完成
-    for thread in threads:
-        thread.join()
+    service.runner.run(run_all())
 
     # 驗證結果
     print(f"\n{'結果分析':=^68}")
     print(f"總請求數: {num_requests}")
     print(f"成功請求: {test_results.successful_requests}")
     print(f"失敗請求: {test_results.failed_requests}")
+    print(f"觀察到的最大並發數: {test_results.max_concurrent}")
     print(f"最大並發數: {Config.MAX_CONCURRENT_IMAGE_GENERATION}")
 
     # 檢查是否有超過限制
-    if test_results.successful_requests == num_requests:
-        print(f"✅ 測試通過: 所有請求都成功完成")
-    else:
-        print(f"❌ 測試失敗: 有 {test_results.failed_requests} 個請求失敗")
-        for error in test_results.errors:
-            print(f"   錯誤: {error}")
+    if (test_results.successful_requests == num_requests
+            and test_results.max_concurrent <= Config.MAX_CONCURRENT_IMAGE_GENERATION):
+        print(f"✅ 測試通過: 所有請求都成功完成，且遵守並發限制")
+        return True
 
-    return test_results.failed_requests == 0
+    print(f"❌ 測試失敗: 有 {test_results.failed_requests} 個請求失敗或超過並發限制")
+    for error in test_results.errors:
+        print(f"   錯誤: {error}")
+    return False
 
 
 def test_retry_mechanism():
@@ -153,48 +122,31 @@ def test_retry_mechanism():
     print("="*70)
 
     service = GeminiService()
+    service.image_engine = 'openai'
 
-    # Mock MinIO client
-    service.minio_client = Mock()
-    service.minio_client.put_object = Mock()
+    # Mock MinIO 與上傳
+    service.storage = Mock()
+    service._upload_image = AsyncMock(return_value='/gift-images/test.png')
 
-    # 檢查是否有 Gemini Imagen client
-    if not service.genai_imagen_client:
-        print("\n⚠️  跳過測試: Gemini Imagen 客戶端未初始化")
-        print("   (這在沒有 google-genai 套件的環境中是正常的)")
-        print("   並發限制機制仍然正常運作")
-        return True
-
-    # Mock Gemini Imagen client
+    # Mock 非同步 OpenAI 客戶端：前兩次失敗，第三次成功
     retry_attempt = {'count': 0}
 
-    def mock_generate_images(*args, **kwargs):
+    async def mock_generate(*args, **kwargs):
         retry_attempt['count'] += 1
         print(f"  → API 呼叫嘗試 {retry_attempt['count']}")
 
-        # 前兩次失敗，第三次成功
         if retry_attempt['count'] < 3:
             raise Exception(f"模擬 API 失敗 (嘗試 {retry_attempt['count']})")
 
-        # 第三次成功
-        mock_image = Mock()
-        mock_pil_image = Mock()
-
-        # Mock save 方法
-        def mock_save(buffer, format):
-            buffer.write(b'fake_image_data')
+        image = Mock(b64_json=base64.b64encode(b'fake_image_data').decode())
+        return Mock(data=[image])
 
-        mock_pil_image.save = mock_save
-        mock_image.image = mock_pil_image
-
-        return Mock(generated_images=[mock_image])
-
-    service.genai_imagen_client.models.generate_images = mock_generate_images
+    service.openai_client = Mock()
+    service.openai_client.images.generate = mock_generate
 
     # 測試重試機制
     print("\n開始測試重試機制...")
     try:
-        # 直接測試，不使用 patch
         result, retry_count = service.generate_gift_image_with_retry(
             "test prompt")
 
@@ -231,32 +183,47 @@ def test_queue_info():
     print(f"  最大並發: {queue_info['max_concurrent']}")
     print(f"  可用位置: {queue_info['available_slots']}")
 
-    # 模擬獲取 3 個 Semaphore
-    print("\n模擬 3 個請求進入...")
-    acquired = []
-    for i in range(3):
-        service.imagen_semaphore.acquire()
-        with service.queue_lock:
-            service.active_count += 1
-        acquired.append(i)
+    entered = asyncio.Event()
+    release = None
+
+    async def hold_slots():
+        nonlocal release
+        release = asyncio.Event()
+
+        async def hold():
+            async with service.image_slot():
+                await release.wait()
 
+        tasks = [asyncio.create_task(hold()) for _ in range(3)]
+        while service.active_count < 3:
+            await asyncio.sleep(0.01)
+        entered.set()
+        return tasks
+
+    # 模擬 3 個請求進入
+    print("\n模擬 3 個請求進入...")
+    tasks = service.runner.run(hold_slots())
     queue_info = service.get_queue_info()
     print(f"  活躍數: {queue_info['active_count']}")
     print(f"  可用位置: {queue_info['available_slots']}")
+    during = queue_info
 
     # 釋放
     print("\n釋放 3 個請求...")
-    for i in acquired:
-        with service.queue_lock:
-            service.active_count -= 1
-        service.imagen_semaphore.release()
+
+    async def release_slots():
+        release.set()
+        await asyncio.gather(*tasks)
+
+    service.runner.run(release_slots())
 
     queue_info = service.get_queue_info()
     print(f"  活躍數: {queue_info['active_count']}")
     print(f"  可用位置: {queue_info['available_slots']}")
 
     print(f"\n{'結果分析':=^68}")
-    if queue_info['active_count'] == 0 and queue_info['available_slots'] == 5:
+    if (during['active_count'] == 3 and during['available_slots'] == 2
+            and queue_info['active_count'] == 0 and queue_info['available_slots'] == 5):
         print(f"✅ 測試通過: 佇列資訊追蹤正確")
         return True
     else:
@@ -272,25 +239,41 @@ def test_timeout_mechanism():
 
     service = GeminiService()
 
-    # 先佔滿所有位置
-    print("\n佔滿所有 5 個 Semaphore 位置...")
-    for i in range(5):
-        service.imagen_semaphore.acquire()
+    async def try_sixth_slot():
+        limiter = service.limiters[service.current_engine]
+        release = asyncio.Event()
 
-    # 嘗試獲取第 6 個 (應該超時)
-    print("嘗試獲取第 6 個位置 (timeout=3 秒)...")
-    start_time = time.time()
-    acquired = service.imagen_semaphore.acquire(timeout=3)
-    elapsed_time = time.time() - start_time
+        async def hold():
+            async with limiter.acquire():
+                await release.wait()
+
+        # 先佔滿所有位置
+        print("\n佔滿所有 5 個並發名額...")
+        holders = [asyncio.create_task(hold()) for _ in range(5)]
+        while limiter.in_flight < 5:
+            await asyncio.sleep(0.01)
+
+        # 嘗試獲取第 6 個 (應該超時)
+        print("嘗試獲取第 6 個位置 (timeout=3 秒)...")
+        start_time = time.time()
+        try:
+            async with limiter.acquire(timeout=3):
+                acquired = True
+        except QueueTimeout:
+            acquired = False
+        elapsed_time = time.time() - start_time
+
+        # 釋放所有位置
+        release.set()
+        await asyncio.gather(*holders)
+        return acquired, elapsed_time
+
+    acquired, elapsed_time = service.runner.run(try_sixth_slot())
 
     print(f"\n{'結果分析':=^68}")
     print(f"是否獲取成功: {acquired}")
     print(f"等待時間: {elapsed_time:.2f} 秒")
 
-    # 釋放所有位置
-    for i in range(5):
-        service.imagen_semaphore.release()
-
     if not acquired and 2.8 <= elapsed_time <= 3.5:
         print(f"✅ 測試通過: 超時機制正常運作")
         return True
@@ -308,54 +291,33 @@ def test_stress_test():
     service = GeminiService()
     num_requests = 20
     results = {'success': 0, 'failed': 0}
-    lock = threading.Lock()
 
-    def stress_request(request_id):
+    async def stress_request(request_id):
         try:
-            acquired = service.imagen_semaphore.acquire(timeout=30)
-            if not acquired:
-                raise TimeoutError("無法獲取 Semaphore")
-
-            try:
-                with service.queue_lock:
-                    service.active_count += 1
-
+            async with service.image_slot():
                 # 檢查是否超過限制
                 if service.active_count > Config.MAX_CONCURRENT_IMAGE_GENERATION:
                     raise Exception(f"並發數超過限制! ({service.active_count})")
 
                 # 模擬工作
-                time.sleep(0.5)
-
-                with lock:
-                    results['success'] += 1
-                    if results['success'] % 5 == 0:
-                        print(
-                            f"  ✓ 已完成 {results['success']}/{num_requests} 個請求")
+                await asyncio.sleep(0.5)
 
-            finally:
-                with service.queue_lock:
-                    service.active_count -= 1
-                service.imagen_semaphore.release()
+                results['success'] += 1
+                if results['success'] % 5 == 0:
+                    print(
+                        f"  ✓ 已完成 {results['success']}/{num_requests} 個請求")
 
         except Exception as e:
-            with lock:
-                results['failed'] += 1
-                print(f"  ✗ 請求 {request_id} 失敗: {e}")
+            results['failed'] += 1
+            print(f"  ✗ 請求 {request_id} 失敗: {e}")
+
+    async def run_all():
+        await asyncio.gather(*(stress_request(i) for i in range(num_requests)))
 
     # 啟動壓力測試
     print(f"\n啟動 {num_requests} 個並發請求...")
     start_time = time.time()
-
-    threads = []
-    for i in range(num_requests):
-        thread = threading.Thread(target=stress_request, args=(i,))
-        threads.append(thread)
-        thread.start()
-
-    for thread in threads:
-        thread.join()
-
+    service.runner.run(run_all())
     elapsed_time = time.time() - start_time
 
     print(f"\n{'結果分析':=^68}")
@@ -373,6 +335,368 @@ def test_stress_test():
         return False
 
 
+def test_many_in_flight():
+    """測試 6: 事件迴圈同時維持 300 個進行中的供應商呼叫（直接呼叫協程，不經過工作佇列）"""
+    print("\n" + "="*70)
+    print("測試 6: 大量進行中的請求 (300 個，OpenAI 名額放寬為 300)")
+    print("="*70)
+
+    service = GeminiService()
+    service.image_engine = 'openai'
+    service.storage = Mock()
+    service._upload_image = AsyncMock(return_value='/gift-images/test.png')
+
+    num_requests = 300
+    # 此測試驗證事件迴圈本身的容量，將 OpenAI 名額放寬到 300
+    service.limiters['openai'] = AdaptiveLimiter(
+        'openai', initial_limit=num_requests, max_limit=num_requests)
+    in_flight = {'current': 0, 'max': 0}
+
+    async def slow_generate(*args, **kwargs):
+        in_flight['current'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['current'])
+        await asyncio.sleep(1)  # 模擬供應商回應時間
+        in_flight['current'] -= 1
+        image = Mock(b64_json=base64.b64encode(b'fake_image_data').decode())
+        return Mock(data=[image])
+
+    service.openai_client = Mock()
+    service.openai_client.images.generate = slow_generate
+
+    async def run_all():
+        return await asyncio.gather(*(
+            service.generate_gift_image_async(f"prompt {i}") for i in range(num_requests)))
+
+    threads_before = threading.active_count()
+    start_time = time.time()
+    results = service.runner.run(run_all())
+    elapsed_time = time.time() - start_time
+    threads_after = threading.active_count()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"成功請求: {sum(1 for r in results if r)}/{num_requests}")
+    print(f"同時進行中的最大請求數: {in_flight['max']}")
+    print(f"總耗時: {elapsed_time:.2f} 秒")
+    print(f"執行緒數: {threads_before} → {threads_after}")
+    # 同時完成的生成各自上傳到不同的物件名稱
+    filenames = {call.args[0] for call in service._upload_image.call_args_list}
+    print(f"不同的物件名稱: {len(filenames)}/{num_requests}")
+
+    if (all(results) and in_flight['max'] == num_requests and len(filenames) == num_requests
+            and elapsed_time < 5 and threads_after <= threads_before + 1):
+        print(f"✅ 測試通過: 所有請求在單一事件迴圈上並行完成")
+        return True
+    else:
+        print(f"❌ 測試失敗: 請求未能並行完成")
+        return False
+
+
+def test_adaptive_limit():
+    """測試 7: 自適應並發上限 (AIMD)"""
+    print("\n" + "="*70)
+    print("測試 7: 自適應並發上限 (健康時提高、429 時降低)")
+    print("="*70)
+
+    limiter = AdaptiveLimiter('test', initial_limit=5, min_limit=1,
+                              max_limit=20)
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    async def request(fail):
+        try:
+            async with limiter.acquire(timeout=10):
+                await asyncio.sleep(0.05)
+                if fail:
+                    raise RateLimited("429 Too Many Requests")
+        except RateLimited:
+            pass
+
+    async def run_round(count, fail=False):
+        await asyncio.gather(*(request(fail) for _ in range(count)))
+
+    service = GeminiService()
+
+    print("\n階段 1: 60 個健康請求（名額用滿）...")
+    service.runner.run(run_round(60))
+    raised = limiter.limit
+    print(f"  上限: 5 → {raised}")
+
+    print("階段 2: 20 個回傳 429 的請求...")
+    service.runner.run(run_round(20, fail=True))
+    lowered = limiter.limit
+    print(f"  上限: {raised} → {lowered}")
+
+    print(f"\n{'結果分析':=^68}")
+    stats = limiter.stats()
+    print(f"統計: {stats}")
+
+    if raised > 5 and lowered < raised and stats['in_flight'] == 0 and stats['waiting'] == 0:
+        print(f"✅ 測試通過: 上限依供應商狀況自動調整")
+        return True
+    else:
+        print(f"❌ 測試失敗: 上限未依預期調整")
+        return False
+
+
+def test_openai_admission():
+    """測試 8: OpenAI 引擎的並發控制與佇列資訊"""
+    print("\n" + "="*70)
+    print("測試 8: OpenAI 引擎並發控制 (20 個請求，上限 5)")
+    print("="*70)
+
+    service = GeminiService()
+    service.image_engine = 'openai'
+    service.storage = Mock()
+    service._upload_image = AsyncMock(return_value='/gift-images/test.png')
+
+    num_requests = 20
+    in_flight = {'current': 0, 'max': 0}
+    snapshots = []
+
+    async def slow_generate(*args, **kwargs):
+        in_flight['current'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['current'])
+        snapshots.append(service.get_queue_info())
+        await asyncio.sleep(0.3)
+        in_flight['current'] -= 1
+        image = Mock(b64_json=base64.b64encode(b'fake_image_data').decode())
+        return Mock(data=[image])
+
+    service.openai_client = Mock()
+    service.openai_client.images.generate = slow_generate
+
+    async def run_all():
+        return await asyncio.gather(*(
+            service.generate_gift_image_async(f"prompt {i}") for i in range(num_requests)))
+
+    results = service.runner.run(run_all())
+    stats = service.get_queue_info()['providers']['openai']
+    max_waiting = max(info['waiting_count'] for info in snapshots)
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"成功請求: {sum(1 for r in results if r)}/{num_requests}")
+    print(f"觀察到的最大並發數: {in_flight['max']}")
+    print(f"佇列資訊中的最大排隊數: {max_waiting}")
+    print(f"平均等待: {stats['mean_wait_ms']} ms，最長等待: {stats['max_wait_ms']} ms")
+
+    if (all(results) and in_flight['max'] <= Config.IMAGE_CONCURRENCY_MAX
+            and max_waiting > 0 and stats['admitted'] == num_requests
+            and stats['max_wait_ms'] > 0):
+        print(f"✅ 測試通過: OpenAI 請求經過並發名額，佇列資訊正確")
+        return True
+    else:
+        print(f"❌ 測試失敗: OpenAI 請求未受並發控制")
+        return False
+
+
+def make_dual_engine_service(openai_generate, gemini_generate):
+    """建立同時設定 OpenAI 與 Gemini Imagen 的測試用服務（API 呼叫以 mock 取代）"""
+    service = GeminiService()
+    service.image_engine = 'openai'
+    service.storage = Mock()
+    service._upload_image = AsyncMock(return_value='/gift-images/test.png')
+    service.openai_client = Mock()
+    service.genai_imagen_client = Mock()
+    service._generate_with_openai = openai_generate
+    service._generate_with_gemini = gemini_generate
+    return service
+
+
+def test_failover():
+    """測試 9: 主要引擎失敗時改用另一個引擎"""
+    print("\n" + "="*70)
+    print("測試 9: 供應商 failover (OpenAI 回傳 500，改用 Gemini Imagen)")
+    print("="*70)
+
+    class ServerError(Exception):
+        status_code = 500
+
+    async def failing_openai(prompt):
+        raise ServerError("500 Internal Server Error")
+
+    service = make_dual_engine_service(
+        failing_openai, AsyncMock(return_value=b'gemini_png'))
+    result = service.generate_gift_image("test prompt")
+    stats = service.router.stats()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"結果: {result}")
+    print(f"路由統計: {stats}")
+
+    if result and stats['wins'] == {'gemini': 1} and stats['failovers'] == 1:
+        print(f"✅ 測試通過: OpenAI 失敗後由 Gemini Imagen 完成")
+        return True
+    else:
+        print(f"❌ 測試失敗: 未正確切換供應商")
+        return False
+
+
+def test_hedged_request():
+    """測試 10: 主要引擎過慢時對沖並取消落後的請求"""
+    print("\n" + "="*70)
+    print("測試 10: 對沖請求 (OpenAI 需 5 秒，0.3 秒後對沖到 Gemini Imagen)")
+    print("="*70)
+
+    cancelled = {'openai': False}
+
+    async def slow_openai(prompt):
+        try:
+            await asyncio.sleep(5)
+            return b'openai_png'
+        except asyncio.CancelledError:
+            cancelled['openai'] = True
+            raise
+
+    async def fast_gemini(prompt):
+        await asyncio.sleep(0.1)
+        return b'gemini_png'
+
+    service = make_dual_engine_service(slow_openai, fast_gemini)
+    service.router.hedge_enabled = True
+    service.router.hedge_default_delay = 0.3
+
+    start_time = time.time()
+    result = service.generate_gift_image("test prompt")
+    elapsed_time = time.time() - start_time
+    stats = service.router.stats()
+    openai_limiter = service.limiters['openai'].stats()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"結果: {result}，耗時 {elapsed_time:.2f} 秒")
+    print(f"路由統計: {stats}")
+    print(f"OpenAI 請求已取消: {cancelled['openai']}，"
+          f"OpenAI 名額: {openai_limiter['in_flight']}，過載次數: {openai_limiter['overloads']}")
+
+    if (result and elapsed_time < 1.5 and stats['wins'] == {'gemini': 1}
+            and stats['hedge_wins'] == 1 and cancelled['openai']
+            and openai_limiter['in_flight'] == 0 and openai_limiter['overloads'] == 0):
+        print(f"✅ 測試通過: 對沖請求勝出，落後的請求已取消並歸還名額")
+        return True
+    else:
+        print(f"❌ 測試失敗: 對沖請求未正確運作")
+        return False
+
+
+def test_circuit_breaker():
+    """測試 11: 斷路器開啟後立即失敗，試探成功後關閉"""
+    print("\n" + "="*70)
+    print("測試 11: 斷路器 (OpenAI 連續回傳 503，Gemini Imagen 未設定)")
+    print("="*70)
+
+    class ServiceUnavailable(Exception):
+        status_code = 503
+
+    calls = {'count': 0, 'healthy': False}
+
+    async def flaky_openai(prompt):
+        calls['count'] += 1
+        if not calls['healthy']:
+            raise ServiceUnavailable("503 Service Unavailable")
+        return b'openai_png'
+
+    service = make_dual_engine_service(flaky_openai, AsyncMock())
+    service.genai_imagen_client = None
+    service.breakers['openai'] = CircuitBreaker(
+        'openai', error_rate=0.5, min_requests=3, open_seconds=0.5)
+
+    # 連續 3 次失敗後開啟
+    for _ in range(3):
+        service.generate_gift_image("test prompt")
+    calls_when_opened = calls['count']
+    queue_info = service.get_queue_info()
+
+    # 開啟中：重試包裝也不等待，立即失敗且不呼叫供應商
+    start_time = time.time()
+    try:
+        service.generate_gift_image_with_retry("test prompt")
+        fast_failed = False
+    except CircuitOpenError:
+        fast_failed = True
+    fail_time = time.time() - start_time
+
+    # open_seconds 後試探，供應商已恢復時關閉
+    time.sleep(0.6)
+    calls['healthy'] = True
+    result = service.generate_gift_image("test prompt")
+    circuit = service.get_queue_info()['circuits']['openai']
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"開啟後 provider_busy: {queue_info['provider_busy']}，"
+          f"retry_after: {queue_info['retry_after_seconds']} 秒")
+    print(f"開啟中立即失敗: {fast_failed}，耗時 {fail_time:.3f} 秒，"
+          f"供應商呼叫數 {calls_when_opened} → {calls['count']}")
+    print(f"試探結果: {result}，斷路器: {circuit}")
+
+    if (queue_info['provider_busy'] and queue_info['circuits']['openai']['state'] == 'open'
+            and fast_failed and fail_time < 0.5 and calls['count'] == calls_when_opened + 1
+            and result and circuit['state'] == 'closed'):
+        print(f"✅ 測試通過: 斷路器開啟時立即回報忙碌，試探成功後恢復")
+        return True
+    else:
+        print(f"❌ 測試失敗: 斷路器未正確運作")
+        return False
+
+
+def test_retry_policy():
+    """測試 12: 重試策略"""
+    print("\n" + "="*70)
+    print("測試 12: 重試策略 (jitter 退避、Retry-After、安全過濾、期限)")
+    print("="*70)
+
+    policy = RetryPolicy(2, base_delay=2.0, max_delay=30.0)
+    error = Exception("503 Service Unavailable")
+
+    # 100 個同時失敗的請求：第一次重試的等待時間應分散，而非同時重試
+    first_delays = [policy.next_delay(error, policy.base_delay) for _ in range(100)]
+    spread = max(first_delays) - min(first_delays)
+    in_range = all(2.0 <= delay <= 6.0 for delay in first_delays)
+
+    # 供應商的 Retry-After 優先於退避時間
+    class RateLimited(Exception):
+        status_code = 429
+        response = Mock(headers={'retry-after': '12'})
+
+    hinted = policy.next_delay(RateLimited("429 Too Many Requests"), policy.base_delay)
+
+    # 剩餘期限不足以等待時放棄
+    no_time = policy.next_delay(error, policy.base_delay,
+                                deadline=time.monotonic() + 1.0)
+
+    # 安全過濾：不重試，也不改用其他引擎
+    calls = {'openai': 0}
+
+    async def blocked_openai(prompt):
+        calls['openai'] += 1
+        raise SafetyFilterError("OpenAI 安全過濾: moderation_blocked")
+
+    gemini = AsyncMock(return_value=b'gemini_png')
+    service = make_dual_engine_service(blocked_openai, gemini)
+    start_time = time.time()
+    try:
+        service.generate_gift_image_with_retry("test prompt")
+        blocked = False
+    except SafetyFilterError:
+        blocked = True
+    blocked_time = time.time() - start_time
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"第一次重試等待: {min(first_delays):.2f}–{max(first_delays):.2f} 秒")
+    print(f"Retry-After 12 秒時的等待: {hinted:.1f} 秒")
+    print(f"剩餘 1 秒期限時: {no_time}")
+    print(f"安全過濾: 拋出 SafetyFilterError={blocked}，OpenAI 呼叫 {calls['openai']} 次，"
+          f"Gemini 呼叫 {gemini.await_count} 次，耗時 {blocked_time:.2f} 秒")
+
+    if (in_range and spread > 2.0 and hinted >= 12 and no_time is None
+            and blocked and calls['openai'] == 1 and gemini.await_count == 0
+            and blocked_time < 0.5):
+        print(f"✅ 測試通過: 重試策略符合預期")
+        return True
+    else:
+        print(f"❌ 測試失敗: 重試策略異常")
+        return False
+
+
 def main():
     """執行所有測試"""
     print("\n" + "="*70)
@@ -394,6 +718,13 @@ def main():
         ("佇列資訊", test_queue_info),
         ("超時機制", test_timeout_mechanism),
         ("壓力測試", test_stress_test),
+        ("大量進行中請求", test_many_in_flight),
+        ("自適應並發上限", test_adaptive_limit),
+        ("OpenAI 並發控制", test_openai_admission),
+        ("供應商 failover", test_failover),
+        ("對沖請求", test_hedged_request),
+        ("斷路器", test_circuit_breaker),
+        ("重試策略", test_retry_policy),
     ]
 
     for test_name, test_func in tests:
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+測試圖片儲存後端
+
+驗證:
+1. 建立 MinioStorage 時不連線，bucket 在第一次上傳時只確認一次
+2. 連續上傳重複使用 keep-alive 連線，連線池大小依設定
+3. 大型物件以 SDK 的 put_object 分段並行上傳（模擬的 S3 伺服器），失敗時取消 multipart
+4. LocalStorage 寫入本機目錄，GeminiService 可在沒有 MinIO 時生成並保存圖片
+
+儲存後端直接建立並注入 GeminiService，不依賴環境變數，
+與其他測試模組在同一個 pytest 行程執行時結果相同。
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+from unittest.mock import AsyncMock, Mock, patch
+import httpx
+from PIL import Image
+from config import Config
+from gemini_service import GeminiService
+from storage import LocalStorage, MinioStorage, create_storage
+
+
+def make_storage(**kwargs):
+    """無法連線的 endpoint：建立時若連線會立即失敗"""
+    return MinioStorage('127.0.0.1:1', 'minioadmin', 'minioadmin', 'gift-images', **kwargs)
+
+
+def test_lazy_bucket():
+    """測試 1: 延遲確認 bucket"""
+    print("\n" + "="*70)
+    print("測試 1: 建立時不連線，第一次上傳時確認 bucket 一次")
+    print("="*70)
+
+    start = time.perf_counter()
+    storage = make_storage(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    created_in = time.perf_counter() - start
+
+    storage.client = Mock()
+    storage.client.presigned_put_object.return_value = 'http://minio.local/gift-images/x'
+
+    def slow_bucket_exists(bucket):
+        time.sleep(0.1)
+        return True
+    storage.client.bucket_exists.side_effect = slow_bucket_exists
+
+    async def upload_all():
+        return await asyncio.gather(*(
+            storage.upload(f'image_{i}.png', b'data', 'image/png') for i in range(10)))
+
+    checked_before = storage.client.bucket_exists.call_count
+    paths = asyncio.run(upload_all())
+    checks = storage.client.bucket_exists.call_count
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"建立耗時: {created_in * 1000:.1f} ms，上傳前確認次數: {checked_before}")
+    print(f"10 個並發上傳後確認次數: {checks}，bucket_verified: {storage.stats()['bucket_verified']}")
+
+    if (created_in < 0.5 and checked_before == 0 and checks == 1
+            and paths[0] == '/gift-images/image_0.png' and storage.bucket_verified):
+        print("✅ 測試通過: bucket 只在第一次上傳時確認")
+        return True
+    print("❌ 測試失敗: bucket 確認時機或次數不符預期")
+    return False
+
+
+class PutHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    client_ports = set()
+    bodies = []
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        PutHandler.client_ports.add(self.client_address[1])
+        PutHandler.bodies.append(body)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_keepalive_pool():
+    """測試 2: keep-alive 連線重複使用"""
+    print("\n" + "="*70)
+    print("測試 2: 連續上傳重複使用 keep-alive 連線")
+    print("="*70)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PutHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/gift-images/image.png'
+
+    storage = make_storage(max_connections=4)
+    pool_size = storage.client._http.connection_pool_kw['maxsize']
+    storage.client = Mock()
+    storage.client.bucket_exists.return_value = True
+    storage.client.presigned_put_object.return_value = url
+
+    async def upload_all():
+        for i in range(20):
+            await storage.upload(f'image_{i}.png', os.urandom(200 * 1024), 'image/png')
+        await storage.http_client.aclose()
+
+    try:
+        asyncio.run(upload_all())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    expected_default = Config.IMAGE_CONCURRENCY_MAX * (1 + len(Config.THUMBNAIL_SIZES))
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"20 次上傳使用的連線數: {len(PutHandler.client_ports)}")
+    print(f"收到的內容: {len(PutHandler.bodies)} 個，每個 "
+          f"{len(PutHandler.bodies[0]) // 1024 if PutHandler.bodies else 0} KB")
+    print(f"SDK 連線池大小: {pool_size}，"
+          f"STORAGE_MAX_CONNECTIONS 預設: {Config.STORAGE_MAX_CONNECTIONS} (預期 {expected_default})")
+
+    if (len(PutHandler.client_ports) == 1 and len(PutHandler.bodies) == 20
+            and all(len(body) == 200 * 1024 for body in PutHandler.bodies)
+            and pool_size == 4 and Config.STORAGE_MAX_CONNECTIONS == expected_default):
+        print("✅ 測試通過: 上傳重複使用同一條連線")
+        return True
+    print("❌ 測試失敗: 上傳沒有重複使用連線或連線池大小不符")
+    return False
+
+
+S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    """模擬 S3 的單一 PUT 與 multipart API"""
+    protocol_version = 'HTTP/1.1'
+    fail_part = None
+    parts = {}
+    requests = []
+
+    def _reply(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _request(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        S3Handler.requests.append((self.command, url.path, sorted(query)))
+        return url.path, query, body
+
+    def do_HEAD(self):
+        self._request()
+        self._reply(200)
+
+    def do_PUT(self):
+        path, query, body = self._request()
+        if 'partNumber' not in query:
+            S3Handler.parts[0] = body
+            self._reply(200, headers={'ETag': '"single"'})
+            return
+        number = int(query['partNumber'][0])
+        if number == S3Handler.fail_part:
+            self._reply(403, (f'<Error><Code>AccessDenied</Code><Message>denied</Message>'
+                              f'<Resource>{path}</Resource></Error>').encode(),
+                        {'Content-Type': 'application/xml'})
+            return
+        S3Handler.parts[number] = body
+        self._reply(200, headers={'ETag': f'"etag-{number}"'})
+
+    def do_POST(self):
+        path, query, body = self._request()
+        bucket, key = path.lstrip('/').split('/', 1)
+        if 'uploads' in query:
+            xml = (f'<InitiateMultipartUploadResult xmlns="{S3_XMLNS}"><Bucket>{bucket}</Bucket>'
+                   f'<Key>{key}</Key><UploadId>upload-1</UploadId></InitiateMultipartUploadResult>')
+        else:
+            S3Handler.completed = body.decode()
+            xml = (f'<CompleteMultipartUploadResult xmlns="{S3_XMLNS}"><Location>{path}</Location>'
+                   f'<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>"done"</ETag>'
+                   f'</CompleteMultipartUploadResult>')
+        self._reply(200, xml.encode(), {'Content-Type': 'application/xml'})
+
+    def do_DELETE(self):
+        self._request()
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_multipart():
+    """測試 3: multipart 分段上傳"""
+    print("\n" + "="*70)
+    print("測試 3: 大型物件以 multipart 分段上傳，失敗時取消")
+    print("="*70)
+
+    data = os.urandom(12 * 1024 * 1024)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), S3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    storage = MinioStorage(f'127.0.0.1:{server.server_address[1]}', 'minioadmin', 'minioadmin',
+                           'gift-images', region='us-east-1',
+                           multipart_threshold=8 * 1024 * 1024)
+
+    def upload(key, content):
+        S3Handler.parts, S3Handler.requests, S3Handler.completed = {}, [], None
+
+        async def run():
+            try:
+                return await storage.upload(key, content, 'image/png')
+            finally:
+                await storage.http_client.aclose()
+                storage.http_client = httpx.AsyncClient()
+        return asyncio.run(run())
+
+    def calls(method):
+        return [request for request in S3Handler.requests if request[0] == method]
+
+    try:
+        # 小於門檻：單一 PUT（預簽章 URL）
+        upload('small.png', b'small')
+        single_put = S3Handler.parts == {0: b'small'} and not calls('POST')
+
+        # 超過門檻：3 段（5 MB、5 MB、2 MB）
+        upload('large.png', data)
+        reassembled = b''.join(S3Handler.parts[number] for number in sorted(S3Handler.parts))
+        part_sizes = [len(S3Handler.parts[number]) // (1024 * 1024)
+                      for number in sorted(S3Handler.parts)]
+        completed = S3Handler.completed or ''
+        complete_ok = all(f'<ETag>"etag-{number}"</ETag>' in completed or
+                          f'<ETag>etag-{number}</ETag>' in completed for number in (1, 2, 3))
+
+        # 分段失敗：取消 multipart
+        S3Handler.fail_part = 2
+        try:
+            upload('broken.png', data)
+            failed = False
+        except Exception as e:
+            failed = True
+            error = e
+        aborted = calls('DELETE')
+        completed_broken = S3Handler.completed
+    finally:
+        S3Handler.fail_part = None
+        server.shutdown()
+        server.server_close()
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"小物件單一 PUT: {single_put}")
+    print(f"大物件分段 (MB): {part_sizes}，重組後相同: {reassembled == data}，"
+          f"完成請求包含各段 ETag: {complete_ok}")
+    print(f"分段失敗拋出例外: {failed} ({type(error).__name__ if failed else '-'})，"
+          f"取消: {aborted}")
+    print(f"統計: {storage.stats()}")
+
+    if (single_put and reassembled == data and part_sizes == [5, 5, 2] and complete_ok
+            and failed and aborted == [('DELETE', '/gift-images/broken.png', ['uploadId'])]
+            and completed_broken is None and storage.multipart_uploads == 1):
+        print("✅ 測試通過: multipart 分段上傳與取消正確")
+        return True
+    print("❌ 測試失敗: multipart 上傳不符預期")
+    return False
+
+
+def make_png():
+    output = BytesIO()
+    Image.effect_noise((64, 64), 32).convert('RGB').save(output, format='PNG')
+    return output.getvalue()
+
+
+def test_local_storage():
+    """測試 4: 本機目錄儲存"""
+    print("\n" + "="*70)
+    print("測試 4: LocalStorage 與沒有 MinIO 時的生成流程")
+    print("="*70)
+
+    local_dir = tempfile.mkdtemp(prefix='gift-storage-')
+    png = make_png()
+    storage = LocalStorage(local_dir, 'gift-images')
+    path = asyncio.run(storage.upload('direct.png', memoryview(png), 'image/png'))
+    with open(storage.path('direct.png'), 'rb') as f:
+        direct_ok = f.read() == png
+    try:
+        storage.path('../escape.png')
+        rejected = False
+    except ValueError:
+        rejected = True
+
+    with patch.object(Config, 'STORAGE_BACKEND', 'local'), \
+            patch.object(Config, 'LOCAL_STORAGE_DIR', local_dir):
+        created = create_storage()
+
+    service = GeminiService()
+    service.storage = created
+    service.thumbnails.sizes = ()  # 縮圖另見 test_thumbnails.py
+    service.image_engine = 'openai'
+    service.openai_client = Mock()
+    service._generate_with_openai = AsyncMock(return_value=png)
+    image_url, _ = service.generate_gift_image_with_retry("test prompt")
+    with open(created.path(image_url.rsplit('/', 1)[1]), 'rb') as f:
+        generated_ok = f.read() == png
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"直接上傳: {path} 內容相同: {direct_ok}，拒絕跳出目錄: {rejected}")
+    print(f"create_storage(): {created.name} {created.directory}")
+    print(f"生成圖片: {image_url} 內容相同: {generated_ok}")
+
+    if (path == '/api/storage/gift-images/direct.png' and direct_ok and rejected
+            and created.name == 'local' and created.root == local_dir
+            and image_url.startswith('/api/storage/gift-images/') and generated_ok):
+        print("✅ 測試通過: 圖片寫入本機目錄，路徑指向後端的 /api/storage")
+        return True
+    print("❌ 測試失敗: 本機儲存不符預期")
+    return False
+
+
+def main():
+    tests = [
+        ("延遲確認 bucket", test_lazy_bucket),
+        ("keep-alive 連線重複使用", test_keepalive_pool),
+        ("multipart 分段上傳", test_multipart),
+        ("本機目錄儲存", test_local_storage),
+    ]
+
+    results = []
+    for name, func in tests:
+        try:
+            results.append((name, func()))
+        except Exception as e:
+            print(f"\n❌ 測試 '{name}' 發生異常: {e}")
+            import traceback
+            traceback.print_exc()
+            results.append((name, False))
+
+    print("\n" + "="*70)
+    print("測試總結")
+    print("="*70)
+    for name, passed in results:
+        print(f"{'✅ 通過' if passed else '❌ 失敗'} - {name}")
+    passed = sum(1 for _, ok in results if ok)
+    print(f"\n總計: {passed}/{len(results)} 個測試通過")
+    return passed == len(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+測試生成圖片的 WebP 縮圖
+
+驗證:
+1. 各尺寸縮圖的邊長正確，且總大小遠小於原圖 PNG
+2. 生成圖片上傳後在 process pool 產生縮圖，上傳到原圖旁邊；生成不等待縮圖，
+   完成後以回呼交出 {尺寸: 路徑}，超過待處理上限時捨棄並記錄
+3. Gift.to_dict 與 fields 參數包含 thumbnails
+"""
+
+import os
+import sys
+import threading
+import time
+from io import BytesIO
+
+# 必須在載入 Config 之前設定
+os.environ['THUMBNAIL_SIZES'] = '128,256,512'
+os.environ['THUMBNAIL_WORKERS'] = '1'
+
+from unittest.mock import AsyncMock, Mock  # noqa: E402
+from PIL import Image, ImageFilter  # noqa: E402
+from config import Config  # noqa: E402
+from gemini_service import GeminiService  # noqa: E402
+from models import Gift, parse_gift_fields  # noqa: E402
+import thumbnails as thumbnails_module  # noqa: E402
+from thumbnails import render_thumbnails  # noqa: E402
+
+
+def make_png(size=1024):
+    """產生類似生成照片的 PNG（漸層加上雜訊紋理，PNG 難以壓縮）"""
+    gradient = Image.linear_gradient('L').resize((size, size))
+    texture = Image.effect_noise((size, size), 48).filter(ImageFilter.GaussianBlur(1))
+    image = Image.merge('RGB', (gradient, texture, gradient.rotate(90)))
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def test_render_sizes():
+    """測試 1: 縮圖尺寸與大小"""
+    print("\n" + "="*70)
+    print(f"測試 1: 產生 {Config.THUMBNAIL_SIZES} 的 WebP 縮圖")
+    print("="*70)
+
+    png = make_png()
+    rendered = render_thumbnails(png, Config.THUMBNAIL_SIZES, Config.THUMBNAIL_QUALITY)
+    dimensions = {size: Image.open(BytesIO(data)).size for size, data in rendered.items()}
+    formats = {Image.open(BytesIO(data)).format for data in rendered.values()}
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"原圖 PNG: {len(png) / 1024:.1f} KB")
+    for size, data in sorted(rendered.items()):
+        print(f"  {size}px: {dimensions[size]} {len(data) / 1024:.1f} KB "
+              f"({len(png) / len(data):.0f}x 較小)")
+
+    smallest_gallery = rendered[256]
+    if (all(dimensions[size] == (size, size) for size in Config.THUMBNAIL_SIZES)
+            and formats == {'WEBP'} and len(png) / len(smallest_gallery) >= 10):
+        print("✅ 測試通過: 縮圖尺寸正確，畫廊縮圖比原圖小一個數量級以上")
+        return True
+    print("❌ 測試失敗: 縮圖尺寸或大小不符預期")
+    return False
+
+
+def test_pipeline():
+    """測試 2: 生成後在 process pool 產生並上傳縮圖"""
+    print("\n" + "="*70)
+    print("測試 2: 生成 → 上傳原圖 → 背景產生並上傳縮圖")
+    print("="*70)
+
+    png = make_png()
+    uploads = {}
+
+    async def fake_upload(filename, image_bytes, content_type='image/png'):
+        uploads[filename] = (content_type, bytes(image_bytes))
+        return f"/{Config.MINIO_BUCKET}/{filename}"
+
+    service = GeminiService()
+    service.image_engine = 'openai'
+    service.storage = Mock()
+    service.openai_client = Mock()
+    service._upload_image = fake_upload
+    service._generate_with_openai = AsyncMock(return_value=png)
+
+    received = {}
+    done = threading.Event()
+
+    def on_complete(thumbnails):
+        received.update(thumbnails)
+        done.set()
+
+    try:
+        start = time.perf_counter()
+        image_url, _ = service.generate_gift_image_with_retry("test prompt")
+        attached = service.on_thumbnails(image_url, on_complete)
+        # 登記回呼後立即返回，不等待縮圖產生
+        returned_in = time.perf_counter() - start
+        done.wait(Config.THUMBNAIL_TIMEOUT)
+        thumbnails = dict(received)
+        # 已登記過（或沒有排程）的原圖回傳 False
+        missing = service.on_thumbnails(image_url, on_complete)
+
+        # 超過待處理上限時捨棄最舊的縮圖工作
+        thumbnails_module.MAX_PENDING_RESULTS = 1
+
+        async def schedule_two():
+            service.thumbnails.schedule('/gift-images/a.png', png)
+            service.thumbnails.schedule('/gift-images/b.png', png)
+            return (service.thumbnails.attach('/gift-images/a.png', on_complete),
+                    service.thumbnails.attach('/gift-images/b.png', lambda t: None))
+        evicted, kept = service.runner.run(schedule_two())
+    finally:
+        thumbnails_module.MAX_PENDING_RESULTS = 100
+        service.thumbnails.shutdown()
+
+    stem = image_url.rsplit('/', 1)[1].rsplit('.', 1)[0]
+    expected = {str(size): f"/{Config.MINIO_BUCKET}/{stem}_{size}.webp"
+                for size in Config.THUMBNAIL_SIZES}
+    content_types = {uploads[path.rsplit('/', 1)[1]][0] for path in thumbnails.values()}
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"原圖: {image_url}")
+    print(f"縮圖: {thumbnails}")
+    print(f"縮圖 Content-Type: {content_types}，登記回呼: {attached}，再次登記: {missing}")
+    print(f"生成並登記回呼耗時: {returned_in:.2f} 秒（不等待縮圖）")
+    print(f"超過上限: 最舊的工作已捨棄 {not evicted}，最新的保留 {kept}")
+
+    if (thumbnails == expected and content_types == {'image/webp'} and attached
+            and missing is False and not evicted and kept):
+        print("✅ 測試通過: 縮圖已上傳到原圖旁邊")
+        return True
+    print("❌ 測試失敗: 縮圖路徑或內容不符預期")
+    return False
+
+
+def test_to_dict():
+    """測試 3: Gift.to_dict 包含 thumbnails"""
+    print("\n" + "="*70)
+    print("測試 3: Gift.to_dict / fields 參數")
+    print("="*70)
+
+    thumbnails = {'256': '/gift-images/gift_image_1_0_256.webp'}
+    gift = Gift(id=1, image_url='/gift-images/gift_image_1_0.png', thumbnails=thumbnails)
+    fields = parse_gift_fields('image_url,thumbnails')
+
+    full = gift.to_dict(include_happiness=False)
+    partial = gift.to_dict(fields=fields)
+
+    print(f"\n{'結果分析':=^68}")
+    print(f"to_dict(include_happiness=False)['thumbnails']: {full.get('thumbnails')}")
+    print(f"to_dict(fields=image_url,thumbnails): {partial}")
+
+    if full.get('thumbnails') == thumbnails and partial == {
+            'id': 1, 'image_url': gift.image_url, 'thumbnails': thumbnails}:
+        print("✅ 測試通過: 禮物資料包含縮圖")
+        return True
+    print("❌ 測試失敗: 禮物資料缺少縮圖")
+    return False
+
+
+def main():
+    tests = [
+        ("縮圖尺寸與大小", test_render_sizes),
+        ("縮圖產生與上傳", test_pipeline),
+        ("禮物資料包含縮圖", test_to_dict),
+    ]
+
+    results = []
+    for name, func in tests:
+        try:
+            results.append((name, func()))
+        except Exception as e:
+            print(f"\n❌ 測試 '{name}' 發生異常: {e}")
+            import traceback
+            traceback.print_exc()
+            results.append((name, False))
+
+    print("\n" + "="*70)
+    print("測試總結")
+    print("="*70)
+    for name, passed in results:
+        print(f"{'✅ 通過' if passed else '❌ 失敗'} - {name}")
+    passed = sum(1 for _, ok in results if ok)
+    print(f"\n總計: {passed}/{len(results)} 個測試通過")
+    return passed == len(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
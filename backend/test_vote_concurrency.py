@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+測試投票併發安全性
+
+同一個投票者指紋同時送出數百張投票（分散在多個禮物上），驗證:
+1. 每個獎項剛好只有 3 張投票寫入
+2. 被拒絕的請求回傳原本的 400 錯誤訊息
+3. 禮物上的票數計數與投票記錄一致
+
+預設使用暫存的 SQLite 資料庫；設定 TEST_DATABASE_URL 可改用 PostgreSQL
+（注意：會清空該資料庫的資料表）。
+
+資料庫需在載入 app 之前設定，因此測試一律在獨立的子行程執行：
+直接執行 python test_vote_concurrency.py，或由 pytest 收集時啟動子行程，
+不受同一個 pytest 行程中其他測試已載入的設定影響。
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+NUM_GIFTS = 10
+NUM_REQUESTS = 300
+
+
+def setup_gifts(app):
+    """重建資料表並建立測試禮物"""
+    from models import db, Gift
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(NUM_GIFTS):
+            db.session.add(Gift(
+                player_name=f'玩家{i}', gift_name=f'禮物{i}', appearance='圓形',
+                who_likes='上班族', usage_time='早上', happiness_reason='溫暖'))
+        db.session.commit()
+        return [gift_id for (gift_id,) in db.session.query(Gift.id)]
+
+
+def run_parallel_votes():
+    """同一指紋併發投票，每個獎項剛好寫入 3 票（需在已設定資料庫的行程中執行）"""
+    from app import app
+    from models import db, Gift, Vote, VOTES_PER_AWARD
+
+    expected_errors = {f'您已用完此獎項的{VOTES_PER_AWARD}票', '您已對此禮物投過此獎項'}
+
+    print("\n" + "="*70)
+    print(f"測試: 同一指紋併發送出 {NUM_REQUESTS} 張投票")
+    print("="*70)
+
+    gift_ids = setup_gifts(app)
+    fingerprint = 'concurrent-voter'
+
+    def vote(i):
+        client = app.test_client()
+        response = client.post('/api/voting/submit', json={
+            'gift_id': gift_ids[i % len(gift_ids)],
+            'award_type': 'creative' if i % 2 == 0 else 'blessing',
+            'voter_fingerprint': fingerprint,
+        })
+        return response.status_code, response.get_json()
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        responses = list(executor.map(vote, range(NUM_REQUESTS)))
+
+    status_counts = Counter(status for status, _ in responses)
+    unexpected = [body for status, body in responses
+                  if status != 200 and body.get('error') not in expected_errors]
+    print(f"回應狀態統計: {dict(status_counts)}")
+
+    passed = True
+    with app.app_context():
+        for award_type in ('creative', 'blessing'):
+            votes = Vote.query.filter_by(
+                voter_fingerprint=fingerprint, award_type=award_type).all()
+            slots = sorted(v.slot for v in votes)
+            counter_total = db.session.query(
+                db.func.sum(getattr(Gift, f'{award_type}_votes'))).scalar()
+            print(f"{award_type}: 寫入 {len(votes)} 票，名額 {slots}，計數總和 {counter_total}")
+            if len(votes) != VOTES_PER_AWARD or counter_total != VOTES_PER_AWARD:
+                passed = False
+
+    if status_counts[200] != VOTES_PER_AWARD * 2:
+        passed = False
+    if unexpected:
+        print(f"非預期錯誤: {unexpected[:5]}")
+        passed = False
+
+    if passed:
+        print("✅ 測試通過: 每個獎項剛好寫入 3 票")
+    else:
+        print("❌ 測試失敗")
+    return passed
+
+
+def test_parallel_votes_single_fingerprint():
+    """pytest 入口：在獨立的子行程執行，子行程載入 app 前先設定資料庫"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True)
+    print(result.stdout)
+    assert result.returncode == 0, result.stdout[-2000:] + result.stderr[-2000:]
+
+
+def main():
+    # 必須在載入 app 之前設定資料庫
+    os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL') or \
+        f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_votes.db')}"
+    result = run_parallel_votes()
+    return 0 if result else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""生成圖片的 WebP 縮圖
+
+原圖上傳後立即在 process pool 中產生數種尺寸的 WebP 縮圖（Pillow 編碼
+佔用 CPU，放在事件迴圈或 worker 執行緒會拖慢其他請求），上傳到原圖旁邊：
+gift_image_<時間>_<uuid>.png → gift_image_<時間>_<uuid>_<尺寸>.webp。
+
+schedule() 在 AI 事件迴圈上呼叫，回傳後縮圖在背景產生；生成工作把原圖
+寫入資料庫後以 attach() 登記完成時的回呼，不等待縮圖，立即釋放 worker。
+縮圖完成後回呼在執行緒中收到 {尺寸: 相對路徑}；失敗、逾時或被捨棄時不呼叫，
+禮物的 thumbnails 維持 null，前端改用原圖。
+"""
+import asyncio
+import multiprocessing
+import posixpath
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from metrics import metrics
+
+# 保留尚未被 attach() 取走的縮圖工作數上限（生成工作失敗時不會取走）
+MAX_PENDING_RESULTS = 100
+
+
+def render_thumbnails(image_bytes, sizes, quality):
+    """產生各尺寸的 WebP 縮圖，回傳 {尺寸: bytes}（在子行程中執行）"""
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes))
+    image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    results = {}
+    # 由大到小依序縮小，每次從上一個尺寸縮，減少重複取樣原圖
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format='WEBP', quality=quality, method=4)
+        results[size] = output.getvalue()
+    return results
+
+
+def thumbnail_filename(filename, size):
+    """原圖檔名對應的縮圖檔名"""
+    stem, _ = posixpath.splitext(filename)
+    return f"{stem}_{size}.webp"
+
+
+class ThumbnailPipeline:
+    """在 process pool 產生縮圖並上傳"""
+
+    def __init__(self, upload, sizes, quality=75, workers=1, timeout=None):
+        # upload(filename, data, content_type) 為協程，回傳相對路徑（失敗時回傳 None）
+        self.upload = upload
+        self.sizes = tuple(sizes)
+        self.quality = quality
+        self.workers = max(1, workers)
+        self.timeout = timeout  # 單張原圖產生並上傳縮圖的上限（秒）
+        self._pool = None
+        self._pending = OrderedDict()  # 原圖相對路徑 -> 縮圖工作
+
+    @property
+    def enabled(self):
+        return bool(self.sizes)
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn：行程中有事件迴圈與 worker 執行緒，fork 可能複製到被鎖住的鎖
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def schedule(self, image_path, image_bytes):
+        """開始為剛上傳的原圖產生縮圖（需在事件迴圈上呼叫）"""
+        if not self.enabled:
+            return
+        # 子行程需要可序列化的 bytes；memoryview 在此複製一次
+        task = asyncio.ensure_future(self._create(image_path, bytes(image_bytes)))
+        self._pending[image_path] = task
+        while len(self._pending) > MAX_PENDING_RESULTS:
+            dropped_path, dropped = self._pending.popitem(last=False)
+            dropped.cancel()
+            print(f"✗ 待處理的縮圖工作過多，捨棄 {dropped_path}（thumbnails 維持 null）", flush=True)
+            metrics.increment('thumbnails.dropped')
+
+    def attach(self, image_path, callback):
+        """縮圖完成時在執行緒中呼叫 callback({尺寸字串: 相對路徑})（需在事件迴圈上呼叫）
+
+        沒有排程（停用或已被捨棄）時回傳 False；縮圖失敗或逾時時不呼叫 callback。
+        """
+        task = self._pending.pop(image_path, None)
+        if task is None:
+            return False
+
+        def done(task):
+            if task.cancelled() or not task.result():
+                return
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, callback, task.result())
+            future.add_done_callback(self._report_callback_error)
+
+        task.add_done_callback(done)
+        return True
+
+    @staticmethod
+    def _report_callback_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"✗ 保存縮圖失敗: {future.exception()}", flush=True)
+
+    async def _create(self, image_path, image_bytes):
+        loop = asyncio.get_running_loop()
+        filename = posixpath.basename(image_path)
+        try:
+            rendered, paths = await asyncio.wait_for(
+                self._render_and_upload(loop, filename, image_bytes), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"✗ 縮圖產生超時: {image_path}", flush=True)
+            metrics.increment('thumbnails.failed')
+            return {}
+        except Exception as e:
+            print(f"✗ 縮圖產生失敗 ({image_path}): {e}", flush=True)
+            metrics.increment('thumbnails.failed')
+            return {}
+
+        thumbnails = {str(size): path
+                      for size, path in zip(rendered, paths) if path}
+        total = sum(len(data) for data in rendered.values())
+        print(f"🖼️  縮圖完成 {sorted(thumbnails, key=int)} "
+              f"({total / 1024:.1f} KB，原圖 {len(image_bytes) / 1024:.1f} KB)", flush=True)
+        return thumbnails
+
+    async def _render_and_upload(self, loop, filename, image_bytes):
+        with metrics.timer('thumbnails.render'):
+            rendered = await loop.run_in_executor(
+                self._executor(), render_thumbnails,
+                image_bytes, self.sizes, self.quality)
+
+        paths = await asyncio.gather(*(
+            self.upload(thumbnail_filename(filename, size), data, 'image/webp')
+            for size, data in rendered.items()))
+        return rendered, paths
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
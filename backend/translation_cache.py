@@ -0,0 +1,186 @@
+"""禮物名稱翻譯快取：行程內 LRU + gift_name_translations 資料表
+
+同樣的中文禮物名稱（咖啡杯、香氛蠟燭…）在不同禮物與重新生成之間大量重複，
+命中快取時即可省下一次 Gemini 翻譯呼叫。鍵為正規化後的中文名稱。
+"""
+import csv
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from flask import has_app_context
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from config import Config
+from models import db, GiftNameTranslation
+
+# 正規化時去除的前後標點（AI 回答常帶引號或句號）
+STRIP_CHARS = ' "\'「」『』“”‘’。，、,.!！?？:：'
+
+# 支援 INSERT ... ON CONFLICT DO UPDATE 的資料庫
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+# 每個 upsert 語句的筆數（SQLite 單一語句最多 32766 個參數）
+UPSERT_BATCH_SIZE = 500
+
+
+def normalize_gift_name(name):
+    """全形轉半形、合併空白、去除前後標點並轉小寫"""
+    name = unicodedata.normalize('NFKC', name or '')
+    return ' '.join(name.split()).strip(STRIP_CHARS).lower()
+
+
+def read_translation_csv(file):
+    """讀取「中文名稱,英文翻譯」格式的 CSV，略過標題列、空白列與 # 註解"""
+    rows = []
+    for row in csv.reader(file):
+        if not row or row[0].lstrip().startswith('#') or len(row) < 2:
+            continue
+        name, translation = row[0].strip(), row[1].strip()
+        if not name or not translation or name.lower() == 'name':
+            continue
+        rows.append((name, translation))
+    return rows
+
+
+class TranslationCache:
+    """兩層翻譯快取：行程內 LRU 在前，資料表為持久層"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    def get(self, gift_name):
+        """查詢翻譯，未命中時回傳 None（沒有 app context 時只查行程內快取）"""
+        key = normalize_gift_name(gift_name)
+        if not key:
+            return None
+
+        with self._lock:
+            translation = self._entries.get(key)
+            if translation is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return translation
+
+        translation = None
+        if has_app_context():
+            table = GiftNameTranslation.__table__
+            try:
+                translation = db.session.execute(
+                    select(table.c.translation).where(table.c.name == key)).scalar()
+            except Exception as e:
+                print(f"✗ 讀取翻譯快取失敗: {e}", flush=True)
+                db.session.rollback()
+                with self._lock:
+                    self.errors += 1
+
+        with self._lock:
+            if translation is None:
+                self.misses += 1
+            else:
+                self.db_hits += 1
+                self._remember(key, translation)
+        return translation
+
+    def set(self, gift_name, translation, source='llm'):
+        """儲存單筆翻譯（寫入資料表失敗只記錄錯誤，不影響呼叫端）"""
+        try:
+            self.prewarm([(gift_name, translation)], source=source)
+        except Exception as e:
+            print(f"✗ 寫入翻譯快取失敗: {e}", flush=True)
+            db.session.rollback()
+            with self._lock:
+                self.errors += 1
+
+    def prewarm(self, rows, source='csv'):
+        """批次寫入 (中文名稱, 英文翻譯)，回傳寫入筆數"""
+        entries = {}
+        for gift_name, translation in rows:
+            key = normalize_gift_name(gift_name)
+            translation = (translation or '').strip()
+            if key and translation:
+                entries[key] = translation[:200]
+
+        with self._lock:
+            for key, translation in entries.items():
+                self._remember(key, translation)
+            self.stores += len(entries)
+
+        if entries and has_app_context():
+            self._upsert(entries, source)
+        return len(entries)
+
+    def _upsert(self, entries, source):
+        """寫入資料表，已存在的名稱以新翻譯覆寫
+
+        PostgreSQL/SQLite 以 INSERT ... ON CONFLICT DO UPDATE 批次寫入，並發寫入同一
+        名稱時不會互相衝突；其他資料庫逐筆以 SAVEPOINT 寫入，只略過衝突的那一筆。
+        """
+        table = GiftNameTranslation.__table__
+        now = datetime.utcnow()
+        rows = [{'name': key, 'translation': translation, 'source': source,
+                 'created_at': now, 'updated_at': now}
+                for key, translation in entries.items()]
+        dialect_insert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+        try:
+            if dialect_insert is not None:
+                for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+                    stmt = dialect_insert(table).values(
+                        rows[start:start + UPSERT_BATCH_SIZE])
+                    db.session.execute(stmt.on_conflict_do_update(
+                        index_elements=[table.c.name],
+                        set_={'translation': stmt.excluded.translation,
+                              'source': stmt.excluded.source,
+                              'updated_at': stmt.excluded.updated_at}))
+            else:
+                for row in rows:
+                    self._upsert_row(table, row)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _upsert_row(self, table, row):
+        """先 UPDATE，不存在時再 INSERT；並發插入同一名稱時保留先寫入的結果"""
+        try:
+            with db.session.begin_nested():
+                result = db.session.execute(
+                    update(table).where(table.c.name == row['name'])
+                    .values(translation=row['translation'], source=row['source'],
+                            updated_at=row['updated_at']))
+                if result.rowcount == 0:
+                    db.session.execute(insert(table).values(**row))
+        except IntegrityError:
+            print(f"⚠️  翻譯快取 {row['name']} 已由其他請求寫入，略過", flush=True)
+
+    def _remember(self, key, translation):
+        """放入行程內 LRU（需持有鎖）"""
+        self._entries[key] = translation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            hits = self.memory_hits + self.db_hits
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'errors': self.errors,
+            }
+
+
+translation_cache = TranslationCache(Config.TRANSLATION_CACHE_MAX_ENTRIES)
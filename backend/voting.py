@@ -0,0 +1,81 @@
+"""投票寫入：單一條件式 INSERT，由資料庫約束保證票數上限與不重複投票"""
+from datetime import datetime
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from models import db, Gift, Vote, VOTES_PER_AWARD
+from voting_results import increment_vote_count
+
+
+class VoteError(Exception):
+    """投票被拒絕（附帶 HTTP 狀態碼）"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _violated_constraint(error):
+    """由 IntegrityError 判斷違反的約束（PostgreSQL 回報約束名稱，SQLite 回報欄位）"""
+    message = str(error.orig)
+    if 'ck_vote_slot_range' in message:
+        return 'quota'
+    if 'uq_vote_voter_gift_award' in message or 'votes.gift_id' in message:
+        return 'duplicate'
+    if 'uq_vote_voter_award_slot' in message or 'votes.slot' in message:
+        return 'slot'
+    return None
+
+
+def _insert_vote_statement(gift_id, award_type, voter_fingerprint, voter_ip):
+    """INSERT ... SELECT：禮物存在時才寫入，並取用投票者下一個名額序號"""
+    votes = Vote.__table__
+    next_slot = (select(func.coalesce(func.max(votes.c.slot), 0) + 1)
+                 .where(votes.c.voter_fingerprint == voter_fingerprint,
+                        votes.c.award_type == award_type)
+                 .scalar_subquery())
+
+    source = select(
+        Gift.id,
+        literal(award_type),
+        literal(voter_fingerprint),
+        literal(voter_ip),
+        next_slot,
+        literal(datetime.utcnow()),
+    ).where(Gift.id == gift_id)
+
+    return (insert(votes)
+            .from_select(['gift_id', 'award_type', 'voter_fingerprint',
+                          'voter_ip', 'slot', 'created_at'], source)
+            .returning(votes.c.slot))
+
+
+def cast_vote(gift_id, award_type, voter_fingerprint, voter_ip=None):
+    """寫入一張投票並更新票數計數，回傳 (剩餘票數, 該禮物最新票數)
+
+    名額衝突（同一投票者的兩個請求同時取得相同序號）時重新計算序號；
+    每次衝突都代表有一個名額被佔用，因此最多重試 VOTES_PER_AWARD 次。
+    """
+    for _ in range(VOTES_PER_AWARD + 1):
+        try:
+            slot = db.session.execute(_insert_vote_statement(
+                gift_id, award_type, voter_fingerprint, voter_ip)).scalar()
+            if slot is None:
+                db.session.rollback()
+                raise VoteError('禮物不存在', 404)
+
+            tally = increment_vote_count(gift_id, award_type)
+            db.session.commit()
+            return VOTES_PER_AWARD - slot, tally
+
+        except IntegrityError as e:
+            db.session.rollback()
+            violated = _violated_constraint(e)
+            if violated == 'quota':
+                raise VoteError(f'您已用完此獎項的{VOTES_PER_AWARD}票')
+            if violated == 'duplicate':
+                raise VoteError('您已對此禮物投過此獎項')
+            if violated != 'slot':
+                raise
+
+    raise VoteError(f'您已用完此獎項的{VOTES_PER_AWARD}票')
@@ -0,0 +1,103 @@
+"""投票結果計算：讀取 Gift 上的票數計數並在伺服器端排名，並提供計數對帳"""
+from datetime import datetime
+from sqlalchemy import case, func, select, update
+from models import db, Gift, Vote
+
+AWARD_TYPES = ('creative', 'blessing')
+VOTE_COUNT_COLUMNS = {award_type: getattr(Gift, f'{award_type}_votes')
+                      for award_type in AWARD_TYPES}
+
+
+def increment_vote_count(gift_id, award_type):
+    """在目前交易中將禮物的票數計數加一（與投票寫入一起提交），回傳最新票數"""
+    column = VOTE_COUNT_COLUMNS[award_type]
+    counts = db.session.execute(
+        update(Gift)
+        .where(Gift.id == gift_id)
+        # 保留 updated_at：票數不屬於禮物列表內容，避免觸發列表更新
+        .values({column: column + 1, Gift.updated_at: Gift.updated_at})
+        .returning(*VOTE_COUNT_COLUMNS.values())).one()
+    return {f'{award}_votes': count
+            for award, count in zip(AWARD_TYPES, counts)}
+
+
+def count_votes_by_gift():
+    """由 votes 表以單一 GROUP BY 查詢統計各禮物各獎項票數"""
+    rows = (db.session.query(
+        Vote.gift_id,
+        *[func.sum(case((Vote.award_type == award_type, 1), else_=0))
+          for award_type in AWARD_TYPES])
+        .group_by(Vote.gift_id))
+
+    return {gift_id: dict(zip(AWARD_TYPES, map(int, counts)))
+            for gift_id, *counts in rows}
+
+
+def rank_gifts(results, award_type):
+    """依票數排名：票數高者在前，同票時先提交者在前；同票同名次（1, 2, 2, 4）"""
+    votes_key = f'{award_type}_votes'
+    ordered = sorted(results, key=lambda g: (
+        -g[votes_key], g['created_at'] or datetime.min, g['id']))
+
+    rank = 0
+    previous_votes = None
+    for position, gift_data in enumerate(ordered, start=1):
+        if gift_data[votes_key] != previous_votes:
+            rank = position
+            previous_votes = gift_data[votes_key]
+        gift_data[f'{award_type}_rank'] = rank
+
+    return [gift_data['id'] for gift_data in ordered]
+
+
+def compute_voting_results():
+    """計算所有禮物的票數與排名（只讀 gifts 表的計數欄位）"""
+    results = []
+    for gift in Gift.query.order_by(Gift.id):
+        gift_data = gift.to_dict(include_happiness=False)
+        for award_type, column in VOTE_COUNT_COLUMNS.items():
+            gift_data[f'{award_type}_votes'] = getattr(gift, column.key)
+        results.append(gift_data)
+
+    rankings = {award_type: rank_gifts(results, award_type)
+                for award_type in AWARD_TYPES}
+
+    return {
+        'gifts': results,
+        'rankings': rankings,
+        'total': len(results)
+    }
+
+
+def reconcile_vote_counts(apply=True):
+    """比對計數欄位與 votes 表的實際票數，回傳差異並（可選）整批重建計數"""
+    actual = count_votes_by_gift()
+    stored = db.session.query(Gift.id, *VOTE_COUNT_COLUMNS.values())
+
+    drift = []
+    for gift_id, *counts in stored:
+        expected = actual.get(gift_id, {})
+        for award_type, count in zip(AWARD_TYPES, counts):
+            expected_count = expected.get(award_type, 0)
+            if count != expected_count:
+                drift.append({
+                    'gift_id': gift_id,
+                    'award_type': award_type,
+                    'stored': count,
+                    'actual': expected_count
+                })
+
+    if apply and drift:
+        # 單一 UPDATE 以相關子查詢重建所有計數
+        db.session.execute(
+            update(Gift).values({
+                column: func.coalesce(
+                    select(func.count(Vote.id))
+                    .where(Vote.gift_id == Gift.id,
+                           Vote.award_type == award_type)
+                    .scalar_subquery(), 0)
+                for award_type, column in VOTE_COUNT_COLUMNS.items()
+            } | {Gift.updated_at: Gift.updated_at}))
+        db.session.commit()
+
+    return drift
@@ -0,0 +1,7 @@
+"""WSGI 進入點
+
+正式環境: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import app
+
+__all__ = ['app']
@@ -13,11 +13,68 @@ const api = axios.create({
 export const getFullImageUrl = (imageUrl) => {
   if (!imageUrl) return null;
   if (imageUrl.startsWith('http')) return imageUrl;
+  // 本機儲存後端（STORAGE_BACKEND=local）的圖片由後端 /api/storage 提供，經由 proxy 存取
+  if (imageUrl.startsWith('/api/')) return imageUrl;
   // 如果是相對路徑 (例如 /gift-images/xxx.png)，使用當前主機名加上 MinIO 端口
   const hostname = window.location.hostname;
   return `http://${hostname}:9000${imageUrl}`;
 };
 
+// 依顯示大小挑選禮物圖片：取不小於實際像素的最小 WebP 縮圖，沒有縮圖時使用原圖
+export const getGiftImageUrl = (gift, displaySize) => {
+  const thumbnails = gift?.thumbnails;
+  if (thumbnails) {
+    const pixels = displaySize * (window.devicePixelRatio || 1);
+    const sizes = Object.keys(thumbnails).map(Number).sort((a, b) => a - b);
+    const size = sizes.find(s => s >= pixels);
+    if (size) return getFullImageUrl(thumbnails[size]);
+  }
+  return getFullImageUrl(gift?.image_url);
+};
+
+// 訂閱伺服器推送事件（Server-Sent Events），回傳取消訂閱函數
+// 斷線或伺服器結束串流時瀏覽器會自動帶 Last-Event-ID 重新連線並補送遺漏的事件；
+// 伺服器串流名額已滿時回傳 503，瀏覽器不會自動重新連線，改為延遲後重新建立連線
+export const subscribeEvents = (handlers, { giftId, onOpen } = {}) => {
+  let source = null;
+  let lastEventId = null;
+  let retryTimer = null;
+  let retryDelay = 3000;
+  let closed = false;
+
+  const connect = () => {
+    const params = new URLSearchParams();
+    if (giftId) params.set('gift_id', giftId);
+    if (lastEventId) params.set('last_event_id', lastEventId);
+    const query = params.toString();
+    source = new EventSource(query ? `/api/events?${query}` : '/api/events');
+
+    Object.entries(handlers).forEach(([eventType, handler]) => {
+      source.addEventListener(eventType, (e) => {
+        if (e.lastEventId) lastEventId = e.lastEventId;
+        handler(JSON.parse(e.data));
+      });
+    });
+    source.onopen = (e) => {
+      retryDelay = 3000;
+      if (onOpen) onOpen(e);
+    };
+    source.onerror = () => {
+      if (closed || source.readyState !== EventSource.CLOSED) return;
+      // 隨機延遲，避免被拒絕的客戶端同時重新連線
+      retryTimer = setTimeout(connect, retryDelay * (0.5 + Math.random()));
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    source.close();
+  };
+};
+
 export const giftAPI = {
   // 提交表單
   submitForm: (formData) => api.post('/api/submit-form', formData),
@@ -25,14 +82,15 @@ export const giftAPI = {
   // 生成禮物圖片
   generateGift: (giftId) => api.post(`/api/generate-gift/${giftId}`),
 
-  // 重新生成
-  regenerateGift: (giftId) => api.post(`/api/regenerate/${giftId}`),
+  // 重新生成（預設沿用 AI 先前的猜測，newGuess 為 true 時重新猜測）
+  regenerateGift: (giftId, { newGuess = false } = {}) =>
+    api.post(`/api/regenerate/${giftId}`, { new_guess: newGuess }),
 
   // 確認禮物
   confirmGift: (giftId) => api.post(`/api/confirm/${giftId}`),
 
-  // 取得所有禮物
-  getAllGifts: () => api.get('/api/gifts'),
+  // 取得所有禮物（可帶 cursor / updated_since 只取得變更的禮物）
+  getAllGifts: (params) => api.get('/api/gifts', { params }),
 
   // 取得單一禮物詳情
   getGiftDetail: (giftId) => api.get(`/api/gift/${giftId}`),
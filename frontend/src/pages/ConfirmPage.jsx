@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { giftAPI, getFullImageUrl } from '../api';
+import { giftAPI, getFullImageUrl, subscribeEvents } from '../api';
 
 function ConfirmPage() {
   const { giftId } = useParams();
@@ -11,51 +11,58 @@ function ConfirmPage() {
   const [error, setError] = useState('');
   const [regenerating, setRegenerating] = useState(false);
   const [generationStatus, setGenerationStatus] = useState(null);
+  const [regenerationQueued, setRegenerationQueued] = useState(false);
 
   useEffect(() => {
     loadGift();
   }, [giftId]);
 
-  // 輪詢查詢圖片生成狀態
+  // 重新生成已送出後，訂閱圖片生成狀態事件（取代輪詢）
   useEffect(() => {
-    let pollInterval = null;
+    if (!regenerationQueued) return undefined;
 
-    if (regenerating) {
-      pollInterval = setInterval(async () => {
-        try {
-          const response = await giftAPI.getGenerationStatus(giftId);
-          const status = response.data;
+    const applyStatus = async (status) => {
+      setGenerationStatus({
+        status: status.status,
+        retryCount: status.retry_count,
+        error: status.error,
+        queueInfo: status.queue_info,
+        queue: status.queue
+      });
 
-          setGenerationStatus({
-            status: status.status,
-            retryCount: status.retry_count,
-            error: status.error,
-            queueInfo: status.queue_info
-          });
+      // 如果完成或失敗，停止訂閱並重新載入
+      if (status.status === 'completed') {
+        unsubscribe();
+        setRegenerating(false);
+        setRegenerationQueued(false);
+        await loadGift();
+      } else if (status.status === 'failed') {
+        unsubscribe();
+        setRegenerating(false);
+        setRegenerationQueued(false);
+        setError(`圖片生成失敗: ${status.error || '未知錯誤'}`);
+        await loadGift();
+      }
+    };
 
-          // 如果完成或失敗，停止輪詢並重新載入
-          if (status.status === 'completed') {
-            clearInterval(pollInterval);
-            setRegenerating(false);
-            await loadGift();
-          } else if (status.status === 'failed') {
-            clearInterval(pollInterval);
-            setRegenerating(false);
-            setError(`圖片生成失敗: ${status.error || '未知錯誤'}`);
-            await loadGift();
+    const unsubscribe = subscribeEvents(
+      { 'generation-status-changed': applyStatus },
+      {
+        giftId,
+        // 連線時先查詢一次目前狀態，避免錯過連線前的狀態變更
+        onOpen: async () => {
+          try {
+            const response = await giftAPI.getGenerationStatus(giftId);
+            await applyStatus(response.data);
+          } catch (err) {
+            console.error('查詢狀態錯誤:', err);
           }
-        } catch (err) {
-          console.error('輪詢狀態錯誤:', err);
-        }
-      }, 2000); // 每2秒查詢一次
-    }
-
-    return () => {
-      if (pollInterval) {
-        clearInterval(pollInterval);
+        },
       }
-    };
-  }, [regenerating, giftId]);
+    );
+
+    return unsubscribe;
+  }, [regenerationQueued, giftId]);
 
   const loadGift = async () => {
     try {
@@ -84,15 +91,19 @@ function ConfirmPage() {
     });
   };
 
-  const handleRegenerate = async () => {
+  const handleRegenerate = async (newGuess = false) => {
     try {
       setError('');
       setRegenerating(true);
       setGenerationStatus({ status: 'processing', retryCount: 0 });
-      await giftAPI.regenerateGift(giftId);
-      // 輪詢機制會自動處理後續
+      await giftAPI.regenerateGift(giftId, { newGuess });
+      // 佇列已接受後才開始訂閱，事件訂閱會自動處理後續
+      setRegenerationQueued(true);
     } catch (err) {
-      setError('重新生成失敗，請稍後再試');
+      // 429：重新生成太頻繁，顯示後端提供的等待時間
+      setError(err.response?.status === 429
+        ? err.response.data.error
+        : '重新生成失敗，請稍後再試');
       setRegenerating(false);
     }
   };
@@ -119,13 +130,28 @@ function ConfirmPage() {
   const getRegeneratingMessage = () => {
     if (!generationStatus) return '重新生成中...';
 
+    const queueInfo = generationStatus.queueInfo;
+    if (queueInfo?.provider_busy) {
+      return `AI 畫家目前忙碌中，約 ${Math.ceil(queueInfo.retry_after_seconds)} 秒後恢復`;
+    }
+
+    const queue = generationStatus.queue;
+    if (generationStatus.status === 'pending' && queue?.position) {
+      const eta = queue.estimated_wait_seconds >= 60
+        ? `，預計約 ${Math.ceil(queue.estimated_wait_seconds / 60)} 分鐘後開始`
+        : '，即將開始';
+      return `排隊中... (第 ${queue.position} 位${eta})`;
+    }
+
     if (generationStatus.status === 'processing') {
       if (generationStatus.retryCount > 0) {
         return `重試中 (第 ${generationStatus.retryCount} 次)`;
       }
-      const queueInfo = generationStatus.queueInfo;
       if (queueInfo && queueInfo.available_slots === 0) {
-        return `等候中... (目前 ${queueInfo.active_count} 人在使用)`;
+        const waiting = queueInfo.waiting_count
+          ? `，${queueInfo.waiting_count} 人排隊`
+          : '';
+        return `等候中... (目前 ${queueInfo.active_count} 人在使用${waiting})`;
       }
       return '重新生成中...';
     }
@@ -234,15 +260,23 @@ function ConfirmPage() {
           >
             ✏️ 重新編輯
           </button>
-          {gift.image_generation_status === 'failed' && (
+          {gift.image_generation_status === 'failed' ? (
             <button
               className="btn btn-warning"
-              onClick={handleRegenerate}
+              onClick={() => handleRegenerate()}
               disabled={regenerating}
               style={{ backgroundColor: '#f39c12', borderColor: '#e67e22' }}
             >
               🔄 重新生成
             </button>
+          ) : (
+            <button
+              className="btn btn-secondary"
+              onClick={() => handleRegenerate(true)}
+              disabled={regenerating}
+            >
+              🤔 猜錯了，重新猜測
+            </button>
           )}
           <button
             className="btn btn-primary"
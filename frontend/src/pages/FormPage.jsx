@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
-import { giftAPI } from '../api';
+import { giftAPI, subscribeEvents } from '../api';
 
 function FormPage() {
   const navigate = useNavigate();
@@ -25,46 +25,51 @@ function FormPage() {
     }
   }, [location.state]);
 
-  // 輪詢查詢圖片生成狀態
+  // 訂閱圖片生成狀態事件（取代輪詢）
+  const generatingGiftId = generationStatus?.giftId;
   useEffect(() => {
-    let pollInterval = null;
-
-    if (loading && generationStatus?.giftId) {
-      pollInterval = setInterval(async () => {
-        try {
-          const response = await giftAPI.getGenerationStatus(generationStatus.giftId);
-          const status = response.data;
-
-          setGenerationStatus({
-            ...generationStatus,
-            status: status.status,
-            retryCount: status.retry_count,
-            error: status.error,
-            queueInfo: status.queue_info
-          });
-
-          // 如果完成或失敗，停止輪詢並導航
-          if (status.status === 'completed') {
-            clearInterval(pollInterval);
-            setLoading(false);
-            navigate(`/confirm/${generationStatus.giftId}`);
-          } else if (status.status === 'failed') {
-            clearInterval(pollInterval);
-            setLoading(false);
-            setError(`圖片生成失敗: ${status.error || '未知錯誤'}`);
-          }
-        } catch (err) {
-          console.error('輪詢狀態錯誤:', err);
-        }
-      }, 2000); // 每2秒查詢一次
-    }
+    if (!loading || !generatingGiftId) return undefined;
+
+    const applyStatus = (status) => {
+      setGenerationStatus((prev) => ({
+        ...prev,
+        status: status.status,
+        retryCount: status.retry_count,
+        error: status.error,
+        queueInfo: status.queue_info,
+        queue: status.queue
+      }));
 
-    return () => {
-      if (pollInterval) {
-        clearInterval(pollInterval);
+      // 如果完成或失敗，停止訂閱並導航
+      if (status.status === 'completed') {
+        unsubscribe();
+        setLoading(false);
+        navigate(`/confirm/${generatingGiftId}`);
+      } else if (status.status === 'failed') {
+        unsubscribe();
+        setLoading(false);
+        setError(`圖片生成失敗: ${status.error || '未知錯誤'}`);
       }
     };
-  }, [loading, generationStatus, navigate]);
+
+    const unsubscribe = subscribeEvents(
+      { 'generation-status-changed': applyStatus },
+      {
+        giftId: generatingGiftId,
+        // 連線時先查詢一次目前狀態，避免錯過連線前的狀態變更
+        onOpen: async () => {
+          try {
+            const response = await giftAPI.getGenerationStatus(generatingGiftId);
+            applyStatus(response.data);
+          } catch (err) {
+            console.error('查詢狀態錯誤:', err);
+          }
+        },
+      }
+    );
+
+    return unsubscribe;
+  }, [loading, generatingGiftId, navigate]);
 
   const handleChange = (e) => {
     setFormData({
@@ -87,7 +92,7 @@ function FormPage() {
       setGenerationStatus({ giftId, status: 'processing', retryCount: 0 });
       await giftAPI.generateGift(giftId);
 
-      // 輪詢機制會自動處理後續導航
+      // 事件訂閱會自動處理後續導航
     } catch (err) {
       console.error('提交錯誤:', err);
       console.error('錯誤詳情:', err.response);
@@ -101,13 +106,28 @@ function FormPage() {
   const getLoadingMessage = () => {
     if (!generationStatus) return 'AI 正在努力畫畫中，畫面請不要關掉喔！';
 
+    const queueInfo = generationStatus.queueInfo;
+    if (queueInfo?.provider_busy) {
+      return `AI 畫家目前忙碌中，約 ${Math.ceil(queueInfo.retry_after_seconds)} 秒後恢復`;
+    }
+
+    const queue = generationStatus.queue;
+    if (generationStatus.status === 'pending' && queue?.position) {
+      const eta = queue.estimated_wait_seconds >= 60
+        ? `，預計約 ${Math.ceil(queue.estimated_wait_seconds / 60)} 分鐘後開始`
+        : '，即將開始';
+      return `排隊中... (第 ${queue.position} 位${eta})`;
+    }
+
     if (generationStatus.status === 'processing') {
       if (generationStatus.retryCount > 0) {
         return `重試中 (第 ${generationStatus.retryCount} 次)`;
       }
-      const queueInfo = generationStatus.queueInfo;
       if (queueInfo && queueInfo.available_slots === 0) {
-        return `等候中... (目前 ${queueInfo.active_count} 人在使用)`;
+        const waiting = queueInfo.waiting_count
+          ? `，${queueInfo.waiting_count} 人排隊`
+          : '';
+        return `等候中... (目前 ${queueInfo.active_count} 人在使用${waiting})`;
       }
       return 'AI 正在努力畫畫中，畫面請不要關掉喔！';
     }
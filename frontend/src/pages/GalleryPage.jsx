@@ -1,6 +1,9 @@
 import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { giftAPI, getFullImageUrl } from '../api';
+import { giftAPI, getGiftImageUrl, subscribeEvents } from '../api';
+
+// 畫廊只需要顯示泡泡的欄位，減少傳輸量（泡泡使用 WebP 縮圖）
+const GALLERY_FIELDS = 'id,image_url,thumbnails,is_confirmed,is_exchanged';
 
 function GalleryPage() {
   const navigate = useNavigate();
@@ -8,18 +11,23 @@ function GalleryPage() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [newGiftIds, setNewGiftIds] = useState(new Set());
-  const pollingIntervalRef = useRef(null);
   const knownGiftIdsRef = useRef(new Set());
+  const cursorRef = useRef(null);
   const animationFrameRef = useRef(null);
   const ballsRef = useRef([]);
 
   useEffect(() => {
     loadGifts();
 
-    // 每3秒檢查一次新禮物
-    pollingIntervalRef.current = setInterval(() => {
-      checkForNewGifts();
-    }, 3000);
+    // 訂閱伺服器推送的禮物事件（取代輪詢）
+    const unsubscribe = subscribeEvents({
+      'gift-created': (event) => addNewGifts([event.gift]),
+      'generation-status-changed': (event) => updateGift(event.gift),
+      'gift-confirmed': (event) => updateGift(event.gift),
+      'gift-exchanged': (event) => updateGift(event.gift),
+      // 伺服器無法補送遺漏的事件時，重新比對一次禮物列表
+      resync: () => checkForNewGifts(),
+    });
 
     // 啟動物理引擎
     const animate = () => {
@@ -31,9 +39,7 @@ function GalleryPage() {
 
     // 清理函數
     return () => {
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
-      }
+      unsubscribe();
       if (animationFrameRef.current) {
         cancelAnimationFrame(animationFrameRef.current);
       }
@@ -42,7 +48,7 @@ function GalleryPage() {
 
   const loadGifts = async () => {
     try {
-      const response = await giftAPI.getAllGifts();
+      const response = await giftAPI.getAllGifts({ fields: GALLERY_FIELDS });
       const minSpeed = 0.3;
       const maxSpeed = 0.8;
 
@@ -70,8 +76,9 @@ function GalleryPage() {
       setGifts(giftsWithPhysics);
       ballsRef.current = giftsWithPhysics;
 
-      // 記錄初始載入的禮物 ID
+      // 記錄初始載入的禮物 ID 與增量查詢游標
       knownGiftIdsRef.current = new Set(giftsWithPhysics.map(g => g.id));
+      cursorRef.current = response.data.next_cursor;
     } catch (err) {
       setError('載入失敗,請稍後再試');
     } finally {
@@ -81,56 +88,83 @@ function GalleryPage() {
 
   const checkForNewGifts = async () => {
     try {
-      const response = await giftAPI.getAllGifts();
-      const newGifts = response.data.gifts.filter(gift => !knownGiftIdsRef.current.has(gift.id));
-
-      if (newGifts.length > 0) {
-        const minSpeed = 0.3;
-        const maxSpeed = 0.8;
-
-        const newGiftsWithPhysics = newGifts.map((gift) => {
-          const ballRadius = 80 + Math.random() * 40; // 泡泡半徑 80-120
-          const minX = ballRadius;
-          const maxX = window.innerWidth - ballRadius;
-          const minY = ballRadius;
-          const maxY = window.innerHeight - ballRadius;
-
-          return {
-            ...gift,
-            x: Math.random() * (maxX - minX) + minX,
-            y: Math.random() * (maxY - minY) + minY,
-            speed: Math.random() * (maxSpeed - minSpeed) + minSpeed,
-            angle: Math.random() * 360,
-            acc: 0.005 * (Math.random() < 0.5 ? -1 : 1),
-            canCollide: false,
-            size: ballRadius * 2,
-            isNew: true,
-          };
-        });
-
-        const updatedGifts = [...ballsRef.current, ...newGiftsWithPhysics];
-        setGifts(updatedGifts);
-        ballsRef.current = updatedGifts;
-
-        newGifts.forEach(gift => {
-          knownGiftIdsRef.current.add(gift.id);
-        });
-
-        const newIds = new Set(newGifts.map(g => g.id));
-        setNewGiftIds(newIds);
-
-        setTimeout(() => {
-          setNewGiftIds(new Set());
-          const updated = ballsRef.current.map(g => ({ ...g, isNew: false }));
-          setGifts(updated);
-          ballsRef.current = updated;
-        }, 3000);
+      // 只取得上次查詢之後變更的禮物
+      const params = { fields: GALLERY_FIELDS };
+      if (cursorRef.current) {
+        params.cursor = cursorRef.current;
       }
+      const response = await giftAPI.getAllGifts(params);
+      const changedGifts = response.data.gifts;
+      cursorRef.current = response.data.next_cursor || cursorRef.current;
+
+      changedGifts.forEach(updateGift);
+      addNewGifts(changedGifts);
     } catch (err) {
+      // 游標無效（例如伺服器更新後的舊游標）時，下次改為重新取得全部禮物
+      if (err.response?.status === 400) {
+        cursorRef.current = null;
+      }
       console.error('檢查新禮物失敗:', err);
     }
   };
 
+  // 更新既有禮物的資料（保留泡泡的位置與速度）
+  const updateGift = (gift) => {
+    if (!gift || !knownGiftIdsRef.current.has(gift.id)) return;
+    const updated = ballsRef.current.map(ball =>
+      ball.id === gift.id ? { ...ball, ...gift } : ball
+    );
+    setGifts(updated);
+    ballsRef.current = updated;
+  };
+
+  const addNewGifts = (gifts) => {
+    const newGifts = gifts.filter(gift => !knownGiftIdsRef.current.has(gift.id));
+
+    if (newGifts.length > 0) {
+      const minSpeed = 0.3;
+      const maxSpeed = 0.8;
+
+      const newGiftsWithPhysics = newGifts.map((gift) => {
+        const ballRadius = 80 + Math.random() * 40; // 泡泡半徑 80-120
+        const minX = ballRadius;
+        const maxX = window.innerWidth - ballRadius;
+        const minY = ballRadius;
+        const maxY = window.innerHeight - ballRadius;
+
+        return {
+          ...gift,
+          x: Math.random() * (maxX - minX) + minX,
+          y: Math.random() * (maxY - minY) + minY,
+          speed: Math.random() * (maxSpeed - minSpeed) + minSpeed,
+          angle: Math.random() * 360,
+          acc: 0.005 * (Math.random() < 0.5 ? -1 : 1),
+          canCollide: false,
+          size: ballRadius * 2,
+          isNew: true,
+        };
+      });
+
+      const updatedGifts = [...ballsRef.current, ...newGiftsWithPhysics];
+      setGifts(updatedGifts);
+      ballsRef.current = updatedGifts;
+
+      newGifts.forEach(gift => {
+        knownGiftIdsRef.current.add(gift.id);
+      });
+
+      const newIds = new Set(newGifts.map(g => g.id));
+      setNewGiftIds(newIds);
+
+      setTimeout(() => {
+        setNewGiftIds(new Set());
+        const updated = ballsRef.current.map(g => ({ ...g, isNew: false }));
+        setGifts(updated);
+        ballsRef.current = updated;
+      }, 3000);
+    }
+  };
+
   const updateBallPositions = () => {
     const minSpeed = 0.3;
     const maxSpeed = 0.8;
@@ -385,7 +419,7 @@ function GalleryPage() {
                     width: '100%',
                     height: '100%',
                     borderRadius: '50%',
-                    background: `url(${getFullImageUrl(gift.image_url)}) no-repeat center center`,
+                    background: `url(${getGiftImageUrl(gift, gift.size)}) no-repeat center center`,
                     backgroundSize: 'cover',
                     boxShadow: gift.isNew
                       ? '0 0 40px rgba(255, 215, 0, 1), 0 0 60px rgba(255, 255, 255, 0.8), inset 0 0 60px rgba(255, 255, 255, 0.3)'
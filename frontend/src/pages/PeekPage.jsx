@@ -17,7 +17,9 @@ function PeekPage() {
 
   const loadGifts = async () => {
     try {
-      const response = await giftAPI.getAllGifts();
+      const response = await giftAPI.getAllGifts({
+        fields: 'id,gift_name,image_url,is_exchanged,happiness_reason',
+      });
       setGifts(response.data.gifts);
     } catch (err) {
       setError('載入失敗，請稍後再試');
@@ -21,17 +21,17 @@ const ResultPage = () => {
       const gifts = response.data.gifts || [];
       setResults(gifts);
 
-      // 計算最佳創意獎前三名
-      const creativeRanking = [...gifts]
-        .sort((a, b) => b.creative_votes - a.creative_votes)
-        .slice(0, 3);
-      setCreativeTop3(creativeRanking);
-
-      // 計算最佳祝福獎前三名
-      const blessingRanking = [...gifts]
-        .sort((a, b) => b.blessing_votes - a.blessing_votes)
-        .slice(0, 3);
-      setBlessingTop3(blessingRanking);
+      // 排名由伺服器計算（同票時先提交者在前）
+      const rankings = response.data.rankings || {};
+      const giftsById = Object.fromEntries(gifts.map((gift) => [gift.id, gift]));
+      const topThree = (ids = []) =>
+        ids.slice(0, 3).map((id) => giftsById[id]).filter(Boolean);
+
+      // 最佳創意獎前三名
+      setCreativeTop3(topThree(rankings.creative));
+
+      // 最佳祝福獎前三名
+      setBlessingTop3(topThree(rankings.blessing));
     } catch (err) {
       console.error('Failed to load results:', err);
     }